@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 from flask import Flask
 from flask_session import Session
 from flask_cors import CORS
@@ -10,8 +12,53 @@ from datetime import timedelta
 from .routes.web import web_bp
 from .routes.predictions import predictions_bp
 from .routes.workshops import workshops_bp
+from .routes.export import export_bp
+from .routes.reviews import reviews_bp
+from .routes.metrics import metrics_bp
+from .routes.health import health_bp
+from . import metrics
+from . import log
+from . import caching
+from . import readpref
+from .health import health_state
+from .services.workshop_index import workshop_index
+from .services.reference_data import reference_data
+from .services.notifications import notifier
+from .services.search import ensure_search_keys
+from .invalidation import invalidation_bus
+from .commands import import_workshops_command, recompute_ratings_command, flush_digests_command
+
+# Pause between database setup attempts while Mongo is unreachable at boot
+STARTUP_RETRY_SECONDS = 10
+logger = log.get_logger("startup")
+
+def _start_services():
+    """Database setup, then the background workers. Returns False if Mongo was not usable."""
+    if not initialize_database():
+        return False
+    # Admin search keys for documents written before they existed
+    ensure_search_keys()
+    health_state.mark_initialized(True)
+
+    # Cross-worker cache invalidation (change streams), then the caches it feeds
+    invalidation_bus.start()
+    # Per-worker copy of the workshop catalogue for nearby searches
+    workshop_index.start()
+    # Manufacturers / service types / intervals as ready-to-send JSON
+    reference_data.start()
+    # Sends hourly / daily Telegram digests when their window closes
+    notifier.start()
+    return True
+
+def _retry_start_services():
+    while True:
+        time.sleep(STARTUP_RETRY_SECONDS)
+        if _start_services():
+            logger.info("Database setup finished after a late start")
+            return
 
 def create_app():
+    log.configure_logging()
     app = Flask(__name__)
 
     app.config["SECRET_KEY"] = "motarilog-secret-key-2024"
@@ -27,17 +74,36 @@ def create_app():
     
     CORS(app, supports_credentials=True)
 
+    # Request timing + Mongo round trips for every blueprint below
+    metrics.init_app(app)
+    log.init_app(app)
+    # gzip/brotli for larger JSON and text bodies
+    caching.init_app(app)
+    # Keeps a user's reads on the primary right after they write
+    readpref.init_app(app)
+
     # Initialize Session
     Session(app)
 
-    initialize_database()
+    # Failure keeps /readyz at 503 instead of serving on a broken database;
+    # the same sequence is retried in the background until Mongo is usable
+    if not _start_services():
+        threading.Thread(target=_retry_start_services, name="startup-retry", daemon=True).start()
 
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(history_bp, url_prefix='/api')
     app.register_blueprint(vehicles_bp, url_prefix='/api')
     app.register_blueprint(predictions_bp, url_prefix='/api')
     app.register_blueprint(workshops_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+    app.register_blueprint(reviews_bp, url_prefix='/api')
 
 
     app.register_blueprint(web_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(health_bp)
+
+    app.cli.add_command(import_workshops_command)
+    app.cli.add_command(recompute_ratings_command)
+    app.cli.add_command(flush_digests_command)
     return app
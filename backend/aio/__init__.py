@@ -0,0 +1,113 @@
+"""
+backend/aio
+Optional async serving mode.
+
+The vehicles, history, predictions and workshops endpoints are served by
+async (Quart) views on pymongo's AsyncMongoClient, so one process can keep
+many requests in flight while they wait on Mongo. Every other route
+(auth, admin, pages, static files) falls through to the regular Flask app,
+which runs in a thread pool under the same ASGI server.
+
+Run with:  hypercorn --bind 0.0.0.0:5000 asgi:app
+"""
+
+from quart import Quart, g, request
+from quart.wrappers.response import DataBody
+from werkzeug.exceptions import HTTPException
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from backend import create_app, metrics, log, caching
+from backend.readpref import WRITE_METHODS
+from .db import client, mark_write
+from .vehicles import vehicles_bp
+from .history import history_bp
+from .predictions import predictions_bp
+from .workshops import workshops_bp
+
+# Flask config keys the async views need to read the shared session store
+SHARED_CONFIG = (
+    "SECRET_KEY",
+    "SESSION_COOKIE_NAME",
+    "SESSION_MONGODB_DB",
+    "SESSION_MONGODB_COLLECT",
+    "UPLOAD_FOLDER",
+)
+
+# The WSGI bridge buffers request bodies; keep this above the largest upload
+MAX_WSGI_BODY_SIZE = 16 * 1024 * 1024
+
+
+def create_async_app(flask_app):
+    app = Quart(__name__, static_folder=None)
+    app.config.update({key: flask_app.config[key] for key in SHARED_CONFIG})
+
+    app.register_blueprint(vehicles_bp, url_prefix='/api')
+    app.register_blueprint(history_bp, url_prefix='/api')
+    app.register_blueprint(predictions_bp, url_prefix='/api')
+    app.register_blueprint(workshops_bp, url_prefix='/api')
+
+    @app.before_request
+    async def start_timer():
+        g._metrics = metrics.request_started(request.endpoint)
+        g.request_id = log.start_request(request.headers, request.view_args)
+
+    @app.after_request
+    async def record_metrics(response):
+        token = g.pop('_metrics', None)
+        if token is not None:
+            response.headers['Server-Timing'] = metrics.request_finished(
+                token, request.endpoint, request.method, response.status_code
+            )
+        request_id = g.pop('request_id', None)
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        log.end_request()
+        return response
+
+    @app.after_request
+    async def mark_writes(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            await mark_write()
+        return response
+
+    @app.after_request
+    async def compress(response):
+        if isinstance(response.response, DataBody) and caching.should_compress(response):
+            caching.compress_body(request, response, await response.get_data())
+        return response
+
+    @app.after_serving
+    async def close_client():
+        await client.close()
+
+    return app
+
+
+class AsyncDispatcher:
+    """
+    ASGI entry point. Requests matching a route of the async app are served
+    by it; everything else goes to the Flask app via a threaded WSGI bridge.
+    """
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi_app = AsyncioWSGIMiddleware(wsgi_app, max_body_size=MAX_WSGI_BODY_SIZE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not self._is_async_route(scope):
+            await self.wsgi_app(scope, receive, send)
+        else:
+            # lifespan + websocket events always belong to the async app
+            await self.async_app(scope, receive, send)
+
+    def _is_async_route(self, scope):
+        adapter = self.async_app.url_map.bind("localhost")
+        try:
+            adapter.match(scope["path"], method=scope["method"])
+            return True
+        except HTTPException:
+            return False
+
+
+def create_asgi_app():
+    flask_app = create_app()
+    return AsyncDispatcher(create_async_app(flask_app), flask_app)
@@ -0,0 +1,97 @@
+"""
+backend/aio/db.py
+Async Mongo connection and session lookup for the async API mode
+"""
+
+import time
+import msgspec
+from bson.objectid import ObjectId
+from pymongo import AsyncMongoClient
+from quart import g, request, current_app
+from backend.models import MONGO_URI
+from backend.readpref import group_databases, is_recent, SESSION_WRITE_KEY
+from backend.metrics import mongo_listener
+from backend.slowlog import slow_query_listener
+from backend.health import aio_pool_monitor
+
+# --- Database Connection ---
+# The client binds to the event loop on first use, so it is safe to create
+# at import time as long as a single server loop owns it (one per worker).
+
+client = AsyncMongoClient(MONGO_URI, event_listeners=[mongo_listener, slow_query_listener, aio_pool_monitor])
+db = client.get_database()
+aio_pool_monitor.max_pool_size = client.options.pool_options.max_pool_size
+
+# Per-group read handles, same groups and preferences as backend/readpref.py
+_databases = group_databases(db)
+
+# --- Sessions ---
+# Logins still go through the Flask app (Flask-Session, MongoDB backend).
+# The async views read the user id back out of that store and keep the
+# read-your-writes marker up to date in it.
+
+SESSION_KEY_PREFIX = "session:"
+_session_decoder = msgspec.msgpack.Decoder()
+_session_encoder = msgspec.msgpack.Encoder()
+
+
+def _session_store():
+    return client[current_app.config["SESSION_MONGODB_DB"]][current_app.config["SESSION_MONGODB_COLLECT"]]
+
+
+async def _session():
+    """The request's decoded session data ({} without one), loaded once per request."""
+    if "_session" in g:
+        return g._session
+
+    data = {}
+    sid = request.cookies.get(current_app.config["SESSION_COOKIE_NAME"])
+    if sid:
+        document = await _session_store().find_one({"id": SESSION_KEY_PREFIX + sid}, {"val": 1})
+        if document:
+            try:
+                data = _session_decoder.decode(document["val"])
+            except msgspec.DecodeError:
+                data = {}
+    g._session = data
+    return data
+
+
+async def current_user_id():
+    """
+    Returns the logged in user id from the shared Flask-Session store,
+    or None if the request has no valid session.
+    """
+    return (await _session()).get("user_id")
+
+
+async def reader(group):
+    """Database handle for a route group's reads, see backend/readpref.py."""
+    if is_recent((await _session()).get(SESSION_WRITE_KEY)):
+        return db
+    return _databases.get(group, db)
+
+
+async def mark_write():
+    """Remembers the logged in user's write, like readpref.init_app does for Flask."""
+    data = await _session()
+    if not data.get("user_id"):
+        return
+    data[SESSION_WRITE_KEY] = time.time()
+    sid = request.cookies.get(current_app.config["SESSION_COOKIE_NAME"])
+    await _session_store().update_one(
+        {"id": SESSION_KEY_PREFIX + sid},
+        {"$set": {"val": _session_encoder.encode(data)}}
+    )
+
+
+# --- Data versions (see backend/caching.py) ---
+
+async def user_rev(user_id):
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"data_rev": 1})
+    return user.get("data_rev", 0) if user else None
+
+
+async def bump_user_rev(user_id):
+    if user_id:
+        await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"data_rev": 1}})
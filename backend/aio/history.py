@@ -0,0 +1,150 @@
+import asyncio
+from bson.objectid import ObjectId
+from quart import Blueprint, Response, request, jsonify
+from backend.aio.db import db, current_user_id, user_rev
+from backend.models import service_record_schema
+from backend.routes.history import (
+    parse_timeline_args, timeline_etag, timeline_body, service_record_doc,
+    link_workshop, mileage_update, mileage_after_delete
+)
+from backend.services.prediction import prediction_engine
+from backend.services.timeline import timeline_page
+from backend.log import get_logger
+from backend import caching
+from backend.idempotency import idempotent_async
+
+history_bp = Blueprint('history_bp', __name__)
+logger = get_logger("routes.history")
+
+# ---------------------------------------------------------
+# GET HISTORY (For a Vehicle)
+# ---------------------------------------------------------
+@history_bp.route('/vehicles/<string:vehicle_id>/services', methods=['GET'])
+async def get_service_history(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        # Unchanged since the client's copy: skip the ownership check and the history query
+        etag = caching.make_etag('services', vehicle_id, await user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+
+        # Ensure user owns vehicle
+        vehicle = await db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+
+        records = await db.servicerecords.find({"vehicle_id": ObjectId(vehicle_id)}).sort("service_date", -1).to_list()
+        return caching.tagged_json([service_record_schema.dump(r) for r in records], etag, Response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# VEHICLE TIMELINE (Services, odometer, accidents, resolved predictions)
+# ---------------------------------------------------------
+@history_bp.route('/vehicles/<string:vehicle_id>/timeline', methods=['GET'])
+async def get_vehicle_timeline(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        kinds, limit, cursor = parse_timeline_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        etag = timeline_etag(vehicle_id, kinds, limit, request.args, await user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+
+        vehicle = await db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)}, {"_id": 1})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+
+        # Sync query builder (services/timeline.py), kept off the event loop
+        items, next_cursor = await asyncio.to_thread(timeline_page, vehicle['_id'], kinds, limit, cursor)
+        return caching.tagged_json(timeline_body(items, next_cursor), etag, Response)
+    except Exception as e:
+        logger.exception("Error building vehicle timeline")
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# ADD SERVICE RECORD
+# ---------------------------------------------------------
+@history_bp.route('/vehicles/<string:vehicle_id>/services', methods=['POST'])
+@idempotent_async
+async def add_service_record(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    data = await request.get_json()
+    if not data: return jsonify({'error': 'No data'}), 400
+
+    try:
+        # 1. Validate Ownership
+        vehicle = await db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+
+        # 2. Prepare Record
+        record = service_record_doc(vehicle_id, user_id, data)
+
+        if data.get('workshop_id'):
+            workshop = await db.workshops.find_one({"_id": ObjectId(data['workshop_id'])}, {"name": 1})
+            if not workshop: return jsonify({'error': 'Workshop not found'}), 404
+            link_workshop(record, workshop)
+
+        # 3. Insert
+        await db.servicerecords.insert_one(record)
+
+        if record['mileage_at_service'] > vehicle['current_mileage']:
+            await db.vehicles.update_one({"_id": ObjectId(vehicle_id)}, mileage_update(record['mileage_at_service']))
+
+        await asyncio.to_thread(prediction_engine.calculate_predictions, vehicle_id)
+
+        return jsonify({'message': 'Service added successfully'}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# DELETE SERVICE RECORD (WITH MILEAGE ROLLBACK)
+# ---------------------------------------------------------
+@history_bp.route('/services/<string:record_id>', methods=['DELETE'])
+async def delete_service_record(record_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        # 1. Find Record
+        record = await db.servicerecords.find_one({"_id": ObjectId(record_id)})
+        if not record: return jsonify({'error': 'Record not found'}), 404
+
+        vehicle_id = record['vehicle_id']
+
+        # 2. Check Ownership
+        vehicle = await db.vehicles.find_one({"_id": vehicle_id, "user_id": ObjectId(user_id)})
+        if not vehicle: return jsonify({'error': 'Unauthorized'}), 403
+
+        # 3. Delete the Record
+        await db.servicerecords.delete_one({"_id": ObjectId(record_id)})
+
+        latest_record = await db.servicerecords.find_one(
+            {"vehicle_id": vehicle_id},
+            sort=[("mileage_at_service", -1)]
+        )
+
+        new_current_km = mileage_after_delete(vehicle, latest_record)
+
+        # 5. Update Vehicle
+        await db.vehicles.update_one({"_id": vehicle_id}, mileage_update(new_current_km))
+
+        # 6. Recalculate Predictions based on new mileage
+        await asyncio.to_thread(prediction_engine.calculate_predictions, vehicle_id)
+
+        return jsonify({
+            'message': 'Record deleted and mileage updated',
+            'new_mileage': new_current_km
+        }), 200
+
+    except Exception as e:
+        logger.exception("Error deleting service record")
+        return jsonify({'error': str(e)}), 500
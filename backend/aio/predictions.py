@@ -0,0 +1,140 @@
+import asyncio
+from bson.objectid import ObjectId
+from quart import Blueprint, Response, request, jsonify
+from backend.aio.db import db, current_user_id, user_rev, bump_user_rev
+from backend.models import maintenance_prediction_schema, service_record_schema
+from backend.routes.predictions import (
+    parse_active_only, predictions_query, parse_simulation, simulation_body,
+    completion_record, resolve_update
+)
+from backend.services.prediction import prediction_engine
+from backend import caching
+from backend.idempotency import idempotent_async
+
+predictions_bp = Blueprint('predictions_bp', __name__)
+
+# ---------------------------------------------------------
+# Route: Get Predictions for a Vehicle
+# ---------------------------------------------------------
+@predictions_bp.route('/vehicles/<string:vehicle_id>/predictions', methods=['GET'])
+async def get_predictions(vehicle_id):
+    # 1. Authentication Check
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # 2. Filtering Logic (active_only, include_past)
+    active_only = parse_active_only(request.args)
+
+    # 3. Conditional GET: unchanged since the client's copy -> 304
+    etag = caching.make_etag('predictions', vehicle_id, active_only, await user_rev(user_id))
+    held = caching.matching_etag(request, etag)
+    if held:
+        return caching.not_modified(held, Response)
+
+    # 4. Verify Ownership
+    try:
+        vehicle = await db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
+        if not vehicle:
+            return jsonify({"error": "Vehicle not found"}), 404
+    except Exception:
+        return jsonify({"error": "Invalid vehicle ID"}), 400
+
+    query = predictions_query(vehicle_id, active_only)
+
+    # 5. Fetch and Return Predictions
+    try:
+        # Sort by date ascending (soonest first)
+        predictions = await db.maintenancepredictions.find(query).sort("predicted_date", 1).to_list()
+
+        return caching.tagged_json([maintenance_prediction_schema.dump(p) for p in predictions], etag, Response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------------------------------------------------
+# Route: What-if Simulation (read only)
+# ---------------------------------------------------------
+@predictions_bp.route('/vehicles/<string:vehicle_id>/predictions/simulate', methods=['POST'])
+async def simulate_predictions(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        vehicle = await db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
+        if not vehicle:
+            return jsonify({"error": "Vehicle not found"}), 404
+    except Exception:
+        return jsonify({"error": "Invalid vehicle ID"}), 400
+
+    try:
+        km_per_day, scenarios = parse_simulation(await request.get_json(silent=True) or {}, vehicle)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        results = await asyncio.to_thread(prediction_engine.simulate, vehicle, scenarios)
+        return jsonify(simulation_body(vehicle, km_per_day, results)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@predictions_bp.route('/predictions/<string:prediction_id>/complete', methods=['PUT'])
+@idempotent_async
+async def complete_prediction(prediction_id):
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        # 1. Find the prediction
+        prediction = await db.maintenancepredictions.find_one({"_id": ObjectId(prediction_id)})
+        if not prediction:
+            return jsonify({"error": "Prediction not found"}), 404
+
+        # 2. Verify Ownership (via Vehicle)
+        vehicle = await db.vehicles.find_one({"_id": prediction['vehicle_id'], "user_id": ObjectId(user_id)})
+        if not vehicle:
+            return jsonify({"error": "Access denied"}), 403
+
+        # 3. Create a Service Record automatically
+        result = await db.servicerecords.insert_one(completion_record(prediction, vehicle, user_id))
+
+        # 4. Deactivate the Prediction
+        await db.maintenancepredictions.update_one({"_id": ObjectId(prediction_id)}, resolve_update("completed"))
+
+        # 5. Trigger Engine to Calculate NEXT due date
+        await asyncio.to_thread(prediction_engine.calculate_predictions, prediction['vehicle_id'])
+
+        # Return the new service record
+        new_record = await db.servicerecords.find_one({"_id": result.inserted_id})
+        return jsonify(service_record_schema.dump(new_record)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------------------------------------------------
+# Route: Cancel/Ignore Prediction
+# ---------------------------------------------------------
+@predictions_bp.route('/predictions/<string:prediction_id>/cancel', methods=['PUT'])
+async def cancel_prediction(prediction_id):
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        prediction = await db.maintenancepredictions.find_one({"_id": ObjectId(prediction_id)})
+        if not prediction: return jsonify({"error": "Not found"}), 404
+
+        vehicle = await db.vehicles.find_one({"_id": prediction['vehicle_id'], "user_id": ObjectId(user_id)})
+        if not vehicle: return jsonify({"error": "Access denied"}), 403
+
+        await db.maintenancepredictions.update_one({"_id": ObjectId(prediction_id)}, resolve_update("cancelled"))
+        await bump_user_rev(user_id)
+
+        return jsonify({"message": "Prediction cancelled"}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
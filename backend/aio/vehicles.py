@@ -0,0 +1,198 @@
+import asyncio
+from bson.objectid import ObjectId
+from marshmallow import ValidationError
+from quart import Blueprint, Response, request, jsonify, current_app
+from backend.aio.db import db, current_user_id, user_rev, bump_user_rev
+from backend.models import vehicle_schema
+from backend.routes.vehicles import (
+    is_multipart, clean_form, image_paths, new_vehicle_doc, vehicle_changes,
+    changes_search_keys, with_search_keys, mileage_writes
+)
+from backend.services.prediction import prediction_engine
+from backend.services.reference_data import reference_data
+from backend.log import get_logger
+from backend import caching
+from backend.idempotency import idempotent_async
+
+vehicles_bp = Blueprint('vehicles_bp', __name__)
+logger = get_logger("routes.vehicles")
+
+# ---------------------------------------------------------
+# Reference Data (served from memory, see services/reference_data.py)
+# ---------------------------------------------------------
+@vehicles_bp.route('/manufacturers', methods=['GET'])
+async def get_manufacturers():
+    try:
+        if not reference_data.ready:
+            await asyncio.to_thread(reference_data.get, "manufacturers")
+        return reference_data.serve("manufacturers", request, Response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ---------------------------------------------------------
+# Get User's Vehicles
+# ---------------------------------------------------------
+@vehicles_bp.route('/vehicles', methods=['GET'])
+async def get_vehicles():
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        etag = caching.make_etag('vehicles', user_id, await user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+        vehicles = await db.vehicles.find({'user_id': ObjectId(user_id), 'is_active': True}).to_list()
+        return caching.tagged_json([vehicle_schema.dump(v) for v in vehicles], etag, Response)
+    except Exception as e: return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# Add New Vehicle
+# ---------------------------------------------------------
+@vehicles_bp.route('/vehicles', methods=['POST'])
+async def add_vehicle():
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    files = await request.files
+    if is_multipart(request.content_type):
+        json_data = clean_form(await request.form)
+    else:
+        json_data = await request.get_json()
+
+    if not json_data: return jsonify({'error': 'No input data'}), 400
+    json_data['user_id'] = user_id
+
+    try:
+        data = vehicle_schema.load(json_data)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    existing = await db.vehicles.find_one({'license_plate': data['license_plate']})
+    if existing: return jsonify({'error': 'License plate already registered'}), 409
+
+    # Image Upload
+    image_db_path = None
+    file = files.get('image')
+    if file:
+        try:
+            paths = image_paths(user_id, file.filename, current_app.config['UPLOAD_FOLDER'])
+            if paths:
+                await file.save(paths[1])
+                image_db_path = paths[0]
+        except Exception: logger.exception("Vehicle image upload failed")
+
+    vehicle_doc = new_vehicle_doc(user_id, data, image_db_path)
+
+    try:
+        result = await db.vehicles.insert_one(vehicle_doc)
+        new_id = result.inserted_id
+        # Trigger Predictions (sync engine, kept off the event loop)
+        await asyncio.to_thread(prediction_engine.calculate_predictions, new_id)
+        return jsonify({'message': 'Vehicle added', 'vehicle_id': str(new_id)}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# UPDATE VEHICLE
+# ---------------------------------------------------------
+@vehicles_bp.route('/vehicles/<string:vehicle_id>', methods=['PUT'])
+async def update_vehicle(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    files = await request.files
+    # Handle FormData or JSON
+    if is_multipart(request.content_type):
+        data = (await request.form).to_dict()
+    else:
+        data = await request.get_json() or {}
+
+    update_data = vehicle_changes(data)
+
+    # Handle Image Update
+    file = files.get('image')
+    if file:
+        try:
+            paths = image_paths(user_id, file.filename, current_app.config['UPLOAD_FOLDER'])
+            if paths:
+                await file.save(paths[1])
+                update_data['image_filename'] = paths[0]
+        except Exception: logger.exception("Vehicle image update failed")
+
+    if not update_data and 'image' not in files:
+        return jsonify({'error': 'No fields to update'}), 400
+
+    try:
+        if changes_search_keys(update_data):
+            current = await db.vehicles.find_one({'_id': ObjectId(vehicle_id)}, {'license_plate': 1, 'vin': 1}) or {}
+            update_data = with_search_keys(update_data, current)
+
+        await db.vehicles.update_one(
+            {'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)},
+            {'$set': update_data}
+        )
+
+        # Recalculate predictions if mileage changed
+        if 'current_mileage' in update_data:
+            await asyncio.to_thread(prediction_engine.calculate_predictions, ObjectId(vehicle_id))
+        else:
+            await bump_user_rev(user_id)
+
+        return jsonify({'message': 'Vehicle updated successfully'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# UPDATE MILEAGE
+# ---------------------------------------------------------
+@vehicles_bp.route('/vehicles/<string:vehicle_id>/mileage', methods=['PUT'])
+@idempotent_async
+async def update_mileage(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    data = await request.get_json()
+    new_mileage = data.get('current_mileage')
+
+    if new_mileage is None: return jsonify({'error': 'current_mileage required'}), 400
+
+    try:
+        vehicle = await db.vehicles.find_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+
+        vehicle_update, odometer_record = mileage_writes(vehicle_id, user_id, new_mileage)
+
+        # 1. Update Vehicle
+        await db.vehicles.update_one({'_id': ObjectId(vehicle_id)}, vehicle_update)
+
+        # 2. CREATE HISTORY RECORD (So it shows in the list)
+        await db.servicerecords.insert_one(odometer_record)
+
+        # 3. Recalculate Predictions
+        await asyncio.to_thread(prediction_engine.calculate_predictions, ObjectId(vehicle_id))
+
+        return jsonify({'message': 'Mileage updated'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@vehicles_bp.route('/vehicles/<string:vehicle_id>', methods=['GET'])
+async def get_vehicle(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        etag = caching.make_etag('vehicle', vehicle_id, await user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+        vehicle = await db.vehicles.find_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+        return caching.tagged_json(vehicle_schema.dump(vehicle), etag, Response)
+    except Exception: return jsonify({'error': 'Invalid ID'}), 400
+
+@vehicles_bp.route('/vehicles/<string:vehicle_id>', methods=['DELETE'])
+async def delete_vehicle(vehicle_id):
+    user_id = await current_user_id()
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        await db.vehicles.update_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)}, {'$set': {'is_active': False}})
+        await bump_user_rev(user_id)
+        return jsonify({'message': 'Deleted'}), 200
+    except Exception: return jsonify({'error': 'Failed'}), 500
@@ -0,0 +1,112 @@
+import asyncio
+from bson.objectid import ObjectId
+from quart import Blueprint, Response, request, jsonify
+from backend.aio.db import db, current_user_id, reader
+from backend.routes.workshops import (
+    parse_nearby_args, nearby_pipeline, nearby_page, encode_page, tile_response,
+    is_admin, new_workshop_doc, soft_delete
+)
+from backend.services.workshop_index import workshop_index
+from backend.services.tile_cache import tile_cache
+from backend.log import get_logger
+from backend import caching
+
+workshops_bp = Blueprint('workshops_bp', __name__)
+logger = get_logger("routes.workshops")
+
+async def _nearby_docs(params):
+    # Served from the in-process index; Mongo only until it is loaded
+    docs = workshop_index.search(params)
+    if docs is None:
+        cursor = await (await reader("workshops")).workshops.aggregate(nearby_pipeline(params))
+        docs = await cursor.to_list()
+    return docs
+
+# --- Route 1: Find Nearby Workshops (Public) ---
+@workshops_bp.route('/workshops/nearby', methods=['GET'])
+async def find_nearby_workshops():
+    try:
+        params = parse_nearby_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if params['lat'] is None:
+            # No version to compare against: hash the page itself
+            body = encode_page(nearby_page(await _nearby_docs(params), params))
+            etag = caching.content_etag(body)
+            held = caching.matching_etag(request, etag)
+            if held:
+                return caching.not_modified(held, Response)
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            return response
+
+        # Map queries: snap to a geohash tile and share its cached page
+        params = tile_cache.snap(params)
+        cursor_token = request.args.get('cursor')
+        entry = tile_cache.get(params, cursor_token)
+        if entry is None:
+            body = encode_page(nearby_page(await _nearby_docs(params), params))
+            entry = tile_cache.put(params, cursor_token, body)
+        return tile_response(entry, request, Response)
+
+    except Exception as e:
+        logger.exception("Error in nearby workshops")
+        return jsonify({"error": str(e)}), 500
+
+
+# --- Route 2: Add New Workshop (ADMIN ONLY) ---
+@workshops_bp.route('/workshops/add', methods=['POST'])
+async def add_workshop():
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        current_user = await db.users.find_one({"_id": ObjectId(user_id)})
+
+        if not is_admin(current_user):
+            return jsonify({"error": "Forbidden: Admins only"}), 403
+
+        try:
+            new_workshop = new_workshop_doc(await request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        result = await db.workshops.insert_one(new_workshop)
+        await asyncio.to_thread(workshop_index.bump_version, new_workshop['location']['coordinates'])
+
+        return jsonify({
+            "message": "Workshop added successfully",
+            "id": str(result.inserted_id)
+        }), 201
+
+    except Exception as e:
+        logger.exception("Error adding workshop")
+        return jsonify({"error": str(e)}), 500
+
+# --- Route 3: Delete Workshop (ADMIN ONLY) ---
+@workshops_bp.route('/workshops/<string:workshop_id>', methods=['DELETE'])
+async def delete_workshop(workshop_id):
+    user_id = await current_user_id()
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        current_user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if not is_admin(current_user):
+            return jsonify({"error": "Forbidden"}), 403
+
+        # Soft delete (set is_active to False)
+        workshop = await db.workshops.find_one_and_update(*soft_delete(workshop_id), projection={"location": 1})
+
+        if not workshop:
+            return jsonify({"error": "Workshop not found"}), 404
+
+        await asyncio.to_thread(workshop_index.bump_version, workshop.get('location', {}).get('coordinates'))
+
+        return jsonify({"message": "Workshop deleted"}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
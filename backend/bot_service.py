@@ -1,22 +1,34 @@
 import os
-import asyncio
-import logging
-from pymongo import MongoClient
+from datetime import datetime
+from pymongo import AsyncMongoClient
 from telegram import Update
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler
+# Sibling import: the bot runs as a script (python backend/bot_service.py),
+# so it does not import the backend package and with it the whole Flask app
+from log import configure_logging, get_logger
 
 # --- CONFIG ---
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://mongo:27017/motarilog")
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
+# Updates handled in parallel (each /start is a short DB round trip)
+BOT_CONCURRENCY = int(os.environ.get("TELEGRAM_BOT_CONCURRENCY", "64"))
+
+# Webhook mode: set TELEGRAM_WEBHOOK_URL (public https base) to receive updates
+# on a local HTTP listener instead of long polling.
+WEBHOOK_URL = os.environ.get("TELEGRAM_WEBHOOK_URL")
+WEBHOOK_LISTEN = os.environ.get("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("TELEGRAM_WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("TELEGRAM_WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.environ.get("TELEGRAM_WEBHOOK_SECRET")
+
 # --- DB CONNECTION ---
-client = MongoClient(MONGO_URI)
+client = AsyncMongoClient(MONGO_URI)
 db = client.get_database()
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# JSON logs through the same queue pipeline as the web app
+configure_logging()
+logger = get_logger("bot")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
@@ -31,33 +43,57 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     token = args[0]
-    
-    # 2. Find user with this linking token
-    user = db.users.find_one({"telegram_link_token": token})
-    
+
+    # 2. Claim the linking token: lookup, link chat ID and remove the token
+    #    in one atomic (indexed) update, so a token can only be used once.
+    user = await db.users.find_one_and_update(
+        {"telegram_link_token": token, "telegram_link_expires_at": {"$gt": datetime.utcnow()}},
+        {
+            "$set": {"telegram_chat_id": str(chat_id)},
+            "$unset": {"telegram_link_token": "", "telegram_link_expires_at": ""}
+        },
+        projection={"email": 1, "full_name": 1}
+    )
+
     if user:
-        # 3. Link Chat ID & Remove Token
-        db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {"telegram_chat_id": str(chat_id)},
-                "$unset": {"telegram_link_token": ""}
-            }
-        )
         await context.bot.send_message(chat_id=chat_id, text=f"✅ **Connected!**\nHello {user.get('full_name', 'Driver')}.\n\nYou will now receive 2FA codes and alerts here.")
-        print(f"✅ Linked user {user.get('email')} to chat {chat_id}")
+        logger.info("Linked Telegram chat", extra={"user_id": str(user["_id"]), "chat_id": chat_id})
     else:
         await context.bot.send_message(chat_id=chat_id, text="❌ Invalid or expired link. Please go back to the dashboard and try again.")
 
+async def post_init(application):
+    # Same index the web app ensures; the bot may start first
+    await db.users.create_index("telegram_link_token", unique=True, sparse=True)
+
+async def post_shutdown(application):
+    await client.close()
+
 if __name__ == '__main__':
     if not BOT_TOKEN:
-        print("Error: TELEGRAM_BOT_TOKEN is missing.")
+        logger.error("TELEGRAM_BOT_TOKEN is missing")
         exit(1)
-        
-    print("🤖 Telegram Bot Started...")
-    application = ApplicationBuilder().token(BOT_TOKEN).build()
-    
+
+    logger.info("Telegram bot started")
+    application = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(BOT_CONCURRENCY)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
     start_handler = CommandHandler('start', start)
     application.add_handler(start_handler)
-    
-    application.run_polling()
+
+    if WEBHOOK_URL:
+        logger.info("Listening for webhook updates on %s:%s/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET
+        )
+    else:
+        application.run_polling()
@@ -0,0 +1,160 @@
+"""
+backend/caching.py
+Conditional GET and response compression
+
+ETags come from a cheap version instead of the body where possible: every
+user document carries `data_rev`, bumped after any write to that user's
+vehicles, service records or predictions. Checking If-None-Match then costs
+one indexed read of a single field, and an unchanged dashboard is answered
+with an empty 304 without running the real queries.
+
+Bodies above COMPRESS_MIN_BYTES are sent with brotli (when the `brotli`
+package is installed) or gzip, whichever the client prefers. Compressed
+variants get their own strong ETag ("<etag>-br" / "<etag>-gzip").
+"""
+
+import gzip
+import json
+import hashlib
+from bson.objectid import ObjectId
+from backend.models import db
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/x-ndjson", "text/html", "text/css",
+    "text/plain", "text/javascript", "application/javascript", "image/svg+xml"
+}
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+# --- Versions ---
+
+def user_rev(user_id):
+    """Current data version of a user (None if the user does not exist)."""
+    user = db.users.find_one({"_id": ObjectId(user_id)}, {"data_rev": 1})
+    return user.get("data_rev", 0) if user else None
+
+
+def bump_user_rev(user_id):
+    """Call after changing anything the user's dashboard shows."""
+    if user_id:
+        db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"data_rev": 1}})
+
+
+def make_etag(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def content_etag(body):
+    """For responses without a version: hash of the encoded body."""
+    return hashlib.sha1(body).hexdigest()[:32]
+
+
+# --- Conditional requests ---
+
+def matching_etag(req, etag):
+    """The variant of `etag` the client already holds, if any."""
+    if req.if_none_match.star_tag:
+        return etag
+    for candidate in (etag,) + tuple(f"{etag}-{enc}" for enc in ("br", "gzip")):
+        if req.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _revalidate(response):
+    # Per-user data: the client may keep it but must ask before reusing it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    response.vary.add("Cookie")
+    return response
+
+
+def not_modified(etag, response_class):
+    response = response_class(status=304)
+    response.set_etag(etag)
+    return _revalidate(response)
+
+
+def tagged_body(body, etag, response_class):
+    """Already encoded JSON (bytes or str) with its ETag."""
+    response = response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    return _revalidate(response)
+
+
+def tagged_json(payload, etag, response_class):
+    return tagged_body(json.dumps(payload, separators=(",", ":"), default=str), etag, response_class)
+
+
+def conditional_json(req, etag, build, response_class):
+    """304 when the client has `etag`, otherwise build() the payload."""
+    held = matching_etag(req, etag)
+    if held:
+        return not_modified(held, response_class)
+    return tagged_json(build(), etag, response_class)
+
+
+# --- Compression ---
+
+def negotiate_encoding(req):
+    accepted = req.accept_encodings
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accepted[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def should_compress(response):
+    return (
+        response.status_code == 200
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in COMPRESSIBLE_TYPES
+    )
+
+
+def apply_encoding(response, body, encoding):
+    """Swaps in the encoded body and adjusts ETag / headers."""
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def compress_body(req, response, body):
+    """Encodes `body` into the response when it is big enough to be worth it."""
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(req)
+        if encoding:
+            apply_encoding(response, compress(body, encoding), encoding)
+    return response
+
+
+def init_app(app):
+    """Compresses buffered text/JSON responses of the Flask app."""
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        if response.direct_passthrough or response.is_streamed or not should_compress(response):
+            return response
+        return compress_body(request, response, response.get_data())
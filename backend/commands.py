@@ -0,0 +1,43 @@
+"""
+backend/commands.py
+Flask CLI commands (run with: flask --app run <command>)
+"""
+
+import click
+from backend.services.workshop_import import import_workshops, check_dedupe_meters, DEFAULT_DEDUPE_METERS
+from backend.services.ratings import recompute_ratings
+from backend.services.notifications import notifier
+
+@click.command('import-workshops')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dedupe-meters', default=DEFAULT_DEDUPE_METERS, show_default=True,
+              help='Skip points this close to an existing workshop.')
+@click.option('--format', 'file_format', type=click.Choice(['osm', 'geojson']),
+              help='Input format (detected from the file by default).')
+def import_workshops_command(path, dedupe_meters, file_format):
+    """Import shop=car_repair workshops from a local OSM / GeoJSON extract."""
+    try:
+        check_dedupe_meters(dedupe_meters)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--dedupe-meters')
+    stats = import_workshops(path, dedupe_meters, file_format)
+    click.echo(
+        f"Parsed {stats['parsed']}, inserted {stats['inserted']}, "
+        f"duplicates {stats['duplicates']}, skipped {stats['skipped']}, errors {stats['errors']}"
+    )
+
+
+@click.command('recompute-ratings')
+def recompute_ratings_command():
+    """Rebuild workshop rating totals from the stored reviews."""
+    stats = recompute_ratings()
+    click.echo(f"Rated workshops: {stats['rated']}, reset without reviews: {stats['unrated']}")
+
+
+@click.command('flush-digests')
+@click.option('--all', 'everything', is_flag=True,
+              help='Send every pending digest, not only those whose window has closed.')
+def flush_digests_command(everything):
+    """Send pending maintenance alert digests now."""
+    flushed = notifier.flush_due(everything=everything)
+    click.echo(f"Flushed {flushed} digests, {notifier.sent_messages} messages sent")
@@ -0,0 +1,208 @@
+"""
+backend/health.py
+Liveness / readiness checks for orchestration
+
+- Liveness only says the worker process is answering requests; it never
+  touches Mongo, so a database outage does not get healthy workers killed.
+- Readiness pings Mongo (with a short timeout), reports connection pool
+  usage and wait-queue depth (from a pymongo ConnectionPoolListener) and
+  the lag of the background workers, and fails until the startup sequence
+  (database setup, then the workers) has succeeded. A late start is
+  retried in the background by create_app; probes never run it.
+
+Results are cached for HEALTH_CACHE_SECONDS and only one probe at a time
+refreshes them, so frequent probes cost at most one ping per interval.
+"""
+
+import os
+import time
+import threading
+import pymongo
+from pymongo import monitoring
+from backend import log
+from backend.log import get_logger
+
+logger = get_logger("health")
+
+HEALTH_CACHE_SECONDS = float(os.environ.get("HEALTH_CACHE_SECONDS", "2"))
+HEALTH_PING_TIMEOUT = float(os.environ.get("HEALTH_PING_TIMEOUT", "1"))
+# Above this many threads waiting for a connection the worker reports "degraded"
+POOL_WAIT_WARNING = int(os.environ.get("HEALTH_POOL_WAIT_WARNING", "10"))
+# A background worker that has not made progress for this long is "stalled"
+WORKER_STALL_SECONDS = 120
+
+STARTED_AT = time.time()
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Live connection counts per server of one MongoClient."""
+
+    def __init__(self):
+        self.max_pool_size = None
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pools.setdefault(address, {"open": 0, "in_use": 0, "waiting": 0})
+            for key, delta in deltas.items():
+                pool[key] = max(pool[key] + delta, 0)
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+    def snapshot(self):
+        with self._lock:
+            servers = {f"{host}:{port}": dict(pool) for (host, port), pool in self._pools.items()}
+        return {
+            "max_pool_size": self.max_pool_size,
+            "in_use": sum(pool["in_use"] for pool in servers.values()),
+            "waiting": sum(pool["waiting"] for pool in servers.values()),
+            "servers": servers,
+        }
+
+
+pool_monitor = PoolMonitor()
+aio_pool_monitor = PoolMonitor()
+
+
+# --- Background workers ---
+# name -> callable returning {"lag_seconds": ..., ...}; registered by the
+# components that own a queue or a refresh loop.
+
+_workers = {}
+
+
+def register_worker(name, probe):
+    _workers[name] = probe
+
+
+def _log_queue():
+    return {"queued": log.queued_records(), "dropped": log.dropped_records()}
+
+
+def _slow_query_log():
+    from backend.slowlog import slow_query_listener
+    return {"pending": slow_query_listener.pending}
+
+
+register_worker("log_queue", _log_queue)
+register_worker("slow_query_log", _slow_query_log)
+
+
+def _worker_status():
+    workers = {}
+    for name, probe in _workers.items():
+        try:
+            status = dict(probe())
+        except Exception as e:
+            status = {"error": str(e)}
+        lag = status.get("lag_seconds")
+        status["stalled"] = lag is not None and lag > WORKER_STALL_SECONDS
+        workers[name] = status
+    return workers
+
+
+# --- Checks ---
+
+class HealthState:
+    def __init__(self):
+        self.db_initialized = False
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+
+    def mark_initialized(self, ok):
+        self.db_initialized = bool(ok)
+
+    def readiness(self):
+        """Returns (ready, report); at most one fresh check per cache interval."""
+        now = time.monotonic()
+        if self._cached is not None and now - self._cached_at < HEALTH_CACHE_SECONDS:
+            return self._cached
+        if not self._lock.acquire(blocking=False):
+            # Another probe is checking right now; answer with the last result
+            if self._cached is not None:
+                return self._cached
+            self._lock.acquire()
+        try:
+            if self._cached is None or time.monotonic() - self._cached_at >= HEALTH_CACHE_SECONDS:
+                self._cached = self._check()
+                self._cached_at = time.monotonic()
+            return self._cached
+        finally:
+            self._lock.release()
+
+    def _check(self):
+        from backend.models import client
+
+        mongo = {"ok": False, "ping_ms": None}
+        started = time.perf_counter()
+        try:
+            with pymongo.timeout(HEALTH_PING_TIMEOUT):
+                client.admin.command("ping")
+            mongo["ok"] = True
+            mongo["ping_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            mongo["error"] = str(e)
+
+        pool = pool_monitor.snapshot()
+        workers = _worker_status()
+        ready = mongo["ok"] and self.db_initialized
+
+        if not ready:
+            status = "unavailable"
+        elif pool["waiting"] > POOL_WAIT_WARNING or any(w["stalled"] for w in workers.values()):
+            status = "degraded"
+        else:
+            status = "ok"
+
+        report = {
+            "status": status,
+            "mongo": mongo,
+            "db_initialized": self.db_initialized,
+            "pool": pool,
+            "async_pool": aio_pool_monitor.snapshot() if aio_pool_monitor.max_pool_size else None,
+            "workers": workers,
+        }
+        if not ready:
+            logger.warning("Readiness check failed", extra={"mongo_error": mongo.get("error")})
+        return ready, report
+
+
+health_state = HealthState()
+
+
+def liveness():
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - STARTED_AT)}
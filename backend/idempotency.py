@@ -0,0 +1,220 @@
+"""
+backend/idempotency.py
+Idempotency keys for retried writes
+
+Mobile clients retry writes whose response got lost. For endpoints where a
+repeat would insert a duplicate record and rerun the prediction engine
+(and possibly a Telegram alert), the client sends an `Idempotency-Key`
+header, unique per logical operation:
+
+    @history_bp.route(...)
+    @idempotent
+    def add_service_record(vehicle_id): ...
+
+The first request claims `<user id>:<key>` in `idempotencykeys` with a
+unique insert, runs the view and stores its response. A retry is answered
+from the stored response after a single _id lookup, with
+`Idempotent-Replayed: true`; the view does not run again. A duplicate that
+arrives while the first is still running gets 409 (Retry-After: 1).
+Reusing a key for a different request (method, path or body) is a 422.
+
+Responses >= 500 and exceptions release the key, so the retry runs again.
+A claim whose worker died is taken over after IDEMPOTENCY_LOCK_SECONDS.
+Records expire through a TTL index after IDEMPOTENCY_TTL_SECONDS.
+Requests without the header (or without a session) are not affected.
+"""
+
+import os
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, jsonify, make_response, request, session
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from backend.models import db
+from backend.log import get_logger
+
+logger = get_logger("idempotency")
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+PENDING = "pending"
+DONE = "done"
+
+
+# --- Records ---
+
+def fingerprint(method, path, body):
+    digest = hashlib.sha256(f"{method} {path}\n".encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def _claim(record_id, request_hash, now):
+    return {
+        "_id": record_id,
+        "state": PENDING,
+        "fingerprint": request_hash,
+        "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        "created_at": now,
+        "expire_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    }
+
+
+def _takeover(held, request_hash, now):
+    """(filter, update) to take over an abandoned claim of this request, else None."""
+    if held["fingerprint"] != request_hash or held["state"] != PENDING or held["locked_until"] > now:
+        return None
+    return (
+        {"_id": held["_id"], "state": PENDING, "locked_until": held["locked_until"]},
+        {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+    )
+
+
+def _answer(held, request_hash, json_response):
+    """Response for a key that is already claimed by another request."""
+    if held["fingerprint"] != request_hash:
+        return json_response({'error': f'{HEADER} was already used for a different request'}, 422)
+    if held["state"] == DONE:
+        response = json_response(None, held["status"], body=held["body"], mimetype=held.get("mimetype"))
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+    response = json_response({'error': 'A request with this Idempotency-Key is still in progress'}, 409)
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+def _completed(response, body):
+    return {"$set": {
+        "state": DONE,
+        "status": response.status_code,
+        "mimetype": response.mimetype,
+        "body": body,
+        "completed_at": datetime.utcnow(),
+    }}
+
+
+def _parse_key(headers):
+    """The client's key, '' if none, None if malformed."""
+    key = headers.get(HEADER, "").strip()
+    if len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+# --- Flask ---
+
+def _flask_json(payload, status, body=None, mimetype=None):
+    if body is not None:
+        return Response(body, status=status, mimetype=mimetype)
+    response = jsonify(payload)
+    response.status_code = status
+    return response
+
+
+def idempotent(view):
+    """Makes a Flask write view safe to retry with an Idempotency-Key."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = _parse_key(request.headers)
+        if key is None:
+            return _flask_json({'error': f'{HEADER} is too long'}, 400)
+        user_id = session.get('user_id')
+        if not key or not user_id:
+            return view(*args, **kwargs)
+
+        record_id = f"{user_id}:{key}"
+        request_hash = fingerprint(request.method, request.path, request.get_data())
+        store = db.idempotencykeys
+        try:
+            now = datetime.utcnow()
+            held = store.find_one({"_id": record_id})
+            if held is None:
+                try:
+                    store.insert_one(_claim(record_id, request_hash, now))
+                except DuplicateKeyError:
+                    held = store.find_one({"_id": record_id})
+            if held is not None:
+                takeover = _takeover(held, request_hash, now)
+                if takeover is None or store.update_one(*takeover).modified_count != 1:
+                    return _answer(held, request_hash, _flask_json)
+        except PyMongoError as e:
+            logger.warning("Idempotency store unavailable: %s", e)
+            return _flask_json({'error': 'Service temporarily unavailable'}, 503)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            store.delete_one({"_id": record_id, "state": PENDING})
+            raise
+
+        if response.status_code < 500 and not response.is_streamed:
+            store.update_one({"_id": record_id}, _completed(response, response.get_data()))
+        else:
+            store.delete_one({"_id": record_id, "state": PENDING})
+        return response
+
+    return wrapper
+
+
+# --- Quart (async API mode; imported lazily, quart is optional) ---
+
+def _quart_json(payload, status, body=None, mimetype=None):
+    from quart import Response, jsonify
+    if body is not None:
+        return Response(body, status=status, mimetype=mimetype)
+    response = jsonify(payload)
+    response.status_code = status
+    return response
+
+
+def idempotent_async(view):
+    """Async counterpart of idempotent() for the Quart views."""
+    from quart import request, make_response
+    from quart.wrappers.response import DataBody
+    from backend.aio.db import db as aio_db, current_user_id
+
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        key = _parse_key(request.headers)
+        if key is None:
+            return _quart_json({'error': f'{HEADER} is too long'}, 400)
+        user_id = await current_user_id() if key else None
+        if not key or not user_id:
+            return await view(*args, **kwargs)
+
+        record_id = f"{user_id}:{key}"
+        request_hash = fingerprint(request.method, request.path, await request.get_data())
+        store = aio_db.idempotencykeys
+        try:
+            now = datetime.utcnow()
+            held = await store.find_one({"_id": record_id})
+            if held is None:
+                try:
+                    await store.insert_one(_claim(record_id, request_hash, now))
+                except DuplicateKeyError:
+                    held = await store.find_one({"_id": record_id})
+            if held is not None:
+                takeover = _takeover(held, request_hash, now)
+                if takeover is None or (await store.update_one(*takeover)).modified_count != 1:
+                    return _answer(held, request_hash, _quart_json)
+        except PyMongoError as e:
+            logger.warning("Idempotency store unavailable: %s", e)
+            return _quart_json({'error': 'Service temporarily unavailable'}, 503)
+
+        try:
+            response = await make_response(await view(*args, **kwargs))
+        except Exception:
+            await store.delete_one({"_id": record_id, "state": PENDING})
+            raise
+
+        if response.status_code < 500 and isinstance(response.response, DataBody):
+            await store.update_one({"_id": record_id}, _completed(response, await response.get_data()))
+        else:
+            await store.delete_one({"_id": record_id, "state": PENDING})
+        return response
+
+    return wrapper
@@ -0,0 +1,206 @@
+"""
+backend/invalidation.py
+Change-stream driven cache invalidation
+
+Every worker process runs one watcher thread that tails a MongoDB change
+stream and hands the ids of changed documents to the in-process caches
+that subscribed to that collection (before start(); collections of
+WATCHED_COLLECTIONS nobody subscribed to are filtered out server-side):
+
+    invalidation_bus.subscribe("workshops", callback)   # callback(ids)
+
+`ids` is a list of `_id`s, or None when the changed keys are unknown
+(collection dropped/renamed, events lost) and the cache should drop
+everything. A subscriber can pass `ignore_fields` to skip updates that
+touch nothing else (e.g. rating counters the cache does not hold), or
+`only_fields` to hear only about updates touching one of them (inserts,
+deletes and replacements are then skipped too; None is still passed on).
+
+Writes made by any worker (or by a shell / import job) reach all caches
+within about a second, so caches do not need short TTLs.
+
+A watcher that reconnects resumes from the last token it saw. The token
+is not persisted: a restarted process starts with empty caches anyway.
+Whenever the stream has to start from scratch (new process, token rolled
+out of the oplog, stream invalidated), subscribers are flushed once it
+is open, so no change can slip between what a cache loaded and what it
+is told.
+
+Change streams need a replica set. Against a standalone server the bus
+reports itself unavailable and caches keep their own fallback (e.g. the
+workshop index still polls its version counter).
+"""
+
+import time
+import threading
+from pymongo.errors import PyMongoError, OperationFailure
+from backend.models import db
+from backend.health import register_worker
+from backend.log import get_logger
+
+logger = get_logger("invalidation")
+
+WATCHED_COLLECTIONS = ["users", "vehicles", "workshops", "manufacturers", "maintenancepredictions"]
+MAX_AWAIT_MS = 1000
+MAX_BATCH = 500
+RETRY_SECONDS = 5
+
+# Server error codes
+_NOT_REPLICA_SET = {40573}
+_HISTORY_LOST = {286, 280}
+_FLUSH_EVENTS = {"drop", "rename", "dropDatabase", "invalidate"}
+
+
+def _updated_fields(event):
+    """Top-level fields an update event touched; None for other operations."""
+    if event.get("operationType") != "update":
+        return None
+    description = event.get("updateDescription") or {}
+    paths = [*description.get("updatedFields", {}), *description.get("removedFields", [])]
+    return frozenset(path.split(".", 1)[0] for path in paths)
+
+
+class InvalidationBus:
+    def __init__(self, collections=WATCHED_COLLECTIONS):
+        self.collections = list(collections)
+        self._subscribers = {name: [] for name in self.collections}
+        self._thread = None
+        self._stop = threading.Event()
+        self.available = None  # unknown until the first watch attempt
+        self.live = False
+        self._token = None
+        self._failing_since = None
+
+    # --- Subscriptions ---
+
+    def subscribe(self, collection, callback, ignore_fields=(), only_fields=()):
+        if collection not in self._subscribers:
+            raise ValueError(f"{collection} is not watched")
+        self._subscribers[collection].append((callback, frozenset(ignore_fields), frozenset(only_fields)))
+
+    def watched(self):
+        """Collections with at least one subscriber; only their events are streamed."""
+        return [name for name in self.collections if self._subscribers[name]]
+
+    def dispatch(self, collection, changes):
+        """
+        changes: [(_id, top-level fields an update touched, None for other
+        operations)], or None when everything must be dropped.
+        """
+        for callback, ignored, only in self._subscribers.get(collection, ()):
+            ids = None
+            if changes is not None:
+                ids = [doc_id for doc_id, fields in changes
+                       if not (ignored and fields and fields <= ignored)
+                       and not (only and not (fields and fields & only))]
+                if not ids:
+                    continue
+            try:
+                callback(ids)
+            except Exception:
+                logger.exception("Invalidation callback failed for %s", collection)
+
+    def flush_all(self):
+        for collection in self.collections:
+            self.dispatch(collection, None)
+
+    # --- Watcher ---
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _pipeline(self):
+        return [{"$match": {
+            "$or": [
+                {"ns.coll": {"$in": self.watched()}},
+                {"operationType": {"$in": ["dropDatabase", "invalidate"]}}
+            ]
+        }}]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                resuming = self._token is not None
+                with db.watch(self._pipeline(), resume_after=self._token,
+                              max_await_time_ms=MAX_AWAIT_MS) as stream:
+                    self.available = self.live = True
+                    self._failing_since = None
+                    logger.info("Invalidation bus watching %s", ", ".join(self.watched()))
+                    if not resuming:
+                        # Anything cached before the stream opened may have missed a change
+                        self.flush_all()
+                    while not self._stop.is_set() and stream.alive:
+                        if self._drain(stream):
+                            self._token = None  # cannot resume after an invalidate
+                            break
+                        self._token = stream.resume_token
+            except OperationFailure as e:
+                self.live = False
+                if e.code in _NOT_REPLICA_SET:
+                    self.available = False
+                    logger.warning("Change streams unavailable (not a replica set); "
+                                   "caches fall back to polling")
+                    return
+                if e.code in _HISTORY_LOST:
+                    logger.warning("Resume token expired; starting over")
+                    self._token = None
+                    continue
+                self._failed(e)
+            except PyMongoError as e:
+                self.live = False
+                self._failed(e)
+            except Exception as e:
+                self.live = False
+                logger.exception("Invalidation bus crashed")
+                self._failed(e)
+
+    def _drain(self, stream):
+        """
+        Reads what is ready (up to MAX_BATCH events) and dispatches it per
+        collection. Returns True when the stream was invalidated.
+        """
+        changed = {}
+        invalidated = False
+        for _ in range(MAX_BATCH):
+            event = stream.try_next()
+            if event is None:
+                break
+            operation = event.get("operationType")
+            collection = event.get("ns", {}).get("coll")
+            if operation in _FLUSH_EVENTS:
+                for name in ([collection] if collection in self._subscribers else self.collections):
+                    changed[name] = None
+                if operation == "invalidate":
+                    invalidated = True
+                    break
+            elif collection in self._subscribers:
+                changes = changed.setdefault(collection, [])
+                if changes is not None:
+                    changes.append((event["documentKey"]["_id"], _updated_fields(event)))
+
+        for collection, changes in changed.items():
+            self.dispatch(collection, changes)
+        return invalidated
+
+    def _failed(self, error):
+        if self._failing_since is None:
+            self._failing_since = time.monotonic()
+        logger.warning("Invalidation bus disconnected: %s (retrying)", error)
+        self._stop.wait(RETRY_SECONDS)
+
+    def status(self):
+        return {
+            "available": self.available,
+            "live": self.live,
+            "lag_seconds": round(time.monotonic() - self._failing_since, 1) if self._failing_since else 0,
+        }
+
+
+invalidation_bus = InvalidationBus()
+register_worker("invalidation_bus", invalidation_bus.status)
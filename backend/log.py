@@ -0,0 +1,194 @@
+"""
+backend/log.py
+Structured, non-blocking logging
+
+Log calls only put a record on an in-memory queue (QueueHandler); a
+QueueListener thread formats each one as a JSON line and writes it to
+stdout. When the queue is full, records are dropped and counted instead
+of blocking the caller.
+
+Every record carries the request id (X-Request-ID, or a generated one)
+and the vehicle id of the request / prediction run it belongs to.
+
+Volume is controlled by environment variables:
+  LOG_LEVEL          root level (default INFO)
+  LOG_LEVELS         per logger, e.g. "motarilog.prediction=WARNING"
+  LOG_SAMPLE_RATES   keep this fraction of DEBUG/INFO records per logger,
+                     e.g. "motarilog.prediction=0.1,werkzeug=0.05"
+                     (warnings and errors are never sampled out)
+"""
+
+import os
+import sys
+import copy
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request
+
+QUEUE_SIZE = 10000
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+vehicle_id_var = contextvars.ContextVar("vehicle_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(name):
+    return logging.getLogger(f"motarilog.{name}")
+
+
+def _parse_pairs(value):
+    pairs = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, _, val = item.partition("=")
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the correlation ids on the record (runs in the calling thread)."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        if not hasattr(record, "vehicle_id"):
+            record.vehicle_id = vehicle_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of sub-WARNING records for the configured loggers."""
+
+    def __init__(self, rates):
+        super().__init__()
+        # Longest prefix wins
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge args and render the traceback here, but leave the JSON
+        # formatting (and the write) to the listener thread
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+_listener = None
+_handler = None
+
+
+def configure_logging(stream=None):
+    """Installs the queue pipeline on the root logger (once per process)."""
+    global _listener, _handler
+    if _listener is not None:
+        return _handler
+
+    log_queue = queue.Queue(QUEUE_SIZE)
+    _handler = DroppingQueueHandler(log_queue)
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(SamplingFilter(
+        {name: float(rate) for name, rate in _parse_pairs(os.environ.get("LOG_SAMPLE_RATES")).items()}
+    ))
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what is queued on shutdown
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_pairs(os.environ.get("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    return _handler
+
+
+def dropped_records():
+    return _handler.dropped if _handler else 0
+
+
+def queued_records():
+    return _handler.queue.qsize() if _handler else 0
+
+
+# --- Request correlation ---
+
+def start_request(headers, view_args):
+    """Sets the correlation ids for a request; returns the request id."""
+    request_id = headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id_var.set(request_id[:64])
+    vehicle_id_var.set((view_args or {}).get("vehicle_id"))
+    return request_id_var.get()
+
+
+def end_request():
+    request_id_var.set(None)
+    vehicle_id_var.set(None)
+
+
+def init_app(app):
+    """Request ids for every Flask request (echoed as X-Request-ID)."""
+    @app.before_request
+    def _bind_request_id():
+        g.request_id = start_request(request.headers, request.view_args)
+
+    @app.after_request
+    def _echo_request_id(response):
+        request_id = g.pop('request_id', None)
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        end_request()
+        return response
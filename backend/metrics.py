@@ -0,0 +1,180 @@
+"""
+backend/metrics.py
+Request and MongoDB instrumentation (Prometheus)
+
+- Every request is timed and labelled with its endpoint, method and status.
+- A pymongo CommandListener counts commands, latency and documents per
+  collection. Commands issued while a request is running are also added
+  to that request's totals (via a context variable), so we can see how
+  many round trips each endpoint makes.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does this)
+so every worker writes its samples to a shared directory and /metrics
+reports the sum over all workers.
+"""
+
+import os
+import time
+import contextvars
+from flask import g, request
+from pymongo import monitoring
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, multiprocess, CONTENT_TYPE_LATEST
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent producing a response (until headers for streamed bodies)",
+    ["endpoint", "method", "status"]
+)
+REQUEST_DB_COMMANDS = Histogram(
+    "http_request_mongo_commands",
+    "MongoDB commands issued per request",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, float("inf"))
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_mongo_seconds",
+    "Time spent waiting on MongoDB per request",
+    ["endpoint"]
+)
+
+MONGO_COMMANDS = Counter(
+    "mongo_commands_total",
+    "MongoDB commands by collection, command and outcome",
+    ["collection", "command", "outcome"]
+)
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round-trip time",
+    ["collection", "command"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, float("inf"))
+)
+MONGO_DOCUMENTS = Counter(
+    "mongo_documents_total",
+    "Documents returned (reads) or affected (writes) by collection",
+    ["collection", "command"]
+)
+
+# Commands whose first field is not a collection name
+_ADMIN_COMMANDS = {"endSessions", "ping", "hello", "isMaster", "buildInfo",
+                   "listCollections", "listDatabases", "saslStart", "saslContinue",
+                   "abortTransaction", "commitTransaction", "killCursors"}
+
+
+class _RequestStats:
+    __slots__ = ("endpoint", "commands", "seconds")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.commands = 0
+        self.seconds = 0.0
+
+
+_current_request = contextvars.ContextVar("metrics_request", default=None)
+
+
+def current_endpoint():
+    """Endpoint of the request running in this context (None outside requests)."""
+    stats = _current_request.get()
+    return stats.endpoint if stats else None
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        # (connection, request_id) -> (collection, stats of the issuing request)
+        self._inflight = {}
+
+    def started(self, event):
+        name = event.command_name
+        if name in _ADMIN_COMMANDS:
+            collection = "admin"
+        elif name == "getMore":
+            collection = event.command.get("collection", "unknown")
+        else:
+            collection = event.command.get(name)
+            if not isinstance(collection, str):
+                collection = "unknown"
+        self._inflight[(event.connection_id, event.request_id)] = (collection, _current_request.get())
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+    def _finish(self, event, outcome):
+        collection, stats = self._inflight.pop((event.connection_id, event.request_id), ("unknown", None))
+        command = event.command_name
+        seconds = event.duration_micros / 1e6
+
+        MONGO_COMMANDS.labels(collection, command, outcome).inc()
+        MONGO_LATENCY.labels(collection, command).observe(seconds)
+        if outcome == "ok":
+            documents = _document_count(event.reply)
+            if documents:
+                MONGO_DOCUMENTS.labels(collection, command).inc(documents)
+
+        if stats is not None:
+            stats.commands += 1
+            stats.seconds += seconds
+
+
+def _document_count(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+mongo_listener = MongoCommandMetrics()
+
+
+# --- Request hooks (shared by the Flask and the async app) ---
+
+def request_started(endpoint):
+    stats = _RequestStats(endpoint or "unmatched")
+    _current_request.set(stats)
+    return time.perf_counter(), stats
+
+
+def request_finished(token, endpoint, method, status):
+    """Records the request and returns a Server-Timing header value."""
+    started, stats = token
+    _current_request.set(None)
+
+    endpoint = endpoint or stats.endpoint
+    REQUEST_LATENCY.labels(endpoint, method, str(status)).observe(time.perf_counter() - started)
+    REQUEST_DB_COMMANDS.labels(endpoint).observe(stats.commands)
+    REQUEST_DB_SECONDS.labels(endpoint).observe(stats.seconds)
+    return f'db;dur={stats.seconds * 1000:.1f};desc="{stats.commands} queries"'
+
+
+def init_app(app):
+    """Times every request of every blueprint registered on the Flask app."""
+    @app.before_request
+    def _start_timer():
+        g._metrics = request_started(request.endpoint)
+
+    @app.after_request
+    def _record(response):
+        token = g.pop('_metrics', None)
+        if token is not None:
+            response.headers['Server-Timing'] = request_finished(
+                token, request.endpoint, request.method, response.status_code
+            )
+        return response
+
+
+# --- Exposition ---
+
+def render():
+    """Returns (body, content_type) in the Prometheus text format."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
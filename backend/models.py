@@ -1,15 +1,23 @@
 import os
 import bcrypt
 from pymongo import MongoClient
+from pymongo.errors import CollectionInvalid
 from bson.objectid import ObjectId
 from marshmallow import Schema, fields, validate, ValidationError
 from datetime import datetime
+from backend.metrics import mongo_listener
+from backend.slowlog import slow_query_listener, COLLECTION as SLOW_QUERY_COLLECTION
+from backend.health import pool_monitor
+from backend.log import get_logger
+
+logger = get_logger("db")
 
 # --- Database Connection ---
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/motarilog")
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, event_listeners=[mongo_listener, slow_query_listener, pool_monitor])
 db = client.get_database()
+pool_monitor.max_pool_size = client.options.pool_options.max_pool_size
 
 # --- Custom Fields ---
 
@@ -47,6 +55,10 @@ class UserSchema(Schema):
     created_at = fields.DateTime(dump_only=True, dump_default=datetime.utcnow)
     last_login = fields.DateTime(load_default=None)
     is_active = fields.Boolean(load_default=True)
+    digest_window = fields.String(
+        validate=validate.OneOf(["immediate", "hourly", "daily"]),
+        load_default="immediate"
+    )
 
 class VehicleSchema(Schema):
     _id = ObjectIdField(dump_only=True)
@@ -80,6 +92,7 @@ class ServiceRecordSchema(Schema):
     cost = fields.Float(required=False, allow_none=True, validate=validate.Range(min=0))
     service_provider = fields.String(required=False, allow_none=True)
     service_location = fields.String(required=False, allow_none=True)
+    workshop_id = ObjectIdField(required=False, allow_none=True)
     notes = fields.String(required=False, allow_none=True, validate=validate.Length(max=1000)) 
     created_at = fields.DateTime(dump_only=True, dump_default=datetime.utcnow)
     created_by = ObjectIdField(dump_only=True)
@@ -92,6 +105,7 @@ class MaintenancePredictionSchema(Schema):
     predicted_mileage = fields.Integer(required=True)
     calculated_at = fields.DateTime(dump_only=True, dump_default=datetime.utcnow)
     last_notification_sent = fields.DateTime(required=False, allow_none=True)
+    resolved_at = fields.DateTime(dump_only=True)  # set when completed / cancelled
     notification_status = fields.String(
         validate=validate.OneOf(["pending", "sent", "completed", "cancelled"]),
         load_default="pending"
@@ -149,10 +163,21 @@ class WorkshopSchema(Schema):
         allow_none=True, 
         validate=validate.Range(min=0, max=5)
     )
+    rating_count = fields.Integer(dump_only=True)
     created_at = fields.DateTime(dump_only=True, dump_default=datetime.utcnow)
     updated_at = fields.DateTime(required=False, allow_none=True)
     is_active = fields.Boolean(load_default=True)
 
+class WorkshopReviewSchema(Schema):
+    _id = ObjectIdField(dump_only=True)
+    workshop_id = ObjectIdField(dump_only=True)
+    user_id = ObjectIdField(dump_only=True)
+    user_name = fields.String(dump_only=True)
+    rating = fields.Integer(required=True, validate=validate.Range(min=1, max=5))
+    comment = fields.String(required=False, allow_none=True, validate=validate.Length(max=1000))
+    created_at = fields.DateTime(dump_only=True)
+    updated_at = fields.DateTime(dump_only=True)
+
 class SessionSchema(Schema):
     _id = fields.String(required=True)
     val = fields.Raw(required=True)
@@ -166,37 +191,83 @@ service_record_schema = ServiceRecordSchema()
 maintenance_prediction_schema = MaintenancePredictionSchema()
 accident_history_schema = AccidentHistorySchema()
 workshop_schema = WorkshopSchema()
+workshop_review_schema = WorkshopReviewSchema()
 session_schema = SessionSchema()
 manufacturer_schema = ManufacturerSchema() # NEW
 
 # --- Database Initialization ---
 
 
+def _create_capped_collection(name, size, max_documents):
+    """Creates a capped collection unless it exists (another worker may create it concurrently)."""
+    if name in db.list_collection_names():
+        return
+    try:
+        db.create_collection(name, capped=True, size=size, max=max_documents)
+    except CollectionInvalid:
+        pass  # created by another worker since the check
+
+
 def initialize_database():
+    """Creates indexes and seed data. Returns False if Mongo was not usable."""
     try:
         # User Indexes
         db.users.create_index("email", unique=True)
         db.users.create_index("role")
+        db.users.create_index([("created_at", -1), ("_id", -1)])
+        db.users.create_index([("email", 1), ("_id", 1)])  # admin list sorted by email
+        db.users.create_index("telegram_link_token", unique=True, sparse=True)
+        db.users.create_index("search_keys")  # admin typeahead (services/search.py)
         
         # Vehicle Indexes
         db.vehicles.create_index("user_id")
         db.vehicles.create_index("license_plate", unique=True)
+        db.vehicles.create_index("search_keys")
         
         # ServiceRecord Indexes
         db.servicerecords.create_index("vehicle_id")
-        db.servicerecords.create_index([("vehicle_id", 1), ("service_date", -1)])
+        db.servicerecords.create_index([("vehicle_id", 1), ("service_date", -1), ("_id", -1)])
+        db.servicerecords.create_index([("created_by", 1), ("workshop_id", 1)])
         
         # MaintenancePrediction Indexes
         db.maintenancepredictions.create_index("vehicle_id")
         db.maintenancepredictions.create_index("predicted_date")
         db.maintenancepredictions.create_index("notification_status")
+        db.maintenancepredictions.create_index([("vehicle_id", 1), ("is_active", 1), ("predicted_date", 1)])
+        # Timeline: resolved predictions only
+        db.maintenancepredictions.create_index(
+            [("vehicle_id", 1), ("resolved_at", -1), ("_id", -1)],
+            partialFilterExpression={"resolved_at": {"$type": "date"}}
+        )
+        # Predictions resolved before resolved_at existed: best known date
+        db.maintenancepredictions.update_many(
+            {"notification_status": {"$in": ["completed", "cancelled"]}, "resolved_at": {"$exists": False}},
+            [{"$set": {"resolved_at": {"$ifNull": ["$last_notification_sent", "$calculated_at"]}}}]
+        )
         
         # AccidentHistory Indexes
         db.accidenthistory.create_index("vehicle_id")
+        db.accidenthistory.create_index([("vehicle_id", 1), ("accident_date", -1), ("_id", -1)])
         
         # Workshop Indexes
         db.workshops.create_index([("location", "2dsphere")]) 
         db.workshops.create_index("services_offered")
+        db.workshops.create_index("rating_updated_at", sparse=True)  # rating sync without change streams
+        db.workshops.create_index(
+            "osm_id", unique=True,
+            partialFilterExpression={"osm_id": {"$type": "string"}}
+        )
+
+        # Workshop Review Indexes (one review per user and workshop)
+        db.workshopreviews.create_index([("workshop_id", 1), ("user_id", 1)], unique=True)
+        db.workshopreviews.create_index([("workshop_id", 1), ("created_at", -1), ("_id", -1)])
+
+        # Workshop change log (read by workers to invalidate cached map tiles)
+        _create_capped_collection("workshopchanges", 1024 * 1024, 10000)
+        db.workshopchanges.create_index("version")
+
+        # Slow operation log (newest first via $natural, bounded size)
+        _create_capped_collection(SLOW_QUERY_COLLECTION, 8 * 1024 * 1024, 20000)
         
         # Manufacturer Index
         db.manufacturers.create_index("name", unique=True)
@@ -204,9 +275,18 @@ def initialize_database():
         # Session Index
         db.sessions.create_index("expireAt", expireAfterSeconds=0)
 
-        print("Database initialized and indexes ensured.")
+        # Rate Limiter Index (buckets expire once fully refilled)
+        db.ratelimits.create_index("expire_at", expireAfterSeconds=0)
+
+        # Idempotency Key Index (stored responses of retried writes)
+        db.idempotencykeys.create_index("expire_at", expireAfterSeconds=0)
+
+        # Notification digests waiting for their window to close
+        db.notificationdigests.create_index("due_at")
+
+        logger.info("Database initialized and indexes ensured")
 
-        print("Updating manufacturer logos to SimpleIcons...")
+        logger.info("Updating manufacturer logos to SimpleIcons")
         defaults = [
             {"name": "Toyota", "logo_url": "https://cdn.simpleicons.org/toyota"},
             {"name": "Honda", "logo_url": "https://cdn.simpleicons.org/honda"},
@@ -234,7 +314,7 @@ def initialize_database():
                     upsert=True
                 )
             except Exception as e:
-                print(f"Error seeding {maker['name']}: {e}")
+                logger.warning("Error seeding manufacturer %s: %s", maker['name'], e)
 
         # --- Create/Update Default Admin Account ---
         admin_email = "admin@motarilog.com"
@@ -245,7 +325,7 @@ def initialize_database():
         admin_user = db.users.find_one({"email": admin_email})
         
         if not admin_user:
-            print("Creating default Admin account...")
+            logger.info("Creating default admin account")
             db.users.insert_one({
                 "name": "System Admin",
                 "email": admin_email,
@@ -261,4 +341,6 @@ def initialize_database():
             )
 
     except Exception as e:
-        print(f"Error initializing database: {e}")
+        logger.exception("Error initializing database")
+        return False
+    return True
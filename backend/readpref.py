@@ -0,0 +1,114 @@
+"""
+backend/readpref.py
+Per-route read preferences (replica set deployments)
+
+Heavy, staleness-tolerant reads (admin listings, analytics, exports,
+workshop searches) can go to secondaries; everything else keeps using
+`db` from models.py, i.e. the primary. Route code asks for the database
+of its group:
+
+    reader("admin").users.aggregate(...)
+
+Groups default to secondaryPreferred with maxStalenessSeconds =
+READ_MAX_STALENESS_SECONDS; override per group with e.g.
+READ_PREFERENCES="export=secondary,workshops=primary".
+
+Read-your-writes: after a user's successful write request, their reads
+stay on the primary for READ_MAX_STALENESS_SECONDS, so a secondary
+lagging behind can never hide what they just changed. Auth and ownership
+checks always use the primary. The async views (backend/aio/db.py) build
+the same handles on their own client and keep the same session marker.
+
+Against a standalone server (the default setup) every preference reads
+from that server, so nothing changes there.
+"""
+
+import os
+import time
+from flask import has_request_context, request, session
+from pymongo.read_preferences import (
+    Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest
+)
+from backend.models import db
+from backend.log import get_logger
+
+logger = get_logger("readpref")
+
+# The server rejects anything below 90 s
+READ_MAX_STALENESS_SECONDS = max(int(os.environ.get("READ_MAX_STALENESS_SECONDS", "90")), 90)
+
+DEFAULT_READ_PREFERENCES = {
+    "admin": "secondaryPreferred",
+    "analytics": "secondaryPreferred",
+    "export": "secondaryPreferred",
+    "workshops": "secondaryPreferred",
+}
+
+_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+SESSION_WRITE_KEY = "_last_write_at"
+
+
+def _parse_config(value):
+    config = dict(DEFAULT_READ_PREFERENCES)
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        group, _, mode = (part.strip() for part in item.partition("="))
+        if mode not in _MODES:
+            logger.warning("Unknown read preference %r for %s, keeping %s", mode, group, config.get(group, "primary"))
+            continue
+        config[group] = mode
+    return config
+
+
+def _preference(mode):
+    if mode == "primary":
+        return Primary()
+    return _MODES[mode](max_staleness=READ_MAX_STALENESS_SECONDS)
+
+
+def group_databases(database):
+    """One handle of `database` (sync or async) per configured route group."""
+    return {group: database.with_options(read_preference=_preference(mode))
+            for group, mode in READ_PREFERENCES.items()}
+
+
+def is_recent(last_write):
+    """True while a write made at `last_write` may not have reached the secondaries."""
+    return last_write is not None and time.time() - last_write < READ_MAX_STALENESS_SECONDS
+
+
+READ_PREFERENCES = _parse_config(os.environ.get("READ_PREFERENCES"))
+_databases = group_databases(db)
+
+
+def wrote_recently():
+    """True while the current user's last write may not have reached the secondaries."""
+    if not has_request_context():
+        return False
+    return is_recent(session.get(SESSION_WRITE_KEY))
+
+
+def reader(group):
+    """Database handle for a route group's reads (primary when unknown)."""
+    if wrote_recently():
+        return db
+    return _databases.get(group, db)
+
+
+def init_app(app):
+    """Remembers when each logged in user last changed something."""
+    @app.after_request
+    def _mark_write(response):
+        if (request.method in WRITE_METHODS and response.status_code < 400
+                and session.get('user_id')):
+            session[SESSION_WRITE_KEY] = time.time()
+        return response
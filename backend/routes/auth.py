@@ -1,16 +1,56 @@
 import os
+import hmac
+import json
 import random
 import uuid
 import requests
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, session
-from backend.models import db, user_schema, vehicle_schema
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+from backend.models import db, user_schema, vehicle_schema, SLOW_QUERY_COLLECTION
+from backend.slowlog import slow_query_listener
+from backend.readpref import reader
+from backend.log import get_logger
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 import bcrypt
 
-from backend.utils import send_telegram_message
+from backend.utils import send_telegram_message, encode_cursor, decode_cursor
+from backend.services.notifications import DIGEST_WINDOWS
+from backend.services.search import user_search_keys, search as search_accounts, MIN_QUERY_LENGTH
+from backend.services.ratelimit import (
+    login_ip_limiter, login_account_limiter, otp_ip_limiter, MAX_OTP_ATTEMPTS
+)
 
 auth_bp = Blueprint('auth_bp', __name__)
+logger = get_logger("routes.auth")
+
+# Admin user listing: sortable fields (always present, indexed) and page sizes
+ADMIN_USER_SORTS = {"created_at": "created_at", "email": "email"}
+ADMIN_USERS_PAGE_SIZE = 50
+ADMIN_USERS_MAX_PAGE_SIZE = 200
+ADMIN_VEHICLE_SUMMARY = {"manufacturer": 1, "model": 1, "year": 1, "license_plate": 1, "is_active": 1}
+
+# Admin typeahead
+ADMIN_SEARCH_LIMIT = 10
+ADMIN_SEARCH_MAX_LIMIT = 50
+
+# Slow query log listing
+SLOW_QUERIES_PAGE_SIZE = 100
+SLOW_QUERIES_MAX_PAGE_SIZE = 500
+
+# Telegram deep-link tokens stop working after this long
+TELEGRAM_LINK_TTL_MINUTES = 15
+
+def credentials(data):
+    """(normalised email, password) of a JSON body; None for anything missing or not a string."""
+    if not isinstance(data, dict):
+        return None, None
+    email, password = data.get('email'), data.get('password')
+    email = email.strip().lower() if isinstance(email, str) else None
+    return email or None, password if isinstance(password, str) and password else None
+
+def too_many_attempts(retry_after):
+    return jsonify({"error": "Too many attempts. Please try again later."}), 429, {"Retry-After": str(retry_after)}
 
 # ---------------------------------------------------------
 # 1. REGISTER
@@ -20,17 +60,16 @@ def register():
     data = request.get_json()
     
     # Validation
-    if not data or not data.get('email') or not data.get('password'):
+    email, password = credentials(data)
+    if not email or not password:
         return jsonify({'error': 'Email and password are required'}), 400
     
-    email = data['email'].strip().lower()
-    
     # Check if user exists
     if db.users.find_one({'email': email}):
         return jsonify({'error': 'Email already registered'}), 409
 
     # Hash Password
-    hashed_pw = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+    hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
     
     # Create User Object
     new_user = {
@@ -43,6 +82,7 @@ def register():
         "telegram_chat_id": None,
         "is_active": True
     }
+    new_user["search_keys"] = user_search_keys(new_user)
     
     try:
         db.users.insert_one(new_user)
@@ -55,9 +95,16 @@ def register():
 # ---------------------------------------------------------
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
+    email, password = credentials(request.get_json(silent=True))
+    if not email or not password:
+        return jsonify({'error': 'Email and password are required'}), 400
+
+    # Throttle before any DB lookup or bcrypt work
+    allowed, retry_after = login_ip_limiter.consume(request.remote_addr)
+    if allowed:
+        allowed, retry_after = login_account_limiter.consume(email)
+    if not allowed:
+        return too_many_attempts(retry_after)
 
     user = db.users.find_one({"email": email})
 
@@ -79,7 +126,8 @@ def login():
                 {"_id": user["_id"]},
                 {"$set": {
                     "otp_code": otp,
-                    "otp_expiry": datetime.utcnow() + timedelta(minutes=5)
+                    "otp_expiry": datetime.utcnow() + timedelta(minutes=5),
+                    "otp_attempts": 0
                 }}
             )
             
@@ -98,7 +146,7 @@ def login():
                 }), 202
             
             # If sending failed, just log it and allow normal login
-            print(" Failed to send Telegram 2FA. Logging in normally.")
+            logger.warning("Failed to send Telegram 2FA code, logging in without it", extra={"user_id": str(user["_id"])})
 
         # --- NORMAL LOGIN ---
         session['user_id'] = str(user['_id'])
@@ -119,6 +167,10 @@ def verify_2fa():
     
     if not pending_user_id:
         return jsonify({"error": "Session expired. Please login again."}), 401
+
+    allowed, retry_after = otp_ip_limiter.consume(request.remote_addr)
+    if not allowed:
+        return too_many_attempts(retry_after)
         
     data = request.get_json()
     user_code = data.get('code')
@@ -137,9 +189,25 @@ def verify_2fa():
         
     if datetime.utcnow() > expiry:
         return jsonify({"error": "Code expired. Please login again."}), 400
+
+    # Count this guess against the issued code (atomic across workers)
+    attempt = db.users.find_one_and_update(
+        {"_id": user["_id"], "otp_code": saved_code},
+        {"$inc": {"otp_attempts": 1}},
+        projection={"otp_attempts": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not attempt:
+        return jsonify({"error": "No active code found."}), 400
+
+    if attempt["otp_attempts"] > MAX_OTP_ATTEMPTS:
+        # Burn the code; the user has to login again for a new one
+        db.users.update_one({"_id": user["_id"]}, {"$unset": {"otp_code": "", "otp_expiry": "", "otp_attempts": ""}})
+        session.pop('pending_2fa_user_id', None)
+        return jsonify({"error": "Too many invalid codes. Please login again."}), 429
         
-    if user_code == saved_code:
-        db.users.update_one({"_id": user["_id"]}, {"$unset": {"otp_code": "", "otp_expiry": ""}})
+    if hmac.compare_digest(str(user_code).encode(), saved_code.encode()):
+        db.users.update_one({"_id": user["_id"]}, {"$unset": {"otp_code": "", "otp_expiry": "", "otp_attempts": ""}})
         
         # 2. Promote session to fully logged in
         session.pop('pending_2fa_user_id', None)
@@ -157,7 +225,7 @@ def verify_2fa():
                 )
                 send_telegram_message(chat_id, msg)
         except Exception as e:
-            print(f"Failed to send login notification: {e}")
+            logger.warning("Failed to send login notification: %s", e)
         
         return jsonify({
             "message": "Login verified",
@@ -187,6 +255,7 @@ def profile():
     
     user_data = user_schema.dump(user)
     user_data['is_telegram_linked'] = bool(user.get('telegram_chat_id'))
+    user_data['digest_window'] = user.get('digest_window', 'immediate')
     
     return jsonify(user_data), 200
 
@@ -203,7 +272,10 @@ def get_telegram_link():
     try:
         db.users.update_one(
             {"_id": ObjectId(user_id)},
-            {"$set": {"telegram_link_token": token}}
+            {"$set": {
+                "telegram_link_token": token,
+                "telegram_link_expires_at": datetime.utcnow() + timedelta(minutes=TELEGRAM_LINK_TTL_MINUTES)
+            }}
         )
         bot_username = "motrilog_bot"
         
@@ -232,6 +304,25 @@ def unlink_telegram():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ---------------------------------------------------------
+# 8. NOTIFICATION SETTINGS (digest window)
+# ---------------------------------------------------------
+@auth_bp.route('/profile/notifications', methods=['PUT'])
+def update_notification_settings():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    window = data.get('digest_window')
+    if window not in DIGEST_WINDOWS:
+        return jsonify({'error': f"digest_window must be one of: {', '.join(DIGEST_WINDOWS)}"}), 400
+
+    try:
+        db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"digest_window": window}})
+        return jsonify({'digest_window': window}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ---------------------------------------------------------
 # 9. ADMIN: GET ALL USERS
 # ---------------------------------------------------------
@@ -245,18 +336,61 @@ def get_all_users():
     if not curr_user or curr_user.get('role') != 'admin':
         return jsonify({'error': 'Forbidden'}), 403
 
-    # Fetch Users
-    users_cursor = db.users.find()
-    users_data = []
-    
-    for u in users_cursor:
-        u_data = user_schema.dump(u)
-        # Get vehicles
-        vehicles = list(db.vehicles.find({"user_id": u["_id"]}))
-        u_data['vehicles'] = [vehicle_schema.dump(v) for v in vehicles]
-        users_data.append(u_data)
+    # Paging / Sorting
+    sort_field = ADMIN_USER_SORTS.get(request.args.get('sort', 'created_at'))
+    if not sort_field:
+        return jsonify({'error': f"sort must be one of: {', '.join(ADMIN_USER_SORTS)}"}), 400
+
+    order = 1 if request.args.get('order', 'desc') == 'asc' else -1
+    limit = max(1, min(request.args.get('limit', default=ADMIN_USERS_PAGE_SIZE, type=int), ADMIN_USERS_MAX_PAGE_SIZE))
+
+    match = {}
+    if request.args.get('cursor'):
+        try:
+            last_value, last_id = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        op = "$gt" if order == 1 else "$lt"
+        match = {"$or": [
+            {sort_field: {op: last_value}},
+            {sort_field: last_value, "_id": {op: last_id}}
+        ]}
+
+    # One round trip: page of users with their vehicles joined in (secondary is fine)
+    pipeline = [
+        {"$match": match},
+        {"$sort": {sort_field: order, "_id": order}},
+        {"$limit": limit + 1},
+        {"$lookup": {
+            "from": "vehicles",
+            "localField": "_id",
+            "foreignField": "user_id",
+            "pipeline": [{"$project": ADMIN_VEHICLE_SUMMARY}],
+            "as": "vehicles"
+        }}
+    ]
+    users_cursor = reader("admin").users.aggregate(pipeline, batchSize=limit + 1)
 
-    return jsonify(users_data), 200
+    def generate():
+        yield '{"users": ['
+        last = None
+        has_more = False
+        for count, u in enumerate(users_cursor):
+            if count == limit:
+                has_more = True
+                break
+            u_data = user_schema.dump(u)
+            u_data['vehicles'] = [
+                {**v, '_id': str(v['_id'])} for v in u.get('vehicles', [])
+            ]
+            yield (',' if last else '') + json.dumps(u_data)
+            last = u
+        users_cursor.close()
+
+        next_cursor = encode_cursor([last.get(sort_field), last['_id']]) if has_more else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 # ---------------------------------------------------------
 # 10. ADMIN: BAN/UNBAN USER
@@ -300,3 +434,81 @@ def ban_user(target_id):
         'message': 'User status updated', 
         'is_active': new_status
     }), 200
+
+# ---------------------------------------------------------
+# 11. ADMIN: SLOW QUERY LOG
+# ---------------------------------------------------------
+@auth_bp.route('/admin/slow-queries', methods=['GET'])
+def get_slow_queries():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    curr_user = db.users.find_one({"_id": ObjectId(user_id)})
+    if not curr_user or curr_user.get('role') != 'admin':
+        return jsonify({'error': 'Forbidden'}), 403
+
+    limit = min(max(request.args.get('limit', default=SLOW_QUERIES_PAGE_SIZE, type=int), 1), SLOW_QUERIES_MAX_PAGE_SIZE)
+    query = {}
+    for field in ('collection', 'route', 'shape_key'):
+        if request.args.get(field):
+            query[field] = request.args[field]
+
+    # Newest first, straight from the capped collection's insertion order
+    slow_log = reader("analytics")[SLOW_QUERY_COLLECTION]
+    records = list(slow_log.find(query, {"_id": 0}).sort("$natural", -1).limit(limit))
+
+    # Worst offenders across the whole log, grouped by query shape
+    summary = list(slow_log.aggregate([
+        {"$match": query},
+        {"$group": {
+            "_id": "$shape_key",
+            "collection": {"$first": "$collection"},
+            "command": {"$first": "$command"},
+            "route": {"$first": "$route"},
+            "shape": {"$first": "$shape"},
+            "count": {"$sum": 1},
+            "max_ms": {"$max": "$duration_ms"},
+            "total_ms": {"$sum": "$duration_ms"},
+            "last_seen": {"$max": "$ts"}
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": 50}
+    ]))
+    for group in summary:
+        group['shape_key'] = group.pop('_id')
+
+    return jsonify({
+        "threshold_ms": slow_query_listener.threshold_ms,
+        "summary": summary,
+        "records": records
+    }), 200
+
+# ---------------------------------------------------------
+# 12. ADMIN: SEARCH USERS / PLATES / VINS (typeahead)
+# ---------------------------------------------------------
+@auth_bp.route('/admin/search', methods=['GET'])
+def admin_search():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    curr_user = db.users.find_one({"_id": ObjectId(user_id)}, {"role": 1})
+    if not curr_user or curr_user.get('role') != 'admin':
+        return jsonify({'error': 'Forbidden'}), 403
+
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', default=ADMIN_SEARCH_LIMIT, type=int), 1), ADMIN_SEARCH_MAX_LIMIT)
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify({'users': []}), 200
+
+    try:
+        results = search_accounts(reader("admin"), query, limit)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    users = []
+    for user, vehicles, matches in results:
+        u_data = user_schema.dump(user)
+        u_data['vehicles'] = [{**v, '_id': str(v['_id']), 'user_id': str(v['user_id'])} for v in vehicles]
+        u_data['matches'] = matches
+        users.append(u_data)
+    return jsonify({'users': users}), 200
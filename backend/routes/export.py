@@ -0,0 +1,146 @@
+import zlib
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+from bson import json_util
+from bson.objectid import ObjectId
+from backend.models import db
+from backend.readpref import reader
+
+export_bp = Blueprint('export_bp', __name__)
+
+# Never leave the server, not even in admin backups
+SECRET_FIELDS = {"otp_code": 0, "otp_expiry": 0, "otp_attempts": 0, "telegram_link_token": 0}
+
+# Lines are grouped into chunks of roughly this size before being sent
+CHUNK_SIZE = 64 * 1024
+CURSOR_BATCH_SIZE = 500
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+def _line(record_type, doc):
+    # Extended JSON keeps ObjectIds and dates restorable with json_util.loads
+    return json_util.dumps(
+        {"type": record_type, "data": doc},
+        json_options=json_util.RELAXED_JSON_OPTIONS
+    ) + "\n"
+
+def _account_lines(user, source):
+    """One account: profile, vehicles, then everything hanging off them."""
+    yield _line("user", user)
+
+    vehicle_ids = []
+    for vehicle in source.vehicles.find({"user_id": user["_id"]}).sort("_id", 1):
+        vehicle_ids.append(vehicle["_id"])
+        yield _line("vehicle", vehicle)
+
+    # Unsorted: the vehicle_id indexes serve the $in but not an _id order, and
+    # sorting would buffer the whole history on the server. NDJSON needs no order.
+    by_vehicle = {"vehicle_id": {"$in": vehicle_ids}}
+    for record in source.servicerecords.find(by_vehicle, batch_size=CURSOR_BATCH_SIZE):
+        yield _line("service_record", record)
+    for prediction in source.maintenancepredictions.find(by_vehicle, batch_size=CURSOR_BATCH_SIZE):
+        yield _line("maintenance_prediction", prediction)
+    for accident in source.accidenthistory.find(by_vehicle, batch_size=CURSOR_BATCH_SIZE):
+        yield _line("accident", accident)
+
+def _backup_lines(source):
+    """All accounts, one collection cursor at a time (no per-user queries)."""
+    collections = [
+        ("user", source.users, SECRET_FIELDS),
+        ("vehicle", source.vehicles, None),
+        ("service_record", source.servicerecords, None),
+        ("maintenance_prediction", source.maintenancepredictions, None),
+        ("accident", source.accidenthistory, None),
+    ]
+    for record_type, collection, projection in collections:
+        for doc in collection.find({}, projection, batch_size=CURSOR_BATCH_SIZE).sort("_id", 1):
+            yield _line(record_type, doc)
+
+def _chunked(lines):
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _ndjson_response(lines, filename):
+    """
+    Streams NDJSON straight from the cursors. Gzip is applied on the fly
+    when the client accepts it (disable with ?gzip=0).
+    """
+    body = _chunked(lines)
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Vary": "Accept-Encoding"
+    }
+
+    if request.args.get('gzip', '1') != '0' and request.accept_encodings['gzip']:
+        body = _gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(stream_with_context(body), mimetype='application/x-ndjson', headers=headers)
+
+def _current_admin():
+    user_id = session.get('user_id')
+    if not user_id:
+        return None, (jsonify({'error': 'Unauthorized'}), 401)
+    curr_user = db.users.find_one({"_id": ObjectId(user_id)})
+    if not curr_user or curr_user.get('role') != 'admin':
+        return None, (jsonify({'error': 'Forbidden'}), 403)
+    return curr_user, None
+
+# ---------------------------------------------------------
+# 1. EXPORT MY ACCOUNT
+# ---------------------------------------------------------
+@export_bp.route('/export', methods=['GET'])
+def export_my_account():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    user = db.users.find_one({"_id": ObjectId(user_id)}, {"password_hash": 0, **SECRET_FIELDS})
+    if not user: return jsonify({'error': 'User not found'}), 404
+
+    return _ndjson_response(_account_lines(user, reader("export")), f"motarilog-{user_id}.ndjson")
+
+# ---------------------------------------------------------
+# 2. ADMIN: EXPORT ONE ACCOUNT (Support)
+# ---------------------------------------------------------
+@export_bp.route('/admin/users/<string:target_id>/export', methods=['GET'])
+def export_user_account(target_id):
+    _, error = _current_admin()
+    if error: return error
+
+    try:
+        user = db.users.find_one({"_id": ObjectId(target_id)}, {"password_hash": 0, **SECRET_FIELDS})
+    except Exception:
+        return jsonify({'error': 'Invalid ID'}), 400
+    if not user: return jsonify({'error': 'User not found'}), 404
+
+    return _ndjson_response(_account_lines(user, reader("export")), f"motarilog-{target_id}.ndjson")
+
+# ---------------------------------------------------------
+# 3. ADMIN: EXPORT ALL ACCOUNTS (Backup)
+# ---------------------------------------------------------
+@export_bp.route('/admin/export', methods=['GET'])
+def export_all_accounts():
+    _, error = _current_admin()
+    if error: return error
+
+    # Backups keep password hashes so accounts can be restored as-is
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    # Bulk reads: a secondary can take them (see backend/readpref.py)
+    return _ndjson_response(_backup_lines(reader("export")), f"motarilog-backup-{stamp}.ndjson")
@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+from backend.health import health_state, liveness
+
+health_bp = Blueprint('health_bp', __name__)
+
+# Liveness: the worker answers (no database access)
+@health_bp.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify(liveness()), 200
+
+# Readiness: Mongo reachable, database initialized; pool / worker details
+@health_bp.route('/readyz', methods=['GET'])
+def readyz():
+    ready, report = health_state.readiness()
+    response = jsonify(report)
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
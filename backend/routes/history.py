@@ -1,10 +1,76 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session
 from bson.objectid import ObjectId
 from datetime import datetime
 from backend.models import db, service_record_schema
 from backend.services.prediction import prediction_engine
+from backend.services.timeline import timeline_page, TIMELINE_KINDS
+from backend.utils import encode_cursor, decode_cursor
+from backend.log import get_logger
+from backend import caching
+from backend.idempotency import idempotent
 
 history_bp = Blueprint('history_bp', __name__)
+logger = get_logger("routes.history")
+
+TIMELINE_PAGE_SIZE = 20
+TIMELINE_MAX_PAGE_SIZE = 100
+
+# ---------------------------------------------------------
+# Helpers (shared with the async views, backend/aio/history.py)
+# ---------------------------------------------------------
+def parse_timeline_args(args):
+    """(kinds, limit, cursor) of a timeline request; ValueError with the message on bad input."""
+    limit = min(max(args.get('limit', default=TIMELINE_PAGE_SIZE, type=int), 1), TIMELINE_MAX_PAGE_SIZE)
+    kinds = [k for k in args.get('kinds', ','.join(TIMELINE_KINDS)).split(',') if k]
+    if not kinds or any(k not in TIMELINE_KINDS for k in kinds):
+        raise ValueError(f"kinds must be a subset of {', '.join(TIMELINE_KINDS)}")
+
+    cursor = None
+    if args.get('cursor'):
+        try:
+            last_date, last_rank, last_id = decode_cursor(args['cursor'])
+            cursor = [last_date, int(last_rank), last_id]
+        except (ValueError, TypeError):
+            raise ValueError('Invalid cursor')
+    return kinds, limit, cursor
+
+def timeline_etag(vehicle_id, kinds, limit, args, rev):
+    return caching.make_etag('timeline', vehicle_id, sorted(kinds), limit, args.get('cursor', ''), rev)
+
+def timeline_body(items, next_cursor):
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(next_cursor) if next_cursor else None
+    }
+
+def service_record_doc(vehicle_id, user_id, data):
+    """Service record for an add-service body (KeyError / ValueError on bad input)."""
+    return {
+        "vehicle_id": ObjectId(vehicle_id),
+        "service_type": data['service_type'],
+        "service_date": datetime.strptime(data['service_date'], '%Y-%m-%d'),
+        "mileage_at_service": int(data['mileage_at_service']),
+        "cost": float(data.get('cost', 0)),
+        "notes": data.get('notes', ''),
+        "created_at": datetime.utcnow(),
+        "created_by": ObjectId(user_id)
+    }
+
+def link_workshop(record, workshop):
+    """Links the workshop that did the job (lets the user review it)."""
+    record['workshop_id'] = workshop['_id']
+    record['service_provider'] = workshop.get('name')
+
+def mileage_update(mileage):
+    return {"$set": {"current_mileage": mileage, "last_mileage_update": datetime.utcnow()}}
+
+def mileage_after_delete(vehicle, latest_record):
+    """
+    Current mileage once a record is gone: the MAX of (Initial, Highest History).
+    This ensures we don't drop below the start mileage.
+    """
+    highest_history_km = latest_record['mileage_at_service'] if latest_record else 0
+    return max(vehicle.get('initial_mileage', 0), highest_history_km)
 
 # ---------------------------------------------------------
 # GET HISTORY (For a Vehicle)
@@ -15,19 +81,52 @@ def get_service_history(vehicle_id):
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
 
     try:
+        # Unchanged since the client's copy: skip the ownership check and the history query
+        etag = caching.make_etag('services', vehicle_id, caching.user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+
         # Ensure user owns vehicle
         vehicle = db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
         if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
 
         records = list(db.servicerecords.find({"vehicle_id": ObjectId(vehicle_id)}).sort("service_date", -1))
-        return jsonify([service_record_schema.dump(r) for r in records]), 200
+        return caching.tagged_json([service_record_schema.dump(r) for r in records], etag, Response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# VEHICLE TIMELINE (Services, odometer, accidents, resolved predictions)
+# ---------------------------------------------------------
+@history_bp.route('/vehicles/<string:vehicle_id>/timeline', methods=['GET'])
+def get_vehicle_timeline(vehicle_id):
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        kinds, limit, cursor = parse_timeline_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        etag = timeline_etag(vehicle_id, kinds, limit, request.args, caching.user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
+
+        vehicle = db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)}, {"_id": 1})
+        if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
+
+        items, next_cursor = timeline_page(vehicle['_id'], kinds, limit, cursor)
+        return caching.tagged_json(timeline_body(items, next_cursor), etag, Response)
     except Exception as e:
+        logger.exception("Error building vehicle timeline")
         return jsonify({'error': str(e)}), 500
 
 # ---------------------------------------------------------
 # ADD SERVICE RECORD
 # ---------------------------------------------------------
 @history_bp.route('/vehicles/<string:vehicle_id>/services', methods=['POST'])
+@idempotent
 def add_service_record(vehicle_id):
     user_id = session.get('user_id')
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
@@ -41,28 +140,18 @@ def add_service_record(vehicle_id):
         if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
 
         # 2. Prepare Record
-        record = {
-            "vehicle_id": ObjectId(vehicle_id),
-            "service_type": data['service_type'],
-            "service_date": datetime.strptime(data['service_date'], '%Y-%m-%d'),
-            "mileage_at_service": int(data['mileage_at_service']),
-            "cost": float(data.get('cost', 0)),
-            "notes": data.get('notes', ''),
-            "created_at": datetime.utcnow(),
-            "created_by": ObjectId(user_id)
-        }
+        record = service_record_doc(vehicle_id, user_id, data)
+
+        if data.get('workshop_id'):
+            workshop = db.workshops.find_one({"_id": ObjectId(data['workshop_id'])}, {"name": 1})
+            if not workshop: return jsonify({'error': 'Workshop not found'}), 404
+            link_workshop(record, workshop)
 
         # 3. Insert
         db.servicerecords.insert_one(record)
 
         if record['mileage_at_service'] > vehicle['current_mileage']:
-            db.vehicles.update_one(
-                {"_id": ObjectId(vehicle_id)},
-                {"$set": {
-                    "current_mileage": record['mileage_at_service'],
-                    "last_mileage_update": datetime.utcnow()
-                }}
-            )
+            db.vehicles.update_one({"_id": ObjectId(vehicle_id)}, mileage_update(record['mileage_at_service']))
 
         prediction_engine.calculate_predictions(vehicle_id)
 
@@ -98,21 +187,10 @@ def delete_service_record(record_id):
             sort=[("mileage_at_service", -1)] # Sort Descending (Highest first)
         )
 
-        highest_history_km = latest_record['mileage_at_service'] if latest_record else 0
-        initial_km = vehicle.get('initial_mileage', 0)
-
-        # The new current mileage is the MAX of (Initial, Highest History)
-        # This ensures we don't drop below the start mileage
-        new_current_km = max(initial_km, highest_history_km)
+        new_current_km = mileage_after_delete(vehicle, latest_record)
 
         # 5. Update Vehicle
-        db.vehicles.update_one(
-            {"_id": vehicle_id},
-            {"$set": {
-                "current_mileage": new_current_km,
-                "last_mileage_update": datetime.utcnow()
-            }}
-        )
+        db.vehicles.update_one({"_id": vehicle_id}, mileage_update(new_current_km))
 
         # 6. Recalculate Predictions based on new mileage
         prediction_engine.calculate_predictions(vehicle_id)
@@ -123,5 +201,5 @@ def delete_service_record(record_id):
         }), 200
 
     except Exception as e:
-        print(f"Error deleting record: {e}")
+        logger.exception("Error deleting service record")
         return jsonify({'error': str(e)}), 500
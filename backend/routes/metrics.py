@@ -0,0 +1,18 @@
+import os
+from flask import Blueprint, Response, request, jsonify
+from backend import metrics
+
+metrics_bp = Blueprint('metrics_bp', __name__)
+
+# Scrapers allowed to read /metrics (comma separated client addresses)
+METRICS_ALLOWED_IPS = set(
+    ip.strip() for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()
+)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if request.remote_addr not in METRICS_ALLOWED_IPS:
+        return jsonify({"error": "Forbidden"}), 403
+
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
@@ -1,11 +1,53 @@
-from flask import Blueprint, request, jsonify, session
+import math
+from flask import Blueprint, Response, request, jsonify, session
 from bson.objectid import ObjectId
 from datetime import datetime
 from backend.models import db, maintenance_prediction_schema, service_record_schema
 from backend.services.prediction import prediction_engine
+from backend.services import prediction_core
+from backend import caching
+from backend.idempotency import idempotent
 
 predictions_bp = Blueprint('predictions_bp', __name__)
 
+MAX_SCENARIOS = 100
+MAX_HORIZON_DAYS = 3650
+MAX_KM_PER_DAY = 2000
+
+# ---------------------------------------------------------
+# Helpers (shared with the async views, backend/aio/predictions.py)
+# ---------------------------------------------------------
+def parse_active_only(args):
+    return args.get('active_only', 'true').lower() == 'true'
+
+def predictions_query(vehicle_id, active_only):
+    query = {"vehicle_id": ObjectId(vehicle_id)}
+    if active_only:
+        query["is_active"] = True
+    return query
+
+def completion_record(prediction, vehicle, user_id):
+    """
+    Service record for a completed reminder.
+    We assume the service was done TODAY at the CURRENT mileage
+    """
+    now = datetime.utcnow()
+    return {
+        "vehicle_id": prediction['vehicle_id'],
+        "service_type": prediction['maintenance_type'],
+        "service_date": now,
+        "mileage_at_service": vehicle['current_mileage'], # Or ask user for input in a real UI
+        "cost": 0, # Placeholder
+        "service_provider": "Self/Unknown",
+        "notes": "Completed from maintenance reminder",
+        "created_at": now,
+        "created_by": ObjectId(user_id)
+    }
+
+def resolve_update(status):
+    """Deactivates a prediction as "completed" / "cancelled"."""
+    return {"$set": {"is_active": False, "notification_status": status, "resolved_at": datetime.utcnow()}}
+
 # ---------------------------------------------------------
 # Route: Get Predictions for a Vehicle
 # ---------------------------------------------------------
@@ -16,7 +58,16 @@ def get_predictions(vehicle_id):
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    # 2. Verify Ownership
+    # 2. Filtering Logic (active_only, include_past)
+    active_only = parse_active_only(request.args)
+
+    # 3. Conditional GET: unchanged since the client's copy -> 304
+    etag = caching.make_etag('predictions', vehicle_id, active_only, caching.user_rev(user_id))
+    held = caching.matching_etag(request, etag)
+    if held:
+        return caching.not_modified(held, Response)
+
+    # 4. Verify Ownership
     try:
         vehicle = db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
         if not vehicle:
@@ -24,25 +75,93 @@ def get_predictions(vehicle_id):
     except:
         return jsonify({"error": "Invalid vehicle ID"}), 400
 
-    # 3. Filtering Logic (active_only, include_past)
-    active_only = request.args.get('active_only', 'true').lower() == 'true'
-    
-    query = {"vehicle_id": ObjectId(vehicle_id)}
-    
-    if active_only:
-        query["is_active"] = True
+    query = predictions_query(vehicle_id, active_only)
 
-    # 4. Fetch and Return Predictions
+    # 5. Fetch and Return Predictions
     try:
         # Sort by date ascending (soonest first)
         predictions = list(db.maintenancepredictions.find(query).sort("predicted_date", 1))
         
-        return jsonify([maintenance_prediction_schema.dump(p) for p in predictions]), 200
+        return caching.tagged_json([maintenance_prediction_schema.dump(p) for p in predictions], etag, Response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------------------------------------------------
+# Route: What-if Simulation (read only)
+# ---------------------------------------------------------
+def _parse_scenario(raw, vehicle, default_km_per_day):
+    """Fills in defaults from the vehicle; raises ValueError on bad input."""
+    if not isinstance(raw, dict):
+        raise ValueError("Each scenario must be an object")
+    scenario = {
+        "current_mileage": float(raw.get('current_mileage', vehicle.get('current_mileage', 0))),
+        "km_per_day": float(raw.get('km_per_day', default_km_per_day)),
+        "horizon_days": float(raw.get('horizon_days', 365)),
+    }
+    # NaN / inf (JSON NaN, 1e999) pass every comparison below
+    for name, value in scenario.items():
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number")
+    if scenario['current_mileage'] < 0:
+        raise ValueError("current_mileage must be >= 0")
+    if not 0 <= scenario['km_per_day'] <= MAX_KM_PER_DAY:
+        raise ValueError(f"km_per_day must be between 0 and {MAX_KM_PER_DAY}")
+    if not 0 < scenario['horizon_days'] <= MAX_HORIZON_DAYS:
+        raise ValueError(f"horizon_days must be between 1 and {MAX_HORIZON_DAYS}")
+    return scenario
+
+
+def parse_simulation(data, vehicle):
+    """(baseline km_per_day, scenarios) of a simulate body; raises ValueError on bad input."""
+    # Baseline usage: what the engine itself would assume
+    days_owned = (datetime.utcnow() - vehicle['created_at']).days
+    km_per_day = prediction_core.average_km_per_day(
+        vehicle.get('current_mileage', 0), vehicle.get('initial_mileage', 0), days_owned
+    )
+
+    raw_scenarios = data.get('scenarios') or [{}]
+    if not isinstance(raw_scenarios, list) or len(raw_scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"scenarios must be a list of at most {MAX_SCENARIOS}")
+    try:
+        return km_per_day, [_parse_scenario(raw, vehicle, km_per_day) for raw in raw_scenarios]
+    except TypeError as e:
+        raise ValueError(str(e))
+
+
+def simulation_body(vehicle, km_per_day, results):
+    return {
+        "baseline": {"current_mileage": vehicle.get('current_mileage', 0), "km_per_day": round(km_per_day, 1)},
+        "scenarios": results
+    }
+
+
+@predictions_bp.route('/vehicles/<string:vehicle_id>/predictions/simulate', methods=['POST'])
+def simulate_predictions(vehicle_id):
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        vehicle = db.vehicles.find_one({"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)})
+        if not vehicle:
+            return jsonify({"error": "Vehicle not found"}), 404
+    except:
+        return jsonify({"error": "Invalid vehicle ID"}), 400
+
+    try:
+        km_per_day, scenarios = parse_simulation(request.get_json(silent=True) or {}, vehicle)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(simulation_body(vehicle, km_per_day, prediction_engine.simulate(vehicle, scenarios))), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @predictions_bp.route('/predictions/<string:prediction_id>/complete', methods=['PUT'])
+@idempotent
 def complete_prediction(prediction_id):
     user_id = session.get("user_id")
     if not user_id:
@@ -60,26 +179,10 @@ def complete_prediction(prediction_id):
             return jsonify({"error": "Access denied"}), 403
 
         # 3. Create a Service Record automatically
-        # We assume the service was done TODAY at the CURRENT mileage
-        service_doc = {
-            "vehicle_id": prediction['vehicle_id'],
-            "service_type": prediction['maintenance_type'],
-            "service_date": datetime.utcnow(),
-            "mileage_at_service": vehicle['current_mileage'], # Or ask user for input in a real UI
-            "cost": 0, # Placeholder
-            "service_provider": "Self/Unknown",
-            "notes": "Completed from maintenance reminder",
-            "created_at": datetime.utcnow(),
-            "created_by": ObjectId(user_id)
-        }
-        
-        result = db.servicerecords.insert_one(service_doc)
+        result = db.servicerecords.insert_one(completion_record(prediction, vehicle, user_id))
 
         # 4. Deactivate the Prediction
-        db.maintenancepredictions.update_one(
-            {"_id": ObjectId(prediction_id)},
-            {"$set": {"is_active": False, "notification_status": "completed"}}
-        )
+        db.maintenancepredictions.update_one({"_id": ObjectId(prediction_id)}, resolve_update("completed"))
 
         # 5. Trigger Engine to Calculate NEXT due date
         prediction_engine.calculate_predictions(prediction['vehicle_id'])
@@ -110,10 +213,8 @@ def cancel_prediction(prediction_id):
         vehicle = db.vehicles.find_one({"_id": prediction['vehicle_id'], "user_id": ObjectId(user_id)})
         if not vehicle: return jsonify({"error": "Access denied"}), 403
 
-        db.maintenancepredictions.update_one(
-            {"_id": ObjectId(prediction_id)},
-            {"$set": {"is_active": False, "notification_status": "cancelled"}}
-        )
+        db.maintenancepredictions.update_one({"_id": ObjectId(prediction_id)}, resolve_update("cancelled"))
+        caching.bump_user_rev(user_id)
         
         return jsonify({"message": "Prediction cancelled"}), 200
 
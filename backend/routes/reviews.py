@@ -0,0 +1,160 @@
+from flask import Blueprint, request, jsonify, session
+from bson.objectid import ObjectId
+from datetime import datetime
+from marshmallow import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from backend.models import db, workshop_review_schema
+from backend.utils import encode_cursor, decode_cursor
+from backend.services.ratings import apply_rating_delta
+from backend.log import get_logger
+from backend.readpref import reader
+
+reviews_bp = Blueprint('reviews_bp', __name__)
+logger = get_logger("routes.reviews")
+
+REVIEWS_PAGE_SIZE = 20
+REVIEWS_MAX_PAGE_SIZE = 100
+
+# ---------------------------------------------------------
+# LIST REVIEWS (Public, newest first)
+# ---------------------------------------------------------
+@reviews_bp.route('/workshops/<string:workshop_id>/reviews', methods=['GET'])
+def get_reviews(workshop_id):
+    source = reader("workshops")
+    try:
+        workshop = source.workshops.find_one(
+            {"_id": ObjectId(workshop_id)},
+            {"average_rating": 1, "rating_count": 1}
+        )
+    except Exception:
+        return jsonify({'error': 'Invalid workshop ID'}), 400
+    if not workshop: return jsonify({'error': 'Workshop not found'}), 404
+
+    limit = min(max(request.args.get('limit', default=REVIEWS_PAGE_SIZE, type=int), 1), REVIEWS_MAX_PAGE_SIZE)
+    query = {"workshop_id": workshop['_id']}
+
+    if request.args.get('cursor'):
+        try:
+            last_created, last_id = decode_cursor(request.args['cursor'])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query["$or"] = [
+            {"created_at": {"$lt": last_created}},
+            {"created_at": last_created, "_id": {"$lt": last_id}}
+        ]
+
+    reviews = list(source.workshopreviews.find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1))
+    has_more = len(reviews) > limit
+    reviews = reviews[:limit]
+
+    average = workshop.get('average_rating')
+    return jsonify({
+        "average_rating": round(average, 2) if average is not None else None,
+        "rating_count": workshop.get('rating_count', 0),
+        "reviews": [workshop_review_schema.dump(r) for r in reviews],
+        "next_cursor": encode_cursor([reviews[-1]['created_at'], reviews[-1]['_id']]) if has_more else None
+    }), 200
+
+# ---------------------------------------------------------
+# ADD REVIEW (Users with a service record at the workshop)
+# ---------------------------------------------------------
+@reviews_bp.route('/workshops/<string:workshop_id>/reviews', methods=['POST'])
+def add_review(workshop_id):
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        data = workshop_review_schema.load(request.get_json() or {})
+    except ValidationError as err:
+        return jsonify({'error': err.messages}), 400
+
+    try:
+        workshop = db.workshops.find_one({"_id": ObjectId(workshop_id), "is_active": True}, {"_id": 1})
+        if not workshop: return jsonify({'error': 'Workshop not found'}), 404
+
+        if not db.servicerecords.find_one({"created_by": ObjectId(user_id), "workshop_id": workshop['_id']}, {"_id": 1}):
+            return jsonify({'error': 'Only customers with a service record at this workshop can review it'}), 403
+
+        user = db.users.find_one({"_id": ObjectId(user_id)}, {"full_name": 1})
+        now = datetime.utcnow()
+        review = {
+            "workshop_id": workshop['_id'],
+            "user_id": ObjectId(user_id),
+            "user_name": (user or {}).get('full_name'),
+            "rating": data['rating'],
+            "comment": data.get('comment') or '',
+            "created_at": now,
+            "updated_at": now
+        }
+
+        try:
+            db.workshopreviews.insert_one(review)
+        except DuplicateKeyError:
+            return jsonify({'error': 'You have already reviewed this workshop'}), 409
+
+        apply_rating_delta(workshop['_id'], review['rating'], 1)
+        return jsonify(workshop_review_schema.dump(review)), 201
+
+    except Exception as e:
+        logger.exception("Error adding review")
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# EDIT REVIEW (Author only)
+# ---------------------------------------------------------
+@reviews_bp.route('/reviews/<string:review_id>', methods=['PUT'])
+def update_review(review_id):
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        data = workshop_review_schema.load(request.get_json() or {}, partial=True)
+    except ValidationError as err:
+        return jsonify({'error': err.messages}), 400
+
+    try:
+        changes = {"updated_at": datetime.utcnow()}
+        if 'rating' in data: changes['rating'] = data['rating']
+        if 'comment' in data: changes['comment'] = data['comment'] or ''
+
+        # Swap in the new values and get the old rating back in one step
+        old = db.workshopreviews.find_one_and_update(
+            {"_id": ObjectId(review_id), "user_id": ObjectId(user_id)},
+            {"$set": changes},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not old: return jsonify({'error': 'Review not found'}), 404
+
+        if 'rating' in changes and changes['rating'] != old['rating']:
+            apply_rating_delta(old['workshop_id'], changes['rating'] - old['rating'], 0)
+
+        return jsonify(workshop_review_schema.dump({**old, **changes})), 200
+
+    except Exception as e:
+        logger.exception("Error updating review")
+        return jsonify({'error': str(e)}), 500
+
+# ---------------------------------------------------------
+# DELETE REVIEW (Author or admin)
+# ---------------------------------------------------------
+@reviews_bp.route('/reviews/<string:review_id>', methods=['DELETE'])
+def delete_review(review_id):
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        query = {"_id": ObjectId(review_id)}
+        current_user = db.users.find_one({"_id": ObjectId(user_id)}, {"role": 1})
+        if not current_user or current_user.get('role') != 'admin':
+            query["user_id"] = ObjectId(user_id)
+
+        review = db.workshopreviews.find_one_and_delete(query)
+        if not review: return jsonify({'error': 'Review not found'}), 404
+
+        apply_rating_delta(review['workshop_id'], -review['rating'], -1)
+        return jsonify({'message': 'Review deleted'}), 200
+
+    except Exception as e:
+        logger.exception("Error deleting review")
+        return jsonify({'error': str(e)}), 500
@@ -1,31 +1,158 @@
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, Response, request, jsonify, session, current_app
 from bson.objectid import ObjectId
 from datetime import datetime
 from marshmallow import ValidationError
+from pymongo.errors import DuplicateKeyError
 from backend.models import db, vehicle_schema, manufacturer_schema
 import os
 import uuid
 
 from backend.services.prediction import prediction_engine
+from backend.services.reference_data import reference_data
+from backend.services.search import vehicle_search_keys
+from backend.log import get_logger
+from backend import caching
+from backend.idempotency import idempotent
 
 vehicles_bp = Blueprint('vehicles_bp', __name__)
+logger = get_logger("routes.vehicles")
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 
+# Fields PUT /vehicles/<id> may change
+UPDATABLE_FIELDS = ['license_plate', 'color', 'year', 'current_mileage', 'vin', 'manufacturer', 'model']
+
+# ---------------------------------------------------------
+# Helpers (shared with the async views, backend/aio/vehicles.py)
+# ---------------------------------------------------------
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_multipart(content_type):
+    return bool(content_type) and content_type.startswith('multipart/form-data')
+
+def clean_form(form):
+    """Form fields as a dict; empty and "null" values become None."""
+    return {key: (None if value in ("", "null") else value) for key, value in form.to_dict().items()}
+
+def image_paths(user_id, filename, upload_folder):
+    """
+    (stored path, file system path) for an uploaded vehicle image, or None
+    when the file type is not allowed. Creates the user's folder.
+    """
+    if not filename or not allowed_file(filename):
+        return None
+    ext = filename.rsplit('.', 1)[1].lower()
+    stored = f"{user_id}/{uuid.uuid4().hex}.{ext}"
+    os.makedirs(os.path.join(upload_folder, str(user_id)), exist_ok=True)
+    return stored, os.path.join(upload_folder, stored)
+
+def new_vehicle_doc(user_id, data, image_path):
+    """Vehicle document for a validated add-vehicle payload."""
+    now = datetime.utcnow()
+    vehicle_doc = {
+        'user_id': ObjectId(user_id),
+        'manufacturer': data['manufacturer'],
+        'model': data['model'],
+        'year': data['year'],
+        'color': data.get('color'),
+        'license_plate': data['license_plate'],
+        'vin': data.get('vin'),
+        'purchase_date': data.get('purchase_date'),
+        'initial_mileage': data['initial_mileage'],
+        'current_mileage': data['current_mileage'],
+        'image_filename': image_path,
+        'last_mileage_update': now,
+        'created_at': now,
+        'is_active': True
+    }
+    vehicle_doc['search_keys'] = vehicle_search_keys(vehicle_doc)
+    return vehicle_doc
+
+def vehicle_changes(data):
+    """The updatable fields of an update-vehicle body."""
+    return {k: v for k, v in data.items() if k in UPDATABLE_FIELDS}
+
+def changes_search_keys(update_data):
+    return 'license_plate' in update_data or 'vin' in update_data
+
+def with_search_keys(update_data, current):
+    """update_data plus search_keys rebuilt from the stored plate / VIN (`current`) and the new ones."""
+    return {**update_data, 'search_keys': vehicle_search_keys({**current, **update_data})}
+
+def mileage_writes(vehicle_id, user_id, new_mileage):
+    """($set for the vehicle, odometer history record) of a manual mileage update."""
+    now = datetime.utcnow()
+    mileage = int(new_mileage)
+    vehicle_update = {'$set': {'current_mileage': mileage, 'last_mileage_update': now}}
+    record = {
+        "vehicle_id": ObjectId(vehicle_id),
+        "service_type": "odometer_update",
+        "service_date": now,
+        "mileage_at_service": mileage,
+        "cost": 0,
+        "notes": "Manual odometer update",
+        "created_at": now,
+        "created_by": ObjectId(user_id)
+    }
+    return vehicle_update, record
+
 # ---------------------------------------------------------
-# Get All Manufacturers
+# Reference Data (served from memory, see services/reference_data.py)
 # ---------------------------------------------------------
 @vehicles_bp.route('/manufacturers', methods=['GET'])
 def get_manufacturers():
     try:
-        makers = list(db.manufacturers.find().sort("name", 1))
-        return jsonify([manufacturer_schema.dump(m) for m in makers]), 200
+        return reference_data.serve("manufacturers", request, Response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@vehicles_bp.route('/service-types', methods=['GET'])
+def get_service_types():
+    try:
+        return reference_data.serve("service_types", request, Response)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@vehicles_bp.route('/maintenance-intervals', methods=['GET'])
+def get_maintenance_intervals():
+    try:
+        return reference_data.serve("intervals", request, Response)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# ---------------------------------------------------------
+# Add Manufacturer (Admin)
+# ---------------------------------------------------------
+@vehicles_bp.route('/manufacturers', methods=['POST'])
+def add_manufacturer():
+    user_id = session.get('user_id')
+    if not user_id: return jsonify({'error': 'Unauthorized'}), 401
+
+    curr_user = db.users.find_one({"_id": ObjectId(user_id)}, {"role": 1})
+    if not curr_user or curr_user.get('role') != 'admin':
+        return jsonify({'error': 'Forbidden'}), 403
+
+    try:
+        data = manufacturer_schema.load(request.get_json() or {})
+    except ValidationError as err:
+        return jsonify({'error': err.messages}), 400
+
+    name = data['name'].strip()
+    if not name: return jsonify({'error': 'Name is required'}), 400
+
+    try:
+        maker = {"name": name, "logo_url": data.get('logo_url') or None, "created_at": datetime.utcnow()}
+        db.manufacturers.insert_one(maker)
+    except DuplicateKeyError:
+        return jsonify({'error': 'Manufacturer already exists'}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    # Every worker reloads its copy; this one before answering
+    reference_data.bump_version()
+    return jsonify(manufacturer_schema.dump(maker)), 201
+
 # ---------------------------------------------------------
 # Get User's Vehicles
 # ---------------------------------------------------------
@@ -34,8 +161,11 @@ def get_vehicles():
     user_id = session.get('user_id')
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
     try:
-        vehicles = list(db.vehicles.find({'user_id': ObjectId(user_id), 'is_active': True}))
-        return jsonify([vehicle_schema.dump(v) for v in vehicles]), 200
+        etag = caching.make_etag('vehicles', user_id, caching.user_rev(user_id))
+        return caching.conditional_json(request, etag, lambda: [
+            vehicle_schema.dump(v)
+            for v in db.vehicles.find({'user_id': ObjectId(user_id), 'is_active': True})
+        ], Response)
     except Exception as e: return jsonify({'error': str(e)}), 500
 
 # ---------------------------------------------------------
@@ -46,10 +176,8 @@ def add_vehicle():
     user_id = session.get('user_id')
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
     
-    if request.content_type.startswith('multipart/form-data'):
-        json_data = request.form.to_dict()
-        for key, value in json_data.items():
-            if value == "" or value == "null": json_data[key] = None
+    if is_multipart(request.content_type):
+        json_data = clean_form(request.form)
     else:
         json_data = request.get_json()
 
@@ -66,35 +194,16 @@ def add_vehicle():
 
     # Image Upload
     image_db_path = None
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and allowed_file(file.filename):
-            try:
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"{uuid.uuid4().hex}.{ext}"
-                base_path = current_app.config['UPLOAD_FOLDER']
-                os.makedirs(os.path.join(base_path, str(user_id)), exist_ok=True)
-                file.save(os.path.join(base_path, str(user_id), unique_filename))
-                image_db_path = f"{user_id}/{unique_filename}"
-            except Exception as e: print(f"Image Error: {e}")
-
-    # Create Document
-    vehicle_doc = {
-        'user_id': ObjectId(user_id),
-        'manufacturer': data['manufacturer'],
-        'model': data['model'],
-        'year': data['year'],
-        'color': data.get('color'),
-        'license_plate': data['license_plate'],
-        'vin': data.get('vin'),
-        'purchase_date': data.get('purchase_date'),
-        'initial_mileage': data['initial_mileage'],
-        'current_mileage': data['current_mileage'],
-        'image_filename': image_db_path,
-        'last_mileage_update': datetime.utcnow(),
-        'created_at': datetime.utcnow(),
-        'is_active': True
-    }
+    file = request.files.get('image')
+    if file:
+        try:
+            paths = image_paths(user_id, file.filename, current_app.config['UPLOAD_FOLDER'])
+            if paths:
+                file.save(paths[1])
+                image_db_path = paths[0]
+        except Exception: logger.exception("Vehicle image upload failed")
+
+    vehicle_doc = new_vehicle_doc(user_id, data, image_db_path)
     
     try:
         result = db.vehicles.insert_one(vehicle_doc)
@@ -114,32 +223,31 @@ def update_vehicle(vehicle_id):
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
 
     # Handle FormData or JSON
-    if request.content_type and request.content_type.startswith('multipart/form-data'):
+    if is_multipart(request.content_type):
         data = request.form.to_dict()
     else:
         data = request.get_json() or {}
 
-    # Define allowed fields to update
-    allowed = ['license_plate', 'color', 'year', 'current_mileage', 'vin', 'manufacturer', 'model']
-    update_data = {k: v for k, v in data.items() if k in allowed}
+    update_data = vehicle_changes(data)
 
     # Handle Image Update
-    if 'image' in request.files:
-        file = request.files['image']
-        if file and allowed_file(file.filename):
-            try:
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"{uuid.uuid4().hex}.{ext}"
-                base_path = current_app.config['UPLOAD_FOLDER']
-                os.makedirs(os.path.join(base_path, str(user_id)), exist_ok=True)
-                file.save(os.path.join(base_path, str(user_id), unique_filename))
-                update_data['image_filename'] = f"{user_id}/{unique_filename}"
-            except Exception as e: print(f"Image update failed: {e}")
+    file = request.files.get('image')
+    if file:
+        try:
+            paths = image_paths(user_id, file.filename, current_app.config['UPLOAD_FOLDER'])
+            if paths:
+                file.save(paths[1])
+                update_data['image_filename'] = paths[0]
+        except Exception: logger.exception("Vehicle image update failed")
 
     if not update_data and 'image' not in request.files:
         return jsonify({'error': 'No fields to update'}), 400
 
     try:
+        if changes_search_keys(update_data):
+            current = db.vehicles.find_one({'_id': ObjectId(vehicle_id)}, {'license_plate': 1, 'vin': 1}) or {}
+            update_data = with_search_keys(update_data, current)
+
         db.vehicles.update_one(
             {'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)},
             {'$set': update_data}
@@ -148,6 +256,8 @@ def update_vehicle(vehicle_id):
         # Recalculate predictions if mileage changed
         if 'current_mileage' in update_data:
             prediction_engine.calculate_predictions(ObjectId(vehicle_id))
+        else:
+            caching.bump_user_rev(user_id)
 
         return jsonify({'message': 'Vehicle updated successfully'}), 200
     except Exception as e:
@@ -157,6 +267,7 @@ def update_vehicle(vehicle_id):
 # UPDATE MILEAGE
 # ---------------------------------------------------------
 @vehicles_bp.route('/vehicles/<string:vehicle_id>/mileage', methods=['PUT'])
+@idempotent
 def update_mileage(vehicle_id):
     user_id = session.get('user_id')
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
@@ -170,26 +281,13 @@ def update_mileage(vehicle_id):
         vehicle = db.vehicles.find_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)})
         if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
         
+        vehicle_update, odometer_record = mileage_writes(vehicle_id, user_id, new_mileage)
+
         # 1. Update Vehicle
-        db.vehicles.update_one(
-            {'_id': ObjectId(vehicle_id)},
-            {'$set': {
-                'current_mileage': int(new_mileage),
-                'last_mileage_update': datetime.utcnow()
-            }}
-        )
+        db.vehicles.update_one({'_id': ObjectId(vehicle_id)}, vehicle_update)
 
         # 2. CREATE HISTORY RECORD (So it shows in the list)
-        db.servicerecords.insert_one({
-            "vehicle_id": ObjectId(vehicle_id),
-            "service_type": "odometer_update",
-            "service_date": datetime.utcnow(),
-            "mileage_at_service": int(new_mileage),
-            "cost": 0,
-            "notes": "Manual odometer update",
-            "created_at": datetime.utcnow(),
-            "created_by": ObjectId(user_id)
-        })
+        db.servicerecords.insert_one(odometer_record)
         
         # 3. Recalculate Predictions
         prediction_engine.calculate_predictions(ObjectId(vehicle_id))
@@ -203,9 +301,12 @@ def get_vehicle(vehicle_id):
     user_id = session.get('user_id')
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
     try:
+        etag = caching.make_etag('vehicle', vehicle_id, caching.user_rev(user_id))
+        held = caching.matching_etag(request, etag)
+        if held: return caching.not_modified(held, Response)
         vehicle = db.vehicles.find_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)})
         if not vehicle: return jsonify({'error': 'Vehicle not found'}), 404
-        return jsonify(vehicle_schema.dump(vehicle)), 200
+        return caching.tagged_json(vehicle_schema.dump(vehicle), etag, Response)
     except Exception: return jsonify({'error': 'Invalid ID'}), 400
 
 @vehicles_bp.route('/vehicles/<string:vehicle_id>', methods=['DELETE'])
@@ -214,5 +315,6 @@ def delete_vehicle(vehicle_id):
     if not user_id: return jsonify({'error': 'Unauthorized'}), 401
     try:
         db.vehicles.update_one({'_id': ObjectId(vehicle_id), 'user_id': ObjectId(user_id)}, {'$set': {'is_active': False}})
+        caching.bump_user_rev(user_id)
         return jsonify({'message': 'Deleted'}), 200
     except: return jsonify({'error': 'Failed'}), 500
@@ -1,56 +1,361 @@
-from flask import Blueprint, request, jsonify, session
-from backend.models import db
+import json
+import math
+import os
+import tempfile
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, request, jsonify, session
+from backend.models import db, maintenance_prediction_schema
+from backend.utils import encode_cursor, decode_cursor
+from backend.services.workshop_index import workshop_index
+from backend.services.tile_cache import tile_cache, MAX_AGE_SECONDS
+from backend.services.ratings import NO_RATINGS
+from backend import caching
+from backend.readpref import reader
+from backend.services.workshop_import import import_workshops, check_dedupe_meters, DEFAULT_DEDUPE_METERS
+from backend.log import get_logger
 from bson.objectid import ObjectId
 
 workshops_bp = Blueprint('workshops_bp', __name__)
+logger = get_logger("routes.workshops")
+
+# --- Nearby search bounds (meters / results per page) ---
+# Cursor modes: paged by distance from a location, or by _id without one
+CURSOR_NEAR = "near"
+CURSOR_BY_ID = "id"
+NEARBY_DEFAULT_RADIUS = 25000
+NEARBY_MIN_RADIUS = 100
+NEARBY_MAX_RADIUS = 200000
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 50
+
+# --- Recommendations for due maintenance ---
+RECOMMEND_DEFAULT_LIMIT = 3
+RECOMMEND_MAX_LIMIT = 10
+RECOMMEND_DUE_DAYS = 30
+RECOMMEND_DUE_KM = 1000
+# $geoNear aggregates per request (one per distinct service list)
+RECOMMEND_MAX_QUERIES = 5
+
+# Prediction maintenance_type -> workshop services_offered that can do it
+MAINTENANCE_SERVICES = {
+    "oil_change": ["oil_change", "general_repair"],
+    "tire_rotation": ["tires"],
+    "brake_service": ["brake_service", "general_repair"],
+    "battery": ["battery", "general_repair"],
+    "air_filter": ["general_repair"],
+    "timing_belt": ["general_repair"],
+    "other": ["general_repair"]
+}
+
+def serialize_workshop(doc):
+    """Shapes a workshop document for the map/list API response."""
+    distance = doc.get('distance_m')
+    rating = doc.get('average_rating')
+    return {
+        "id": str(doc.get('_id')),
+        "name": doc.get('name'),
+        "address": doc.get('address', {}).get('street', 'Unknown Address'),
+        "location": doc.get('location'), 
+        "services": doc.get('services_offered', []),
+        "phone": doc.get('phone_number'),
+        "rating": round(rating, 1) if rating is not None else None,
+        "rating_count": doc.get('rating_count', 0),
+        "distance_m": round(distance, 1) if distance is not None else None
+    }
+
+def parse_nearby_args(args):
+    """
+    Validates /workshops/nearby query args. Radius and page size are clamped
+    to the server bounds. Raises ValueError on bad input.
+    """
+    latitude = args.get('lat', type=float)
+    longitude = args.get('lng', type=float)
+    if (latitude is None) != (longitude is None):
+        raise ValueError("lat and lng must be given together")
+    if latitude is not None and not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("lat/lng out of range")
+
+    radius = args.get('radius', default=NEARBY_DEFAULT_RADIUS, type=float)
+    if not math.isfinite(radius):
+        # NaN slips through min/max and breaks $geoNear and the index scan
+        raise ValueError("radius must be a finite number")
+    limit = args.get('limit', default=NEARBY_DEFAULT_LIMIT, type=int)
+    service = args.get('service', type=str)
+
+    cursor = None
+    if args.get('cursor'):
+        cursor = decode_cursor(args['cursor'])
+        if not isinstance(cursor, list) or len(cursor) != 3:
+            raise ValueError("Invalid cursor")
+        mode, distance, last_id = cursor
+        expected = CURSOR_BY_ID if latitude is None else CURSOR_NEAR
+        if mode != expected:
+            # e.g. a cursor of a list without location replayed with lat/lng
+            raise ValueError("Cursor does not match this query (lat/lng changed)")
+        if mode == CURSOR_NEAR and not (isinstance(distance, (int, float)) and math.isfinite(distance)):
+            raise ValueError("Invalid cursor")
+        cursor = [distance, last_id]
+
+    return {
+        "lat": latitude,
+        "lng": longitude,
+        "radius": min(max(radius, NEARBY_MIN_RADIUS), NEARBY_MAX_RADIUS),
+        "limit": min(max(limit, 1), NEARBY_MAX_LIMIT),
+        "service": service if service and service != 'all' else None,
+        "cursor": cursor
+    }
+
+def nearby_pipeline(params):
+    """
+    One page of active workshops. With a location this is a $geoNear
+    (nearest first, distance annotated) resumed after the last
+    (distance, _id) seen; without one it pages by _id.
+    One extra document is fetched to know whether another page exists.
+    """
+    query = {"is_active": True}
+    if params['service']:
+        query["services_offered"] = params['service']
+
+    if params['lat'] is None:
+        if params['cursor']:
+            query["_id"] = {"$gt": params['cursor'][1]}
+        return [
+            {"$match": query},
+            {"$sort": {"_id": 1}},
+            {"$limit": params['limit'] + 1}
+        ]
+
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [params['lng'], params['lat']]},
+        "distanceField": "distance_m",
+        "maxDistance": params['radius'],
+        "spherical": True,
+        "query": query
+    }
+    pipeline = [{"$geoNear": geo_near}]
+
+    if params['cursor']:
+        last_distance, last_id = params['cursor']
+        geo_near["minDistance"] = last_distance
+        pipeline.append({"$match": {"$or": [
+            {"distance_m": {"$gt": last_distance}},
+            {"distance_m": last_distance, "_id": {"$gt": last_id}}
+        ]}})
+
+    pipeline.append({"$limit": params['limit'] + 1})
+    return pipeline
+
+def nearby_page(docs, params):
+    """Builds the response body from the fetched documents."""
+    has_more = len(docs) > params['limit']
+    docs = docs[:params['limit']]
+
+    next_cursor = None
+    if has_more:
+        last = docs[-1]
+        mode = CURSOR_BY_ID if params['lat'] is None else CURSOR_NEAR
+        next_cursor = encode_cursor([mode, last.get('distance_m'), last['_id']])
+
+    results = [serialize_workshop(doc) for doc in docs]
+    return {
+        "count": len(results),
+        "workshops": results,
+        "radius": params['radius'],
+        "next_cursor": next_cursor
+    }
+
+def encode_page(page):
+    return json.dumps(page, separators=(',', ':')).encode('utf-8')
+
+def tile_response(entry, req, response_class):
+    """Cached tile page with ETag / Cache-Control; 304 when revalidated."""
+    held = caching.matching_etag(req, entry.etag)
+    encoding = caching.negotiate_encoding(req) if len(entry.body) >= caching.COMPRESS_MIN_BYTES else None
+    if held:
+        response = response_class(status=304)
+        response.set_etag(held)
+    elif encoding:
+        # Compressed once per tile, not per request
+        response = response_class(entry.encoded(encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{entry.etag}-{encoding}")
+    else:
+        response = response_class(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE_SECONDS
+    return response
+
+def recommendations_pipeline(params, services):
+    """
+    Nearest active workshops offering any of `services`. The service filter
+    is part of the $geoNear query, so shops that cannot do the job never
+    take a slot, however many of them are closer.
+    """
+    return [
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [params['lng'], params['lat']]},
+            "distanceField": "distance_m",
+            "maxDistance": params['radius'],
+            "spherical": True,
+            "query": {"is_active": True, "services_offered": {"$in": services}}
+        }},
+        {"$limit": params['limit']},
+        {"$project": {
+            "name": 1, "address": 1, "location": 1, "services_offered": 1,
+            "phone_number": 1, "average_rating": 1, "rating_count": 1, "distance_m": 1
+        }}
+    ]
+
+def recommended_workshops(source, params, due_items):
+    """
+    Workshops per due item key. Items that need the same services share one
+    $geoNear, so a vehicle costs one query per service list, and at most
+    RECOMMEND_MAX_QUERIES: items past that (due_items are soonest first)
+    get no workshops.
+
+    Not a single $geoNear + $facet: $geoNear has to be the first stage of
+    the pipeline, so it cannot run inside a $facet branch, and one shared
+    $geoNear would have to over-fetch before the per-service split.
+    """
+    by_services = {}
+    results = {}
+    for item in due_items:
+        services = tuple(item['services'])
+        if services not in by_services:
+            if len(by_services) >= RECOMMEND_MAX_QUERIES:
+                results[item['key']] = []
+                continue
+            by_services[services] = list(source.workshops.aggregate(recommendations_pipeline(params, list(services))))
+        results[item['key']] = by_services[services]
+    return results
+
+def is_admin(user):
+    return bool(user) and user.get('role') == 'admin'
+
+def new_workshop_doc(data):
+    """Workshop document for an add-workshop body; raises ValueError on bad input."""
+    if not data or not data.get('name') or not data.get('lat') or not data.get('lng'):
+        raise ValueError("Missing required fields")
+    return {
+        "name": data['name'],
+        "address": {"street": data.get('address', '')},
+        "phone_number": data.get('phone', ''),
+        **NO_RATINGS,
+        "services_offered": data.get('services', ['general_repair']),
+        "is_active": True,
+        "location": {
+            "type": "Point",
+            "coordinates": [float(data['lng']), float(data['lat'])]
+        }
+    }
+
+def soft_delete(workshop_id):
+    """(filter, update) that deactivates a workshop unless it already is."""
+    return {"_id": ObjectId(workshop_id), "is_active": {"$ne": False}}, {"$set": {"is_active": False}}
+
+def _nearby_docs(params):
+    # Served from the in-process index; Mongo only until it is loaded
+    docs = workshop_index.search(params)
+    if docs is None:
+        docs = list(reader("workshops").workshops.aggregate(nearby_pipeline(params)))
+    return docs
 
 # --- Route 1: Find Nearby Workshops (Public) ---
 @workshops_bp.route('/workshops/nearby', methods=['GET'])
 def find_nearby_workshops():
     try:
-        latitude = request.args.get('lat', type=float)
-        longitude = request.args.get('lng', type=float)
-        
-        radius = request.args.get('radius', default=40000000, type=float) 
-        service_filter = request.args.get('service', type=str)
-
-        if latitude is not None and longitude is not None:
-            query = {
-                "location": {
-                    "$nearSphere": {
-                        "$geometry": {
-                            "type": "Point",
-                            "coordinates": [longitude, latitude]
-                        },
-                        "$maxDistance": radius
-                    }
-                },
-                "is_active": True
-            }
-        else:
-            query = {"is_active": True}
-
-        if service_filter and service_filter != 'all':
-            query["services_offered"] = service_filter
-
-        workshops_cursor = db.workshops.find(query)
-        
-        results = []
-        for doc in workshops_cursor:
-            results.append({
-                "id": str(doc.get('_id')),
-                "name": doc.get('name'),
-                "address": doc.get('address', {}).get('street', 'Unknown Address'),
-                "location": doc.get('location'), 
-                "services": doc.get('services_offered', []),
-                "phone": doc.get('phone_number'),
-                "rating": doc.get('average_rating', 0.0)
-            })
-
-        return jsonify({"count": len(results), "workshops": results}), 200
+        params = parse_nearby_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        if params['lat'] is None:
+            # No version to compare against: hash the page itself
+            body = encode_page(nearby_page(_nearby_docs(params), params))
+            etag = caching.content_etag(body)
+            held = caching.matching_etag(request, etag)
+            if held:
+                return caching.not_modified(held, Response)
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            return response
+
+        # Map queries: snap to a geohash tile and share its cached page
+        params = tile_cache.snap(params)
+        cursor_token = request.args.get('cursor')
+        entry = tile_cache.get(params, cursor_token)
+        if entry is None:
+            body = encode_page(nearby_page(_nearby_docs(params), params))
+            entry = tile_cache.put(params, cursor_token, body)
+        return tile_response(entry, request, Response)
+
+    except Exception as e:
+        logger.exception("Error in nearby workshops")
+        return jsonify({"error": str(e)}), 500
+
+
+# --- Route 1b: Workshops for a Vehicle's Due Maintenance ---
+@workshops_bp.route('/vehicles/<string:vehicle_id>/workshop-recommendations', methods=['GET'])
+def recommend_workshops(vehicle_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        vehicle = db.vehicles.find_one(
+            {"_id": ObjectId(vehicle_id), "user_id": ObjectId(user_id)},
+            {"current_mileage": 1}
+        )
+    except Exception:
+        return jsonify({"error": "Invalid vehicle ID"}), 400
+    if not vehicle:
+        return jsonify({"error": "Vehicle not found"}), 404
+
+    try:
+        params = parse_nearby_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if params['lat'] is None:
+        return jsonify({"error": "lat and lng are required"}), 400
+
+    limit = request.args.get('limit', default=RECOMMEND_DEFAULT_LIMIT, type=int)
+    params['limit'] = min(max(limit, 1), RECOMMEND_MAX_LIMIT)
+    due_days = request.args.get('days', default=RECOMMEND_DUE_DAYS, type=int)
+    due_km = request.args.get('km', default=RECOMMEND_DUE_KM, type=int)
+
+    try:
+        # Due soon: by date, or by mileage for cars that are driven a lot
+        predictions = list(db.maintenancepredictions.find({
+            "vehicle_id": vehicle['_id'],
+            "is_active": True,
+            "$or": [
+                {"predicted_date": {"$lte": datetime.utcnow() + timedelta(days=due_days)}},
+                {"predicted_mileage": {"$lte": vehicle.get('current_mileage', 0) + due_km}}
+            ]
+        }).sort("predicted_date", 1))
+
+        due_items = [{
+            "key": str(p['_id']),
+            "prediction": p,
+            "services": MAINTENANCE_SERVICES.get(p.get('maintenance_type'), MAINTENANCE_SERVICES['other'])
+        } for p in predictions]
+
+        workshops = recommended_workshops(reader("workshops"), params, due_items)
+
+        return jsonify({
+            "vehicle_id": vehicle_id,
+            "radius": params['radius'],
+            "items": [{
+                "prediction": maintenance_prediction_schema.dump(item['prediction']),
+                "services": item['services'],
+                "workshops": [serialize_workshop(doc) for doc in workshops[item['key']]]
+            } for item in due_items]
+        }), 200
 
     except Exception as e:
-        print(f"Error in nearby workshops: {e}")
+        logger.exception("Error in workshop recommendations")
         return jsonify({"error": str(e)}), 500
 
 
@@ -64,28 +369,16 @@ def add_workshop():
     try:
         current_user = db.users.find_one({"_id": ObjectId(user_id)})
         
-        if not current_user or current_user.get('role') != 'admin':
+        if not is_admin(current_user):
             return jsonify({"error": "Forbidden: Admins only"}), 403
 
-        data = request.get_json()
-        
-        if not data.get('name') or not data.get('lat') or not data.get('lng'):
-            return jsonify({"error": "Missing required fields"}), 400
-
-        new_workshop = {
-            "name": data['name'],
-            "address": {"street": data.get('address', '')},
-            "phone_number": data.get('phone', ''),
-            "average_rating": 5.0,
-            "services_offered": data.get('services', ['general_repair']), 
-            "is_active": True,
-            "location": {
-                "type": "Point",
-                "coordinates": [float(data['lng']), float(data['lat'])] 
-            }
-        }
+        try:
+            new_workshop = new_workshop_doc(request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         result = db.workshops.insert_one(new_workshop)
+        workshop_index.bump_version(new_workshop['location']['coordinates'])
 
         return jsonify({
             "message": "Workshop added successfully", 
@@ -93,7 +386,7 @@ def add_workshop():
         }), 201
 
     except Exception as e:
-        print(f"Error adding workshop: {e}")
+        logger.exception("Error adding workshop")
         return jsonify({"error": str(e)}), 500
 
 # --- Route 3: Delete Workshop (ADMIN ONLY) ---
@@ -105,19 +398,53 @@ def delete_workshop(workshop_id):
 
     try:
         current_user = db.users.find_one({"_id": ObjectId(user_id)})
-        if not current_user or current_user.get('role') != 'admin':
+        if not is_admin(current_user):
             return jsonify({"error": "Forbidden"}), 403
 
         # Soft delete (set is_active to False)
-        result = db.workshops.update_one(
-            {"_id": ObjectId(workshop_id)},
-            {"$set": {"is_active": False}}
-        )
+        workshop = db.workshops.find_one_and_update(*soft_delete(workshop_id), projection={"location": 1})
 
-        if result.modified_count == 0:
+        if not workshop:
             return jsonify({"error": "Workshop not found"}), 404
 
+        workshop_index.bump_version(workshop.get('location', {}).get('coordinates'))
+
         return jsonify({"message": "Workshop deleted"}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# --- Route 4: Bulk Import from OSM / GeoJSON extract (ADMIN ONLY) ---
+@workshops_bp.route('/workshops/import', methods=['POST'])
+def import_workshops_file():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    current_user = db.users.find_one({"_id": ObjectId(user_id)})
+    if not is_admin(current_user):
+        return jsonify({"error": "Forbidden"}), 403
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    dedupe_meters = request.form.get('dedupe_meters', default=DEFAULT_DEDUPE_METERS, type=float)
+    try:
+        check_dedupe_meters(dedupe_meters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    suffix = os.path.splitext(upload.filename)[1].lower()
+
+    # Spool to disk so the parser can stream it with bounded memory
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            upload.save(tmp)
+        stats = import_workshops(path, dedupe_meters)
+        return jsonify({"message": "Import finished", **stats}), 200
+    except Exception as e:
+        logger.exception("Error importing workshops")
+        return jsonify({"error": str(e)}), 400
+    finally:
+        os.remove(path)
@@ -0,0 +1,221 @@
+"""
+backend/services/notifications.py
+Batched maintenance alerts (Telegram digests)
+
+The prediction engine no longer sends one Telegram message per service
+type. It hands every alert of a recompute to `notifier.enqueue()`, and
+the user's `digest_window` decides when they go out:
+
+- immediate: right away, all alerts of that recompute in one message
+- hourly / daily: collected in the user's bucket in `notificationdigests`
+  and sent as one message when the window (opened by the first alert)
+  closes
+
+Buckets key alerts by vehicle and service type, so a newer alert for the
+same service replaces the older one instead of repeating it. Each worker
+runs a flusher thread; a bucket is claimed with find_one_and_delete, so
+exactly one worker sends it. `flask flush-digests` flushes by hand.
+
+A send that failed for a transient reason (network, 429, 5xx) puts the
+alerts back with an exponential backoff (RETRY_SECONDS, doubled per
+attempt); after MAX_SEND_ATTEMPTS the bucket is dropped. Permanent
+failures (no bot token, chat blocked or gone: other 4xx) are never
+retried.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo.errors import PyMongoError
+from backend.models import db
+from backend.utils import telegram_send_status
+from backend.health import register_worker
+from backend.log import get_logger
+
+logger = get_logger("notifications")
+
+DIGEST_WINDOWS = {"immediate": 0, "hourly": 3600, "daily": 24 * 3600}
+DEFAULT_DIGEST_WINDOW = "immediate"
+FLUSH_CHECK_SECONDS = 30
+RETRY_SECONDS = 300
+MAX_SEND_ATTEMPTS = 5
+# A flusher that has not finished a pass for this long is reported as stalled
+MAX_FLUSH_LAG_SECONDS = 2 * FLUSH_CHECK_SECONDS
+
+# Outcome of a send
+SENT, RETRY, FAILED = "sent", "retry", "failed"
+
+
+def _outcome(status):
+    """SENT / RETRY / FAILED for a telegram_send_status() result."""
+    if status is None or status == 429 or status >= 500:
+        return RETRY
+    if 200 <= status < 300:
+        return SENT
+    return FAILED  # 0 (not configured / not linked) or a 4xx the Bot API will repeat
+
+
+def retry_delay(attempts):
+    """Backoff before the next send after `attempts` failed ones (1, 2, ...)."""
+    return timedelta(seconds=RETRY_SECONDS * 2 ** (attempts - 1))
+
+
+def _readable(service_type):
+    return service_type.replace("_", " ").title()
+
+
+def compose_message(user_name, alerts):
+    """One Telegram message for a list of alerts (the single-alert text for one)."""
+    if len(alerts) == 1:
+        alert = alerts[0]
+        return (
+            f"⚠️ **Maintenance Alert**\n\n"
+            f"🚗 {alert['vehicle_name']}\n"
+            f"🔧 **{_readable(alert['service_type'])}**\n"
+            f"📅 Due: {alert['due_date'].strftime('%Y-%m-%d')}\n"
+            f"🛣️ Remaining: {int(alert['km_remaining'])} km\n\n"
+            f"Please schedule a service."
+        )
+
+    lines = [f"⚠️ **Maintenance Digest**\n\nHi {user_name}, {len(alerts)} services are coming up:"]
+    by_vehicle = {}
+    for alert in sorted(alerts, key=lambda a: a['due_date']):
+        by_vehicle.setdefault(alert['vehicle_name'], []).append(alert)
+    for vehicle_name, items in by_vehicle.items():
+        lines.append(f"\n🚗 {vehicle_name}")
+        for alert in items:
+            lines.append(
+                f"🔧 {_readable(alert['service_type'])}: due {alert['due_date'].strftime('%Y-%m-%d')}, "
+                f"{int(alert['km_remaining'])} km left"
+            )
+    lines.append("\nPlease schedule a service.")
+    return "\n".join(lines)
+
+
+class DigestNotifier:
+    def __init__(self):
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_pass = None
+        self._failing_since = None
+        self.sent_messages = 0
+
+    # --- Enqueue ---
+
+    def enqueue(self, user, alerts):
+        """
+        Queues the alerts of one recompute for `user` (a users document).
+        alerts: [{vehicle_id, vehicle_name, service_type, due_date, km_remaining}]
+        """
+        if not alerts or not user or not user.get('telegram_chat_id'):
+            return
+        window = user.get('digest_window', DEFAULT_DIGEST_WINDOW)
+        seconds = DIGEST_WINDOWS.get(window, 0)
+        if seconds == 0:
+            self._send(user, alerts)
+            return
+
+        now = datetime.utcnow()
+        db.notificationdigests.update_one(
+            {"_id": user['_id']},
+            {
+                "$set": {f"alerts.{a['vehicle_id']}:{a['service_type']}": a for a in alerts},
+                "$setOnInsert": {"window": window, "created_at": now, "due_at": now + timedelta(seconds=seconds)}
+            },
+            upsert=True
+        )
+        logger.debug("Queued %d alerts for the %s digest", len(alerts), window)
+
+    def _send(self, user, alerts):
+        message = compose_message(user.get('full_name', 'Driver'), alerts)
+        outcome = _outcome(telegram_send_status(user.get('telegram_chat_id'), message))
+        if outcome == SENT:
+            self.sent_messages += 1
+            logger.info("Maintenance alerts sent", extra={"alerts": len(alerts)})
+        return outcome
+
+    # --- Flushing ---
+
+    def flush_due(self, everything=False):
+        """
+        Sends every bucket whose window has closed. everything=True does not
+        wait for open windows, but still honours the backoff of buckets put
+        back after a failed send (it would retry them right away otherwise).
+        """
+        due = {"due_at": {"$lte": datetime.utcnow()}}
+        query = {"$or": [{"attempts": {"$exists": False}}, due]} if everything else due
+        flushed = 0
+        while not self._stop.is_set():
+            bucket = db.notificationdigests.find_one_and_delete(query, sort=[("due_at", 1)])
+            if bucket is None:
+                break
+            self._flush_bucket(bucket)
+            flushed += 1
+        return flushed
+
+    def _flush_bucket(self, bucket):
+        alerts = list(bucket.get('alerts', {}).values())
+        user = db.users.find_one({"_id": bucket['_id']}, {"full_name": 1, "telegram_chat_id": 1})
+        if not alerts or not user or not user.get('telegram_chat_id'):
+            return  # nothing to send, or unlinked meanwhile: drop
+        try:
+            outcome = self._send(user, alerts)
+        except Exception:
+            logger.exception("Digest send failed")
+            outcome = RETRY
+        if outcome == SENT:
+            return
+
+        attempts = bucket.get('attempts', 0) + 1
+        if outcome == FAILED or attempts >= MAX_SEND_ATTEMPTS:
+            logger.warning("Digest dropped after %d attempt(s) (%s)", attempts, outcome,
+                           extra={"alerts": len(alerts)})
+            return
+
+        # Put the alerts back (newer ones queued meanwhile win) and retry later
+        retry_at = datetime.utcnow() + retry_delay(attempts)
+        db.notificationdigests.update_one(
+            {"_id": bucket['_id']},
+            [{"$set": {
+                "alerts": {"$mergeObjects": [{"$literal": bucket['alerts']}, {"$ifNull": ["$alerts", {}]}]},
+                "window": {"$ifNull": ["$window", bucket.get('window')]},
+                "created_at": {"$ifNull": ["$created_at", bucket.get('created_at')]},
+                "attempts": attempts,
+                # Not before the backoff, even if a new window opened meanwhile
+                "due_at": {"$max": [{"$ifNull": ["$due_at", retry_at]}, retry_at]}
+            }}],
+            upsert=True
+        )
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="digest-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush_due()
+                self._last_pass = time.monotonic()
+                self._failing_since = None
+            except PyMongoError as e:
+                logger.warning("Digest flush failed: %s", e)
+                if self._failing_since is None:
+                    self._failing_since = time.monotonic()
+            self._stop.wait(FLUSH_CHECK_SECONDS)
+
+    def status(self):
+        lag = 0
+        if self._failing_since is not None:
+            lag = time.monotonic() - self._failing_since
+        elif self._thread is not None and self._last_pass is not None:
+            lag = max(0, time.monotonic() - self._last_pass - MAX_FLUSH_LAG_SECONDS)
+        return {"running": self._thread is not None, "sent": self.sent_messages, "lag_seconds": round(lag, 1)}
+
+
+notifier = DigestNotifier()
+register_worker("digest_flusher", notifier.status)
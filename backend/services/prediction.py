@@ -3,11 +3,16 @@ backend/services/prediction.py
 Smart Prediction Engine with Notifications
 """
 
-import math
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from backend.models import db
-from backend.utils import send_telegram_message
+from backend.log import get_logger, vehicle_id_var
+from backend.caching import bump_user_rev
+from backend.services import prediction_core
+from backend.services.notifications import notifier
+
+# Per-type details are DEBUG; tune with LOG_LEVELS / LOG_SAMPLE_RATES
+logger = get_logger("prediction")
 
 DEFAULT_INTERVALS = {
     "oil_change": 5000,
@@ -19,16 +24,33 @@ DEFAULT_INTERVALS = {
     "other": 10000
 }
 
+def last_service_mileage(vehicle_id, service_types):
+    """{service_type: mileage at its latest service} for the types with history."""
+    rows = db.servicerecords.aggregate([
+        {"$match": {"vehicle_id": vehicle_id, "service_type": {"$in": list(service_types)}}},
+        {"$sort": {"service_date": -1, "_id": -1}},
+        {"$group": {"_id": "$service_type", "mileage": {"$first": "$mileage_at_service"}}}
+    ])
+    return {row["_id"]: row["mileage"] for row in rows}
+
+
 class PredictionEngine:
     def calculate_predictions(self, vehicle_id):
         """
         Recalculates predictions.
         Triggered by: Add Vehicle, Update Mileage, Complete Service.
         """
+        token = vehicle_id_var.set(str(vehicle_id))
+        try:
+            self._calculate(vehicle_id)
+        finally:
+            vehicle_id_var.reset(token)
+
+    def _calculate(self, vehicle_id):
         # 1. Get Vehicle
         vehicle = db.vehicles.find_one({"_id": ObjectId(vehicle_id)})
         if not vehicle:
-            print(f" Prediction Engine: Vehicle {vehicle_id} not found.")
+            logger.warning("Prediction engine: vehicle not found")
             return
 
         current_mileage = vehicle.get('current_mileage', 0)
@@ -37,70 +59,84 @@ class PredictionEngine:
         # 2. Get User (For Notifications)
         user = db.users.find_one({"_id": vehicle.get('user_id')})
         chat_id = user.get('telegram_chat_id') if user else None
-        user_name = user.get('full_name', 'Driver') if user else 'Driver'
         vehicle_name = f"{vehicle.get('manufacturer')} {vehicle.get('model')}"
 
         # 3. Calculate Average Daily Usage
         days_owned = (datetime.utcnow() - vehicle['created_at']).days
-        usage_km = current_mileage - initial_mileage
-        
-        if days_owned > 7 and usage_km > 0:
-            avg_km_per_day = usage_km / days_owned
-        else:
-            # Default: ~15,000 km/year = 41 km/day
-            avg_km_per_day = 41
-
-        # 4. Process Each Service Type
-        for service_type, interval_km in DEFAULT_INTERVALS.items():
-            self._predict_single_type(
-                vehicle['_id'], 
-                service_type, 
-                interval_km, 
-                current_mileage, 
-                avg_km_per_day,
-                chat_id, user_name, vehicle_name
+        avg_km_per_day = prediction_core.average_km_per_day(current_mileage, initial_mileage, days_owned)
+
+        # 4. Predict every service type at once (pure maths, see prediction_core.py)
+        service_types = list(DEFAULT_INTERVALS)
+        last_km = last_service_mileage(vehicle['_id'], service_types)
+        history = [last_km.get(t, float("nan")) for t in service_types]
+        predicted = prediction_core.predict(
+            history, [DEFAULT_INTERVALS[t] for t in service_types], [current_mileage], [avg_km_per_day]
+        )
+        confidence = prediction_core.confidence(history)
+
+        # 5. Store per type; alerts go out together (see notifications.py)
+        alerts = []
+        for i, service_type in enumerate(service_types):
+            alert = self._predict_single_type(
+                vehicle['_id'],
+                service_type,
+                float(predicted["due_km"][0, i]),
+                float(predicted["km_remaining"][0, i]),
+                float(predicted["days"][0, i]),
+                float(confidence[i]),
+                chat_id, vehicle_name
             )
+            if alert:
+                alerts.append(alert)
+        notifier.enqueue(user, alerts)
 
-    def _predict_single_type(self, vehicle_id, service_type, interval_km, current_mileage, avg_km_per_day, chat_id, user_name, vehicle_name):
-        # A. Find Last Service Record
-        last_service = db.servicerecords.find_one(
-            {"vehicle_id": vehicle_id, "service_type": service_type},
-            sort=[("service_date", -1)]
-        )
+        # Every caller changed the vehicle or its history: new ETags for the owner
+        bump_user_rev(vehicle.get('user_id'))
 
-        # B. Smart Calculation
-        if last_service:
-            # Case 1: We have history. Follow the interval from last service.
-            last_km = last_service['mileage_at_service']
-            next_due_mileage = last_km + interval_km
-            confidence = 0.9
-        else:
-            # Case 2: No history (New/Used car). Snap to next milestone.
-            # Example: Current=102k, Interval=5k. 
-            # We assume it was done at 100k. Next due is 105k.
-            if current_mileage > 0:
-                # Logic: Find next multiple of interval_km
-                next_due_mileage = math.ceil(current_mileage / interval_km) * interval_km
-                
-                # If we are exactly ON the milestone, add one interval
-                if next_due_mileage <= current_mileage:
-                    next_due_mileage += interval_km
-            else:
-                next_due_mileage = interval_km
-            
-            confidence = 0.5 # Lower confidence since it's a guess
-
-        km_remaining = next_due_mileage - current_mileage
-
-        # C. Calculate Due Date
-        if avg_km_per_day > 0:
-            days_remaining = km_remaining / avg_km_per_day
-        else:
-            days_remaining = 365 # Fallback
-
-        # Don't predict dates in the past (if overdue, set to today)
-        if days_remaining < 0: days_remaining = 0
-        
+        logger.info("Predictions recalculated", extra={
+            "mileage": current_mileage, "km_per_day": round(avg_km_per_day, 1)
+        })
+
+    def simulate(self, vehicle, scenarios, max_occurrences=50):
+        """
+        What-if predictions for one vehicle; never writes. `scenarios` are
+        dicts with current_mileage, km_per_day and horizon_days. All
+        scenario x service type combinations are computed in one pass.
+        """
+        service_types = list(DEFAULT_INTERVALS)
+        intervals = [DEFAULT_INTERVALS[t] for t in service_types]
+        last_km = last_service_mileage(vehicle['_id'], service_types)
+        history = [last_km.get(t, float("nan")) for t in service_types]
+
+        current = [s['current_mileage'] for s in scenarios]
+        km_per_day = [s['km_per_day'] for s in scenarios]
+        horizon = [s['horizon_days'] for s in scenarios]
+
+        predicted = prediction_core.predict(history, intervals, current, km_per_day)
+        confidence = prediction_core.confidence(history)
+        days, due = prediction_core.occurrences(predicted, intervals, km_per_day, horizon, max_occurrences)
+
+        now = datetime.utcnow()
+        results = []
+        for s, scenario in enumerate(scenarios):
+            predictions = []
+            for t, service_type in enumerate(service_types):
+                dates = [now + timedelta(days=float(d)) for d in days[s, t][due[s, t]]]
+                predictions.append({
+                    "maintenance_type": service_type,
+                    "predicted_mileage": int(predicted["due_km"][s, t]),
+                    "km_remaining": int(predicted["km_remaining"][s, t]),
+                    "predicted_date": (now + timedelta(days=float(predicted["days"][s, t]))).isoformat(),
+                    "confidence_level": float(confidence[t]),
+                    "due_in_horizon": len(dates),
+                    "due_dates": [d.isoformat() for d in dates]
+                })
+            predictions.sort(key=lambda p: p["predicted_date"])
+            results.append({**scenario, "predictions": predictions})
+        return results
+
+    def _predict_single_type(self, vehicle_id, service_type, next_due_mileage, km_remaining, days_remaining, confidence, chat_id, vehicle_name):
+        """Stores the prediction; returns an alert to send, if one is due."""
         predicted_date = datetime.utcnow() + timedelta(days=days_remaining)
 
         # D. Notifications (Only if due within 7 days or 500km)
@@ -115,9 +151,6 @@ class PredictionEngine:
         if existing_pred and existing_pred.get('notification_status') == 'sent':
             should_notify = False # Already alerted
 
-        if should_notify:
-            self._send_alert(chat_id, user_name, vehicle_name, service_type, predicted_date, km_remaining)
-
         # E. Update Database
         db.maintenancepredictions.update_many(
             {"vehicle_id": vehicle_id, "maintenance_type": service_type, "is_active": True},
@@ -136,23 +169,13 @@ class PredictionEngine:
             "is_active": True
         }
         db.maintenancepredictions.insert_one(new_prediction)
+        logger.debug("Predicted %s at %d km (%d km left)", service_type, next_due_mileage, km_remaining)
 
-    def _send_alert(self, chat_id, user_name, vehicle_name, service_type, due_date, km_remaining):
-        try:
-            readable_service = service_type.replace("_", " ").title()
-            date_str = due_date.strftime('%Y-%m-%d')
-            
-            message = (
-                f"⚠️ **Maintenance Alert**\n\n"
-                f"🚗 {vehicle_name}\n"
-                f"🔧 **{readable_service}**\n"
-                f"📅 Due: {date_str}\n"
-                f"🛣️ Remaining: {int(km_remaining)} km\n\n"
-                f"Please schedule a service."
-            )
-            send_telegram_message(chat_id, message)
-            print(f" Alert sent to {user_name} for {service_type}")
-        except Exception as e:
-            print(f" Alert failed: {e}")
+        if should_notify:
+            return {
+                "vehicle_id": vehicle_id, "vehicle_name": vehicle_name, "service_type": service_type,
+                "due_date": predicted_date, "km_remaining": km_remaining
+            }
+        return None
 
 prediction_engine = PredictionEngine()
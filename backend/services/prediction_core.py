@@ -0,0 +1,96 @@
+"""
+backend/services/prediction_core.py
+Prediction maths without I/O
+
+Everything here works on plain numbers and NumPy arrays: no Mongo, no
+Telegram, no clock. The prediction engine feeds it one vehicle's state;
+the what-if endpoint feeds it many scenarios at once. Shapes:
+
+    last_km        (T,)  mileage of the last service per type, NaN if never
+    intervals_km   (T,)  service interval per type
+    current_km     (S,)  odometer per scenario
+    km_per_day     (S,)  usage per scenario
+
+and every result is (S, T): one row per scenario, one column per type.
+"""
+
+import numpy as np
+
+# ~15,000 km/year when the vehicle has too little history to tell
+DEFAULT_KM_PER_DAY = 41.0
+MIN_DAYS_OWNED = 7
+# Days until due when the vehicle is not being driven at all
+IDLE_DAYS = 365.0
+
+CONFIDENCE_WITH_HISTORY = 0.9
+CONFIDENCE_GUESSED = 0.5
+
+
+def average_km_per_day(current_km, initial_km, days_owned):
+    """Observed usage, or DEFAULT_KM_PER_DAY for new / idle vehicles."""
+    usage_km = current_km - initial_km
+    if days_owned > MIN_DAYS_OWNED and usage_km > 0:
+        return usage_km / days_owned
+    return DEFAULT_KM_PER_DAY
+
+
+def due_mileage(last_km, current_km, intervals_km):
+    """
+    Next due odometer reading per scenario and type. With history it is one
+    interval after the last service; without, the next multiple of the
+    interval above the current mileage (a used car is assumed to be on
+    schedule).
+    """
+    last_km = np.asarray(last_km, dtype=float)
+    intervals_km = np.asarray(intervals_km, dtype=float)
+    current_km = np.asarray(current_km, dtype=float)[:, None]
+
+    milestone = (np.floor(np.maximum(current_km, 0) / intervals_km) + 1) * intervals_km
+    return np.where(np.isnan(last_km), milestone, last_km + intervals_km)
+
+
+def days_until(km_remaining, km_per_day):
+    """Days until each due mileage is reached; 0 when already overdue."""
+    km_per_day = np.asarray(km_per_day, dtype=float)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = np.where(km_per_day > 0, km_remaining / km_per_day, IDLE_DAYS)
+    return np.maximum(days, 0)
+
+
+def confidence(last_km):
+    return np.where(np.isnan(np.asarray(last_km, dtype=float)), CONFIDENCE_GUESSED, CONFIDENCE_WITH_HISTORY)
+
+
+def predict(last_km, intervals_km, current_km, km_per_day):
+    """
+    Next service per scenario and type.
+    Returns a dict of (S, T) arrays: due_km, km_remaining, days.
+    """
+    due_km = due_mileage(last_km, current_km, intervals_km)
+    km_remaining = due_km - np.asarray(current_km, dtype=float)[:, None]
+    return {
+        "due_km": due_km,
+        "km_remaining": km_remaining,
+        "days": days_until(km_remaining, km_per_day),
+    }
+
+
+def occurrences(prediction, intervals_km, km_per_day, horizon_days, max_count):
+    """
+    Every time each type falls due within `horizon_days` (per scenario),
+    the first one included and capped at `max_count`.
+    Returns (days, mask), both (S, T, max_count); mask marks real entries.
+    """
+    intervals_km = np.asarray(intervals_km, dtype=float)
+    km_per_day = np.asarray(km_per_day, dtype=float)[:, None, None]
+    horizon_days = np.asarray(horizon_days, dtype=float)[:, None, None]
+
+    steps = np.arange(max_count, dtype=float)
+    # An overdue service is due now; the ones after it follow at full intervals
+    first_km = np.maximum(prediction["km_remaining"], 0)
+    km_ahead = first_km[:, :, None] + steps * intervals_km[None, :, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = np.where(km_per_day > 0, km_ahead / km_per_day, np.inf)
+    # Not driving: only the first service can fall due (after IDLE_DAYS)
+    days[:, :, 0] = prediction["days"]
+    return days, days <= horizon_days
@@ -0,0 +1,145 @@
+"""
+backend/services/ratelimit.py
+Token-bucket rate limiting shared across gunicorn workers
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from backend.models import db
+from backend.log import get_logger
+
+logger = get_logger("ratelimit")
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") != "0"
+
+# Per-worker memory for the local pre-check; idle keys are dropped past this
+MAX_LOCAL_BUCKETS = 10000
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated_at = now
+
+
+class TokenBucketLimiter:
+    """
+    Classic token bucket: `capacity` attempts in a burst, refilled at
+    `capacity / period` tokens per second.
+
+    Every token is taken in the `ratelimits` collection with one
+    conditional pipeline update (refill, then subtract only if enough
+    tokens are left), so the limit holds exactly across gunicorn workers.
+
+    With local_precheck=True (the per-IP limiters) a worker also remembers
+    the balance Mongo last reported for a key and refills it locally; a
+    key that is empty there is rejected without a DB round trip. The local
+    balance can only over-estimate the shared one, so those rejections
+    are always safe.
+    """
+
+    def __init__(self, name, capacity, period, local_precheck=False):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = capacity / float(period)
+        self.local_precheck = local_precheck
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, cost=1):
+        """
+        Takes `cost` tokens for `key`.
+        Returns (allowed, retry_after_seconds).
+        """
+        if not RATE_LIMIT_ENABLED or not key:
+            return True, 0
+
+        now = time.time()
+        if self.local_precheck:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    self._refill(bucket, now)
+                    if bucket.tokens < cost:
+                        return False, self._retry_after(bucket.tokens, cost)
+
+        try:
+            tokens, allowed = self._take(key, cost, now)
+        except Exception as e:
+            # Mongo unavailable: the login itself cannot proceed either
+            logger.warning("Rate limiter unavailable (%s): %s", self.name, e)
+            return True, 0
+
+        if self.local_precheck:
+            self._remember(key, tokens, now)
+        if not allowed:
+            return False, self._retry_after(tokens, cost)
+        return True, 0
+
+    def _refill(self, bucket, now):
+        elapsed = now - bucket.updated_at
+        if elapsed > 0:
+            bucket.tokens = min(self.capacity, bucket.tokens + elapsed * self.rate)
+            bucket.updated_at = now
+
+    def _retry_after(self, tokens, cost):
+        return max(1, int((cost - tokens) / self.rate) + 1)
+
+    def _remember(self, key, tokens, now):
+        with self._lock:
+            if key not in self._buckets and len(self._buckets) >= MAX_LOCAL_BUCKETS:
+                self._prune(now)
+            self._buckets[key] = _Bucket(tokens, now)
+
+    def _prune(self, now):
+        # Full buckets carry no information; forget them
+        for key in [k for k, b in self._buckets.items()
+                    if b.tokens + (now - b.updated_at) * self.rate >= self.capacity]:
+            del self._buckets[key]
+
+    def _take(self, key, cost, now):
+        """Refills and takes `cost` tokens if there are enough. Returns (tokens left, allowed)."""
+        now_dt = datetime.utcfromtimestamp(now)
+        elapsed_seconds = {"$divide": [{"$subtract": [now_dt, {"$ifNull": ["$updated_at", now_dt]}]}, 1000]}
+
+        doc = db.ratelimits.find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        self.capacity,
+                        {"$add": [{"$ifNull": ["$tokens", self.capacity]}, {"$multiply": [elapsed_seconds, self.rate]}]}
+                    ]},
+                    "updated_at": now_dt,
+                    # Bucket is full again by then, so the document can go
+                    "expire_at": now_dt + timedelta(seconds=self.capacity / self.rate)
+                }},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["tokens"], doc["allowed"]
+
+
+def _limit_from_env(var, default):
+    """Reads a '<attempts>/<seconds>' limit such as '5/300'."""
+    value = os.environ.get(var, default)
+    capacity, period = value.split("/")
+    return int(capacity), float(period)
+
+
+# --- Limiters ---
+
+login_ip_limiter = TokenBucketLimiter("login_ip", *_limit_from_env("LOGIN_LIMIT_PER_IP", "20/300"), local_precheck=True)
+login_account_limiter = TokenBucketLimiter("login_account", *_limit_from_env("LOGIN_LIMIT_PER_ACCOUNT", "5/300"))
+otp_ip_limiter = TokenBucketLimiter("otp_ip", *_limit_from_env("OTP_LIMIT_PER_IP", "10/300"), local_precheck=True)
+
+# Wrong guesses allowed against a single issued 2FA code
+MAX_OTP_ATTEMPTS = 5
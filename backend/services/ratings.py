@@ -0,0 +1,74 @@
+"""
+backend/services/ratings.py
+Workshop rating aggregates
+
+Each workshop document carries rating_sum, rating_count and the derived
+average_rating. Review writes apply their delta with one atomic pipeline
+update, so listing/ranking by rating never has to aggregate reviews.
+If a process dies between the review write and the delta, the totals
+drift; `flask recompute-ratings` rebuilds them from the reviews.
+
+A review does not bump the workshop index version (that would rebuild
+the whole catalogue in every worker); it stamps rating_updated_at and
+every worker patches the rating of its cached document, see
+workshop_index.patch_ratings.
+"""
+
+from pymongo import UpdateOne, ReturnDocument
+from backend.models import db
+from backend.services.workshop_index import workshop_index
+
+NO_RATINGS = {"rating_sum": 0, "rating_count": 0, "average_rating": None}
+
+def _average_stage():
+    return {"$set": {"average_rating": {"$cond": [
+        {"$gt": ["$rating_count", 0]},
+        {"$divide": ["$rating_sum", "$rating_count"]},
+        None
+    ]}}}
+
+def apply_rating_delta(workshop_id, sum_delta, count_delta):
+    """
+    Adds sum_delta to rating_sum and count_delta to rating_count and
+    recomputes average_rating in the same update.
+      create: (rating, 1)   edit: (new - old, 0)   delete: (-rating, -1)
+    """
+    workshop = db.workshops.find_one_and_update(
+        {"_id": workshop_id},
+        [
+            {"$set": {
+                "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, sum_delta]},
+                "rating_count": {"$add": [{"$ifNull": ["$rating_count", 0]}, count_delta]},
+                "rating_updated_at": "$$NOW"
+            }},
+            _average_stage()
+        ],
+        projection={"average_rating": 1, "rating_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if workshop:
+        workshop_index.patch_ratings(workshop_id, workshop.get('average_rating'), workshop.get('rating_count', 0))
+    return workshop
+
+def recompute_ratings():
+    """Rebuilds every workshop's rating totals from workshopreviews."""
+    totals = db.workshopreviews.aggregate([
+        {"$group": {"_id": "$workshop_id", "sum": {"$sum": "$rating"}, "count": {"$sum": 1}}}
+    ])
+
+    rated, ops = [], []
+    for row in totals:
+        rated.append(row['_id'])
+        ops.append(UpdateOne({"_id": row['_id']}, [
+            {"$set": {"rating_sum": row['sum'], "rating_count": row['count'], "rating_updated_at": "$$NOW"}},
+            _average_stage()
+        ]))
+        if len(ops) >= 1000:
+            db.workshops.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.workshops.bulk_write(ops, ordered=False)
+
+    reset = db.workshops.update_many({"_id": {"$nin": rated}}, {"$set": NO_RATINGS})
+    workshop_index.bump_version()
+    return {"rated": len(rated), "unrated": reset.modified_count}
@@ -0,0 +1,178 @@
+"""
+backend/services/reference_data.py
+Pre-serialized reference data
+
+Manufacturers, the service type list and the default maintenance
+intervals change only when an admin edits them, yet the add-vehicle and
+admin pages fetch them on every load. Each worker keeps them as ready
+JSON bytes with a strong ETag (plus compressed variants, built on first
+use), so those endpoints answer without touching Mongo or marshmallow:
+
+    reference_data.serve("manufacturers", request, Response)
+
+Datasets are loaded at worker start and reloaded after an admin change
+(`bump_version`), when the invalidation bus reports a change to
+`manufacturers` from another worker or a shell, or, without change
+streams, when the `referencedata` version in `counters` moved (checked
+in the background every VERSION_CHECK_SECONDS).
+"""
+
+import json
+import threading
+import time
+from pymongo import ReturnDocument
+from backend.models import db, manufacturer_schema
+from backend.services.prediction import DEFAULT_INTERVALS
+from backend.health import register_worker
+from backend.invalidation import invalidation_bus
+from backend.log import get_logger
+from backend import caching
+
+logger = get_logger("reference_data")
+
+VERSION_CHECK_SECONDS = 30
+COUNTER_ID = "referencedata"
+MANUFACTURER_FIELDS = {"name": 1, "logo_url": 1, "created_at": 1}
+
+
+def _service_types():
+    return [
+        {"value": service_type, "label": service_type.replace("_", " ").title(), "interval_km": interval_km}
+        for service_type, interval_km in DEFAULT_INTERVALS.items()
+    ]
+
+
+class _Dataset:
+    """Encoded body of one endpoint; immutable apart from the encoding cache."""
+    __slots__ = ("body", "etag", "_encoded")
+
+    def __init__(self, payload, source):
+        self.body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+        # Tag the source documents: dumps add defaults (created_at) that vary per load
+        self.etag = caching.make_etag(source)
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = caching.compress(self.body, encoding)
+        return body
+
+
+class ReferenceData:
+    def __init__(self):
+        self._datasets = None
+        self._version = None
+        self._checked_at = 0.0
+        self._failing_since = None
+        self._stale = False  # changed while a refresh was running
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._datasets is not None
+
+    # --- Refresh ---
+
+    def start(self):
+        """Loads the datasets in the background."""
+        self._checked_at = time.monotonic()
+        self._spawn_refresh(force=True)
+
+    def maybe_refresh(self):
+        if invalidation_bus.live:
+            return  # changes are pushed to us
+        now = time.monotonic()
+        if now - self._checked_at >= VERSION_CHECK_SECONDS:
+            self._checked_at = now
+            self._spawn_refresh()
+
+    def on_changes(self, ids):
+        """Invalidation bus callback for `manufacturers`."""
+        self._stale = True
+        self._spawn_refresh()
+
+    def bump_version(self):
+        """Call after an admin change: all workers reload, this one right away."""
+        counter = db.counters.find_one_and_update(
+            {"_id": COUNTER_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._refresh(force=True, wait=True)
+        return counter["version"]
+
+    def _spawn_refresh(self, force=False):
+        threading.Thread(target=self._refresh, args=(force,), daemon=True).start()
+
+    def _refresh(self, force=False, wait=False):
+        if not self._refresh_lock.acquire(blocking=wait):
+            return  # a refresh is already running; it checks _stale when done
+        try:
+            force = force or self._stale
+            self._stale = False
+            counter = db.counters.find_one({"_id": COUNTER_ID}) or {}
+            version = counter.get("version", 0)
+            if not force and self._datasets is not None and version == self._version:
+                self._failing_since = None
+                return
+
+            makers = list(db.manufacturers.find({}, MANUFACTURER_FIELDS).sort("name", 1))
+            intervals = dict(DEFAULT_INTERVALS)
+            service_types = _service_types()
+            self._datasets = {
+                "manufacturers": _Dataset([manufacturer_schema.dump(m) for m in makers], makers),
+                "service_types": _Dataset(service_types, service_types),
+                "intervals": _Dataset(intervals, sorted(intervals.items())),
+            }
+            self._version = version
+            self._failing_since = None
+            logger.info("Reference data loaded: %d manufacturers (v%s)", len(makers), version)
+        except Exception as e:
+            logger.warning("Reference data refresh failed: %s", e)
+            if self._failing_since is None:
+                self._failing_since = time.monotonic()
+            self._stale = self._stale or force  # retried on the next check
+        finally:
+            self._refresh_lock.release()
+
+        if self._stale and self._failing_since is None:
+            self._spawn_refresh()
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "version": self._version,
+            "lag_seconds": round(time.monotonic() - self._failing_since, 1) if self._failing_since else 0,
+        }
+
+    # --- Serving ---
+
+    def get(self, name):
+        """The dataset `name`; loads inline if the startup load has not finished."""
+        self.maybe_refresh()
+        if self._datasets is None:
+            self._refresh(force=True, wait=True)
+        if self._datasets is None:
+            raise RuntimeError("Reference data unavailable")
+        return self._datasets[name]
+
+    def serve(self, name, req, response_class):
+        """304 or the stored bytes, already compressed when the client accepts it."""
+        dataset = self.get(name)
+        held = caching.matching_etag(req, dataset.etag)
+        if held:
+            return caching.not_modified(held, response_class)
+
+        response = caching.tagged_body(dataset.body, dataset.etag, response_class)
+        if len(dataset.body) >= caching.COMPRESS_MIN_BYTES:
+            encoding = caching.negotiate_encoding(req)
+            if encoding:
+                caching.apply_encoding(response, dataset.encoded(encoding), encoding)
+        return response
+
+
+reference_data = ReferenceData()
+register_worker("reference_data", reference_data.status)
+invalidation_bus.subscribe("manufacturers", reference_data.on_changes)
@@ -0,0 +1,171 @@
+"""
+backend/services/search.py
+Prefix search keys for the admin typeahead
+
+Users and vehicles carry a `search_keys` array of normalized strings,
+covered by a multikey index, so a typeahead query is an anchored regex
+(`^term`) that the index answers as a range scan:
+
+- users:    email, full name and each word of the name (lower case,
+            accents stripped, whitespace collapsed)
+- vehicles: license plate and VIN, upper/lower case, spaces and dashes
+            ignored ("ab-12 c" finds "AB12C")
+
+Write paths set the keys with user_search_keys() / vehicle_search_keys().
+Documents written before (or by another version of the normalization)
+are rebuilt once at startup; the version lives in `counters`.
+"""
+
+import re
+import unicodedata
+from pymongo import UpdateOne
+from backend.models import db
+from backend.log import get_logger
+
+logger = get_logger("search")
+
+SEARCH_KEYS_VERSION = 1
+MIN_QUERY_LENGTH = 2
+BACKFILL_BATCH = 500
+
+# Rank of a hit: lower is better
+EXACT, FIELD_PREFIX, WORD_PREFIX = 0, 1, 2
+
+
+def normalize_text(value):
+    """Lower case, no accents, single spaces."""
+    if not value:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(text.split())
+
+
+def compact(value):
+    """Letters and digits only, for plates and VINs."""
+    return re.sub(r"[^a-z0-9]", "", normalize_text(value))
+
+
+def user_search_keys(user):
+    email = normalize_text(user.get('email'))
+    name = normalize_text(user.get('full_name'))
+    keys = {email, name, *name.split(" ")}
+    keys.discard("")
+    return sorted(keys)
+
+
+def vehicle_search_keys(vehicle):
+    keys = {compact(vehicle.get('license_plate')), compact(vehicle.get('vin'))}
+    keys.discard("")
+    return sorted(keys)
+
+
+def _prefix(term):
+    return {"$regex": "^" + re.escape(term)}
+
+
+def _rank(term, primary, keys):
+    """Best rank among `keys` starting with `term`; primary keys rank above name words."""
+    best = None
+    for key in keys:
+        if not key.startswith(term):
+            continue
+        if key == term and key in primary:
+            rank = EXACT
+        elif key in primary:
+            rank = FIELD_PREFIX
+        else:
+            rank = WORD_PREFIX
+        if best is None or (rank, len(key)) < best:
+            best = (rank, len(key))
+    return best
+
+
+def search(source, query, limit):
+    """
+    Users matching `query` by email / name, or owning a vehicle matching
+    it by plate / VIN, best first. Returns [(user, vehicles, matches)]
+    where matches lists what matched ("email", "name", "plate", "vin").
+    """
+    term = normalize_text(query)
+    plate_term = compact(query)
+    candidates = limit * 3
+    hits = {}  # user id -> [rank, matches]
+
+    if len(term) >= MIN_QUERY_LENGTH:
+        for user in source.users.find({"search_keys": _prefix(term)}, {"email": 1, "full_name": 1}).limit(candidates):
+            email, name = normalize_text(user.get('email')), normalize_text(user.get('full_name'))
+            rank = _rank(term, {email, name}, user_search_keys(user))
+            if rank is None:
+                continue
+            matches = []
+            if email.startswith(term):
+                matches.append("email")
+            if any(key.startswith(term) for key in {name, *name.split(" ")} if key):
+                matches.append("name")
+            hits[user['_id']] = [rank, matches]
+
+    if len(plate_term) >= MIN_QUERY_LENGTH:
+        for vehicle in source.vehicles.find(
+            {"search_keys": _prefix(plate_term)}, {"user_id": 1, "license_plate": 1, "vin": 1}
+        ).limit(candidates):
+            plate, vin = compact(vehicle.get('license_plate')), compact(vehicle.get('vin'))
+            rank = _rank(plate_term, {plate, vin}, [plate, vin])
+            if rank is None:
+                continue
+            field = "plate" if plate.startswith(plate_term) else "vin"
+            hit = hits.setdefault(vehicle['user_id'], [rank, []])
+            hit[0] = min(hit[0], rank)
+            hit[1].append(field)
+
+    ranked = sorted(hits.items(), key=lambda item: item[1][0])[:limit]
+    if not ranked:
+        return []
+
+    ids = [user_id for user_id, _ in ranked]
+    users = {u['_id']: u for u in source.users.find({"_id": {"$in": ids}})}
+    vehicles = {}
+    for vehicle in source.vehicles.find(
+        {"user_id": {"$in": ids}},
+        {"user_id": 1, "manufacturer": 1, "model": 1, "year": 1, "license_plate": 1, "is_active": 1}
+    ):
+        vehicles.setdefault(vehicle['user_id'], []).append(vehicle)
+
+    return [
+        (users[user_id], vehicles.get(user_id, []), sorted(set(matches)))
+        for user_id, (_, matches) in ranked if user_id in users
+    ]
+
+
+def ensure_search_keys():
+    """Rebuilds search_keys where they are missing or outdated (once per version)."""
+    try:
+        return _rebuild_search_keys()
+    except Exception as e:
+        # Never block startup on the backfill; the write paths keep new documents searchable
+        logger.warning("Search key rebuild failed (retried on next start): %s", e)
+        return 0
+
+
+def _rebuild_search_keys():
+    counter = db.counters.find_one({"_id": "search_keys"}) or {}
+    if counter.get("version") == SEARCH_KEYS_VERSION:
+        return 0
+
+    updated = 0
+    for collection, build, fields in (
+        (db.users, user_search_keys, {"email": 1, "full_name": 1}),
+        (db.vehicles, vehicle_search_keys, {"license_plate": 1, "vin": 1}),
+    ):
+        batch = []
+        for doc in collection.find({}, fields):
+            batch.append(UpdateOne({"_id": doc['_id']}, {"$set": {"search_keys": build(doc)}}))
+            if len(batch) == BACKFILL_BATCH:
+                updated += collection.bulk_write(batch, ordered=False).modified_count
+                batch = []
+        if batch:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+
+    db.counters.update_one({"_id": "search_keys"}, {"$set": {"version": SEARCH_KEYS_VERSION}}, upsert=True)
+    logger.info("Search keys rebuilt for %d documents (v%d)", updated, SEARCH_KEYS_VERSION)
+    return updated
@@ -0,0 +1,140 @@
+"""
+backend/services/tile_cache.py
+Geohash tile cache for /workshops/nearby
+
+Map panning produces a stream of slightly different lat/lng pairs. Each
+request is snapped to the centre of a geohash tile (coarser tiles for
+larger radii), so nearby users and small pans share one cached result
+set. Cached bodies carry a strong ETag, letting clients revalidate with
+a 304 instead of downloading the list again.
+
+Distances in a cached page are measured from the tile centre, i.e. they
+can be off by up to half a tile diagonal: ~0.7 km for radii up to 10 km
+(precision 6), ~3.4 km for the default 25 km radius (precision 5) and
+~22 km above 50 km (precision 4).
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from backend.services.workshop_index import workshop_index, haversine_m
+from backend.caching import compress
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# (max radius in meters, geohash precision): 1.2 x 0.6 km, 4.9 x 4.9 km, 39 x 20 km tiles
+TILE_PRECISIONS = [(10000, 6), (50000, 5), (float("inf"), 4)]
+MAX_ENTRIES = 2048
+MAX_AGE_SECONDS = 60
+
+
+def geohash_encode(lat, lng, precision):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_center(geohash):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+
+class _Entry:
+    __slots__ = ("body", "etag", "lat", "lng", "radius", "_encoded")
+
+    def __init__(self, body, lat, lng, radius):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        """Compressed body, computed once per encoding and kept with the entry."""
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.body, encoding)
+        return body
+
+
+class TileCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def snap(self, params):
+        """Returns a copy of the parsed nearby params moved to the tile centre."""
+        precision = next(p for max_radius, p in TILE_PRECISIONS if params['radius'] <= max_radius)
+        tile = geohash_encode(params['lat'], params['lng'], precision)
+        lat, lng = geohash_center(tile)
+        return {**params, "lat": lat, "lng": lng, "tile": tile}
+
+    def _key(self, params, cursor_token):
+        return (params['tile'], params['radius'], params['limit'], params['service'], cursor_token)
+
+    def get(self, params, cursor_token):
+        key = self._key(params, cursor_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, params, cursor_token, body):
+        entry = _Entry(body, params['lat'], params['lng'], params['radius'])
+        with self._lock:
+            self._entries[self._key(params, cursor_token)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, points=None):
+        """
+        Drops entries whose search circle covers any of the given
+        [lng, lat] points; everything when points is None.
+        """
+        with self._lock:
+            if points is None:
+                self._entries.clear()
+                return
+            stale = [key for key, entry in self._entries.items()
+                     if any(haversine_m(entry.lat, entry.lng, lat, lng) <= entry.radius
+                            for lng, lat in points)]
+            for key in stale:
+                del self._entries[key]
+
+
+tile_cache = TileCache()
+workshop_index.add_listener(tile_cache.invalidate)
@@ -0,0 +1,103 @@
+"""
+backend/services/timeline.py
+Vehicle timeline: service records, odometer readings, accidents and
+resolved (completed / cancelled) predictions in one date-ordered feed.
+
+Each source is an index-backed cursor already sorted newest first, limited
+to one page; heapq.merge interleaves them lazily, so a page never reads
+more than `limit + 1` documents per source no matter how long the history
+is. Pages are keyed on (date desc, source, _id desc), which is a total
+order across sources, so the cursor token resumes exactly after the last
+item shown.
+"""
+
+import heapq
+from itertools import islice
+from backend.models import (
+    db, service_record_schema, accident_history_schema, maintenance_prediction_schema
+)
+
+TIMELINE_KINDS = ("service", "odometer", "accident", "prediction")
+ODOMETER_TYPE = "odometer_update"
+
+
+class _Source:
+    def __init__(self, rank, collection, date_field, schema, base_query, kind_of):
+        self.rank = rank
+        self.collection = collection
+        self.date_field = date_field
+        self.schema = schema
+        self.base_query = base_query
+        self.kind_of = kind_of
+
+    def after(self, cursor):
+        """Filter for the items that come after the cursor in feed order."""
+        if cursor is None:
+            return {}
+        last_date, last_rank, last_id = cursor
+        if self.rank < last_rank:
+            return {self.date_field: {"$lt": last_date}}
+        if self.rank > last_rank:
+            return {self.date_field: {"$lte": last_date}}
+        return {"$or": [
+            {self.date_field: {"$lt": last_date}},
+            {self.date_field: last_date, "_id": {"$lt": last_id}}
+        ]}
+
+    def items(self, vehicle_id, cursor, count):
+        query = {"vehicle_id": vehicle_id, **self.base_query, **self.after(cursor)}
+        docs = self.collection.find(query).sort([(self.date_field, -1), ("_id", -1)]).limit(count)
+        for doc in docs:
+            yield (doc[self.date_field], -self.rank, doc["_id"]), self, doc
+
+
+def _sources(kinds):
+    sources = []
+    # Service records and odometer readings share a collection (and one cursor)
+    wanted_records = {"service", "odometer"} & kinds
+    if wanted_records:
+        query = {}
+        if wanted_records == {"service"}:
+            query = {"service_type": {"$ne": ODOMETER_TYPE}}
+        elif wanted_records == {"odometer"}:
+            query = {"service_type": ODOMETER_TYPE}
+        sources.append(_Source(
+            0, db.servicerecords, "service_date", service_record_schema, query,
+            lambda doc: "odometer" if doc.get("service_type") == ODOMETER_TYPE else "service"
+        ))
+    if "accident" in kinds:
+        sources.append(_Source(
+            1, db.accidenthistory, "accident_date", accident_history_schema, {},
+            lambda doc: "accident"
+        ))
+    if "prediction" in kinds:
+        sources.append(_Source(
+            2, db.maintenancepredictions, "resolved_at", maintenance_prediction_schema,
+            {"resolved_at": {"$type": "date"}},
+            lambda doc: "prediction"
+        ))
+    return sources
+
+
+def timeline_page(vehicle_id, kinds, limit, cursor=None):
+    """
+    Returns (items, next_cursor) for one page. `cursor` is the decoded
+    [date, source rank, _id] of the last item of the previous page.
+    """
+    streams = [source.items(vehicle_id, cursor, limit + 1) for source in _sources(set(kinds))]
+    merged = heapq.merge(*streams, key=lambda entry: entry[0], reverse=True)
+    page = list(islice(merged, limit + 1))
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        (date, neg_rank, last_id), _, _ = page[-1]
+        next_cursor = [date, -neg_rank, last_id]
+
+    items = [{
+        "kind": source.kind_of(doc),
+        "date": date.isoformat(),
+        "id": str(doc["_id"]),
+        "data": source.schema.dump(doc)
+    } for (date, _, _), source, doc in page]
+    return items, next_cursor
@@ -0,0 +1,322 @@
+"""
+backend/services/workshop_import.py
+Bulk workshop import from local OpenStreetMap extracts
+
+Reads OSM XML (.osm) or GeoJSON (FeatureCollection or one feature per
+line) as a stream, so memory does not grow with the file size. Every
+shop=car_repair element is mapped onto the WorkshopSchema fields, checked
+against existing workshops (and earlier rows of the same file) within a
+distance threshold, and written with unordered insert_many batches.
+
+Existing workshops are looked up in the in-process spatial index; if it
+cannot be loaded, each candidate is checked with a $nearSphere query
+instead, so a cold index never lets duplicates through.
+"""
+
+import io
+import json
+import math
+import xml.etree.ElementTree as ET
+from pymongo.errors import BulkWriteError
+from backend.log import get_logger
+from backend.models import db
+from backend.services.workshop_index import (
+    workshop_index, haversine_m, grid_cell, cell_span, ring_span, wrap_column, MAX_SCAN_RINGS
+)
+from backend.services.ratings import NO_RATINGS
+
+logger = get_logger("workshop_import")
+
+SHOP_TAGS = {"car_repair"}
+BATCH_SIZE = 1000
+DEFAULT_DEDUPE_METERS = 50.0
+MAX_DEDUPE_METERS = 1000.0
+DUPLICATE_KEY = 11000
+READ_CHUNK = 64 * 1024
+
+# OSM service:vehicle:<key>=yes  ->  services_offered value
+OSM_SERVICES = {
+    "car_repair": "general_repair",
+    "oil_change": "oil_change",
+    "tyres": "tires",
+    "brakes": "brake_service",
+    "batteries": "battery",
+    "air_conditioning": "air_conditioning",
+    "diagnostics": "diagnostics",
+    "electrical": "electrical",
+    "glass": "glass",
+    "body_repair": "body_repair",
+    "transmission": "transmission",
+}
+
+
+# --- Parsers: yield (osm_id, lat, lng, tags); lat/lng None when malformed ---
+
+def _coordinate(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def iter_osm_xml(fp):
+    context = ET.iterparse(fp, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or elem.tag not in ("node", "way", "relation"):
+            continue
+
+        tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+        if elem.tag == "node":
+            lat, lng = elem.get("lat"), elem.get("lon")
+        else:
+            # Ways/relations only carry a position when exported with centers
+            center = elem.find("center")
+            lat, lng = (center.get("lat"), center.get("lon")) if center is not None else (None, None)
+
+        if lat is not None and lng is not None:
+            yield f"{elem.tag}/{elem.get('id')}", _coordinate(lat), _coordinate(lng), tags
+
+        # Drop everything parsed so far; keeps memory flat
+        root.clear()
+
+
+def _iter_json_values(fp, buf, pos, closing=None):
+    """
+    Decodes consecutive JSON values from a text stream, skipping
+    separators, until `closing` (e.g. "]") or end of file.
+    """
+    decoder = json.JSONDecoder()
+    while True:
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,\x1e":
+                pos += 1
+            if pos < len(buf):
+                break
+            chunk = fp.read(READ_CHUNK)
+            if not chunk:
+                return
+            buf, pos = chunk, 0
+
+        if closing and buf[pos] == closing:
+            return
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                break
+            except json.JSONDecodeError:
+                chunk = fp.read(READ_CHUNK)
+                if not chunk:
+                    raise
+                buf, pos = buf[pos:] + chunk, 0
+
+        yield value
+        buf, pos = buf[end:], 0
+
+
+def _feature_point(geometry):
+    """[lng, lat] of a feature; None without a geometry, [None, None] when malformed."""
+    if not geometry:
+        return None
+    try:
+        coords = geometry.get("coordinates")
+        if geometry.get("type") == "Point":
+            return [_coordinate(coords[0]), _coordinate(coords[1])]
+        # Areas: cheap centroid of the outer ring
+        if geometry.get("type") == "MultiPolygon":
+            coords = coords[0] if coords else None
+        if geometry.get("type") in ("Polygon", "MultiPolygon") and coords and coords[0]:
+            ring = coords[0]
+            return [_coordinate(sum(p[0] for p in ring) / len(ring)),
+                    _coordinate(sum(p[1] for p in ring) / len(ring))]
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return [None, None]
+    return None
+
+
+def iter_geojson(fp):
+    buf = fp.read(READ_CHUNK)
+    head = buf.lstrip(" \t\r\n\x1e")
+
+    if head.startswith("{") and '"FeatureCollection"' in buf[:4096]:
+        # Stream the members of the "features" array
+        while True:
+            start = buf.find('"features"')
+            if start != -1:
+                bracket = buf.find("[", start)
+                if bracket != -1:
+                    break
+            chunk = fp.read(READ_CHUNK)
+            if not chunk:
+                return
+            buf += chunk
+        features = _iter_json_values(fp, buf, bracket + 1, closing="]")
+    else:
+        # GeoJSON text sequence / one feature per line
+        features = _iter_json_values(fp, buf, 0)
+
+    for feature in features:
+        if not isinstance(feature, dict):
+            continue
+        point = _feature_point(feature.get("geometry"))
+        if not point:
+            continue
+        props = feature.get("properties")
+        props = props if isinstance(props, dict) else {}
+        tags = props.get("tags", props)
+        tags = tags if isinstance(tags, dict) else {}
+        osm_id = props.get("@id") or props.get("id") or feature.get("id")
+        yield (str(osm_id) if osm_id else None), point[1], point[0], tags
+
+
+# --- Mapping ---
+
+def workshop_from_tags(osm_id, lat, lng, tags):
+    street = " ".join(filter(None, [tags.get("addr:housenumber"), tags.get("addr:street")]))
+    services = ["general_repair"]
+    for key, service in OSM_SERVICES.items():
+        if tags.get(f"service:vehicle:{key}") == "yes" and service not in services:
+            services.append(service)
+
+    return {
+        "name": tags.get("name") or tags.get("name:en") or "Car Repair",
+        "address": {
+            "street": street or None,
+            "city": tags.get("addr:city"),
+            "region": tags.get("addr:state") or tags.get("addr:province"),
+            "postal_code": tags.get("addr:postcode")
+        },
+        "phone_number": tags.get("phone") or tags.get("contact:phone"),
+        "operating_hours": tags.get("opening_hours"),
+        "services_offered": services,
+        **NO_RATINGS,
+        "is_active": True,
+        "osm_id": osm_id,
+        "location": {"type": "Point", "coordinates": [lng, lat]}
+    }
+
+
+# --- Import ---
+
+class _SeenPoints:
+    """Grid of points accepted during this import, for in-file dedupe."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def near(self, lat, lng, meters):
+        ci, cj = grid_cell(lat, lng)
+        rows, columns = cell_span(lat, meters)
+        columns = {wrap_column(cj + dj) for dj in range(-columns, columns + 1)}
+        for di in range(-rows, rows + 1):
+            for column in columns:
+                for plat, plng in self.cells.get((ci + di, column), ()):
+                    if haversine_m(lat, lng, plat, plng) <= meters:
+                        return True
+        return False
+
+    def add(self, lat, lng):
+        self.cells.setdefault(grid_cell(lat, lng), []).append((lat, lng))
+
+
+def _near_existing(lat, lng, meters):
+    """Mongo fallback for the spatial index: an active workshop within `meters`?"""
+    return db.workshops.find_one({
+        "is_active": True,
+        "location": {"$nearSphere": {
+            "$geometry": {"type": "Point", "coordinates": [lng, lat]},
+            "$maxDistance": meters
+        }}
+    }, {"_id": 1}) is not None
+
+
+def detect_format(filename, fp):
+    lowered = (filename or "").lower()
+    if lowered.endswith((".osm", ".xml")):
+        return "osm"
+    if lowered.endswith((".geojson", ".json", ".geojsonl", ".geojsons", ".ndjson")):
+        return "geojson"
+    head = fp.peek(64) if hasattr(fp, "peek") else b""
+    return "osm" if head.lstrip().startswith(b"<") else "geojson"
+
+
+def check_dedupe_meters(meters):
+    """Raises ValueError unless 0 <= meters <= MAX_DEDUPE_METERS."""
+    if not (isinstance(meters, (int, float)) and math.isfinite(meters) and 0 <= meters <= MAX_DEDUPE_METERS):
+        raise ValueError(f"dedupe_meters must be between 0 and {MAX_DEDUPE_METERS:g}")
+
+
+def import_workshops(path, dedupe_meters=DEFAULT_DEDUPE_METERS, file_format=None):
+    """
+    Imports a local extract. Returns counters:
+    parsed, inserted, duplicates (near an existing/earlier workshop or an
+    already imported OSM id), skipped (not a car repair shop, or no usable
+    position) and errors (rows the database rejected for another reason).
+    """
+    check_dedupe_meters(dedupe_meters)
+    stats = {"parsed": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "errors": 0}
+
+    # Existing catalogue comes from the in-process spatial index
+    workshop_index.ensure_loaded()
+    snapshot = workshop_index.snapshot
+    if snapshot is None:
+        logger.warning("Workshop index unavailable; checking duplicates against Mongo")
+        near_existing = _near_existing
+    else:
+        def near_existing(lat, lng, meters):
+            if ring_span(lat, meters) > MAX_SCAN_RINGS:
+                return _near_existing(lat, lng, meters)  # polar: too many grid rings
+            return bool(workshop_index.nearest(snapshot, lat, lng, 1, meters))
+    seen = _SeenPoints()
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        try:
+            result = db.workshops.insert_many(batch, ordered=False)
+            stats["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered: everything but the failed rows went in
+            stats["inserted"] += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == DUPLICATE_KEY:
+                    stats["duplicates"] += 1  # OSM id imported before
+                else:
+                    stats["errors"] += 1
+                    logger.error("Workshop insert failed: %s", error.get("errmsg"))
+        batch.clear()
+
+    with open(path, "rb") as raw:
+        file_format = file_format or detect_format(path, raw)
+        if file_format == "osm":
+            rows = iter_osm_xml(raw)
+        else:
+            rows = iter_geojson(io.TextIOWrapper(raw, encoding="utf-8"))
+
+        for osm_id, lat, lng, tags in rows:
+            stats["parsed"] += 1
+            if tags.get("shop") not in SHOP_TAGS:
+                stats["skipped"] += 1
+                continue
+            if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                stats["skipped"] += 1
+                continue
+
+            if seen.near(lat, lng, dedupe_meters) or near_existing(lat, lng, dedupe_meters):
+                stats["duplicates"] += 1
+                continue
+
+            seen.add(lat, lng)
+            batch.append(workshop_from_tags(osm_id, lat, lng, tags))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+        flush()
+
+    if stats["inserted"]:
+        workshop_index.bump_version()
+
+    return stats
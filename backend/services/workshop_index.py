@@ -0,0 +1,482 @@
+"""
+backend/services/workshop_index.py
+In-process spatial index of active workshops
+
+Workshops only change through the admin routes, so every worker keeps a
+compact copy of the active catalogue and answers nearby / k-nearest
+queries locally:
+
+- coordinates live in flat array('d') columns,
+- points are bucketed in a fixed lat/lng grid (CELL_DEGREES per cell),
+- each workshop carries a bitset of its services_offered.
+
+Workers learn about changes from the invalidation bus (change streams,
+see backend/invalidation.py): the snapshot is rebuilt in the background
+and listeners (response caches) are told where the changed workshops were
+and are now.
+
+Without change streams (standalone server) a version counter in
+`counters`, bumped on every admin change with the changed location logged
+to the capped `workshopchanges` collection, is polled instead.
+Until the first snapshot is built, callers fall back to Mongo.
+
+Ratings are not part of the spatial index, so a review never rebuilds
+it: every worker patches the rating fields of its cached document
+(patch_ratings) and drops the cached nearby pages around that workshop.
+The worker handling the review patches right away; the others fetch the
+new values when the bus reports an update to RATING_FIELDS or, without
+change streams, on their version check (rating_updated_at newer than the
+last one they saw).
+"""
+
+import math
+import heapq
+import threading
+import time
+from array import array
+from datetime import timedelta
+from pymongo import ReturnDocument
+from backend.models import db
+from backend.log import get_logger
+from backend.health import register_worker
+from backend.invalidation import invalidation_bus
+
+logger = get_logger("workshop_index")
+
+CELL_DEGREES = 0.1
+GRID_COLUMNS = int(round(360 / CELL_DEGREES))
+# Wider scans (polar latitudes, huge radii) are cheaper as a Mongo $geoNear
+MAX_SCAN_RINGS = 150
+EARTH_RADIUS_M = 6378100  # same sphere as Mongo's $geoNear
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+VERSION_CHECK_SECONDS = 5
+MAX_SERVICE_BITS = 64
+_ALL = "*"
+
+# Written by review changes (services/ratings.py); patched, never rebuilt
+RATING_FIELDS = ("rating_sum", "rating_count", "average_rating", "rating_updated_at")
+RATING_PROJECTION = {"average_rating": 1, "rating_count": 1, "rating_updated_at": 1}
+# Re-read ratings this far behind the newest one seen (writes commit out of order)
+RATING_POLL_OVERLAP = timedelta(seconds=30)
+
+WORKSHOP_FIELDS = {
+    "name": 1, "address": 1, "location": 1, "services_offered": 1,
+    "phone_number": 1, **RATING_PROJECTION
+}
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def grid_cell(lat, lng):
+    """(row, column) of the CELL_DEGREES grid cell holding the point."""
+    return (int(math.floor(lat / CELL_DEGREES)), wrap_column(int(math.floor(lng / CELL_DEGREES))))
+
+
+def wrap_column(column):
+    """Grid column modulo the globe, so columns east of 180 continue at -180."""
+    half = GRID_COLUMNS // 2
+    return (column + half) % GRID_COLUMNS - half
+
+
+def cell_span(lat, radius):
+    """
+    (rows, columns) around a point's cell that cover `radius` meters.
+    Columns narrow towards the poles; half of them already reach around
+    the whole globe.
+    """
+    cell_m = CELL_DEGREES * METERS_PER_DEGREE
+    lat_band = abs(lat) + radius / METERS_PER_DEGREE
+    width_m = cell_m * math.cos(math.radians(lat_band)) if lat_band < 90 else 0
+    if width_m * (GRID_COLUMNS // 2) <= radius:
+        columns = GRID_COLUMNS // 2  # reaches over the pole
+    else:
+        columns = int(radius / width_m) + 1
+    return int(radius / cell_m) + 1, columns
+
+
+def ring_span(lat, radius):
+    """Square grid rings around a point's cell that cover `radius` meters."""
+    return max(cell_span(lat, radius))
+
+
+class _Snapshot:
+    """View of the catalogue, swapped atomically on refresh; only rating fields are patched in place."""
+
+    def __init__(self, docs, version):
+        self.version = version
+        self.docs = []
+        self.ids = []
+        self.positions = {}
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.services = array('Q')
+        self.service_bits = {}
+        self.cells = {}
+
+        for doc in docs:
+            try:
+                lng, lat = doc['location']['coordinates']
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            pos = len(self.docs)
+            self.docs.append(doc)
+            self.ids.append(doc['_id'])
+            self.positions[doc['_id']] = pos
+            self.lats.append(lat)
+            self.lngs.append(lng)
+            self.services.append(self._service_mask(doc.get('services_offered') or []))
+            self.cells.setdefault(grid_cell(lat, lng), array('I')).append(pos)
+
+    def _service_mask(self, services):
+        mask = 0
+        for service in services:
+            bit = self.service_bits.get(service)
+            if bit is None:
+                if len(self.service_bits) >= MAX_SERVICE_BITS:
+                    continue
+                bit = self.service_bits[service] = len(self.service_bits)
+            mask |= 1 << bit
+        return mask
+
+
+class WorkshopIndex:
+    def __init__(self):
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refreshed_at = None
+        self._failing_since = None
+        self._refresh_lock = threading.Lock()
+        self._listeners = []
+        # Workshop ids changed according to the bus, not yet rebuilt (_ALL: unknown)
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        # Newest rating_updated_at applied (polling mode only)
+        self._ratings_seen = None
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot else None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    # --- Refresh ---
+
+    def add_listener(self, callback):
+        """
+        callback(points) runs after a rebuild with the [lng, lat] points that
+        changed, or None when they are unknown (treat as "everything").
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, points):
+        for callback in self._listeners:
+            try:
+                callback(points)
+            except Exception as e:
+                logger.exception("Workshop index listener failed")
+
+    def start(self):
+        """Builds the first snapshot in the background."""
+        self._checked_at = time.monotonic()
+        self._spawn_refresh(force=True)
+
+    def ensure_loaded(self):
+        """Blocking first load, for CLI commands and import jobs."""
+        if self._snapshot is None:
+            with self._refresh_lock:
+                pass  # let an in-flight refresh finish
+        if self._snapshot is None:
+            self._refresh(force=True)
+
+    def maybe_refresh(self):
+        """Cheap; schedules a background version check when one is due."""
+        if invalidation_bus.live and not self._dirty:
+            return  # changes are pushed to us
+        now = time.monotonic()
+        if now - self._checked_at >= VERSION_CHECK_SECONDS:
+            self._checked_at = now
+            self._spawn_refresh()
+
+    def on_changes(self, ids):
+        """Invalidation bus callback: these workshops changed (None = unknown)."""
+        with self._dirty_lock:
+            if ids is None:
+                self._dirty.add(_ALL)
+            else:
+                self._dirty.update(ids)
+        self._spawn_refresh()
+
+    def bump_version(self, coordinates=None):
+        """
+        Called after an admin change at `coordinates` ([lng, lat]): publish
+        a new version for all workers and rebuild locally.
+        """
+        counter = db.counters.find_one_and_update(
+            {"_id": "workshops"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if coordinates:
+            db.workshopchanges.insert_one({"version": counter["version"], "coordinates": coordinates})
+            self._notify([coordinates])
+        else:
+            self._notify(None)
+        self._spawn_refresh()
+
+    def patch_ratings(self, workshop_id, average_rating, rating_count):
+        """
+        Updates the rating of one cached workshop without a rebuild and
+        tells the listeners where it is. Returns True when it changed.
+        """
+        snap = self._snapshot
+        pos = snap.positions.get(workshop_id) if snap else None
+        if pos is None:
+            return False
+        doc = snap.docs[pos]
+        if doc.get("average_rating") == average_rating and doc.get("rating_count") == rating_count:
+            return False
+        # Swap the dict, so a page being serialized never sees half an update
+        snap.docs[pos] = {**doc, "average_rating": average_rating, "rating_count": rating_count}
+        self._notify([[snap.lngs[pos], snap.lats[pos]]])
+        return True
+
+    def on_rating_changes(self, ids):
+        """Invalidation bus callback for rating writes (made by any worker)."""
+        if ids is not None:  # None: on_changes rebuilds everything anyway
+            threading.Thread(target=self._sync_ratings, args=({"_id": {"$in": ids}},), daemon=True).start()
+
+    def _sync_ratings(self, query):
+        try:
+            for doc in db.workshops.find(query, RATING_PROJECTION):
+                self.patch_ratings(doc["_id"], doc.get("average_rating"), doc.get("rating_count", 0))
+                self._saw_rating(doc)
+        except Exception as e:
+            logger.warning("Workshop rating sync failed: %s", e)
+
+    def _saw_rating(self, doc):
+        updated_at = doc.get("rating_updated_at")
+        if updated_at and (self._ratings_seen is None or updated_at > self._ratings_seen):
+            self._ratings_seen = updated_at
+
+    def _poll_ratings(self):
+        if self._ratings_seen is None:
+            query = {"rating_updated_at": {"$exists": True}}
+        else:
+            query = {"rating_updated_at": {"$gt": self._ratings_seen - RATING_POLL_OVERLAP}}
+        self._sync_ratings(query)
+
+    def _spawn_refresh(self, force=False):
+        threading.Thread(target=self._refresh, args=(force,), daemon=True).start()
+
+    def _refresh(self, force=False):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # a refresh is already running; it picks up queued changes
+        dirty = set()
+        try:
+            while True:
+                with self._dirty_lock:
+                    dirty, self._dirty = self._dirty, set()
+
+                counter = db.counters.find_one({"_id": "workshops"}) or {}
+                version = counter.get("version", 0)
+                if not force and not dirty and self._snapshot and self._snapshot.version == version:
+                    if not invalidation_bus.live:
+                        self._poll_ratings()
+                    self._mark_refreshed()
+                    return
+
+                previous = self._snapshot
+                docs = db.workshops.find({"is_active": True}, WORKSHOP_FIELDS).sort("_id", 1)
+                self._snapshot = _Snapshot(docs, version)
+                for doc in self._snapshot.docs:
+                    self._saw_rating(doc)
+                logger.info("Workshop index loaded: %d workshops (v%s)", len(self._snapshot.docs), version)
+
+                if dirty:
+                    self._notify(self._moved_points(previous, self._snapshot, dirty))
+                else:
+                    self._notify(self._changed_points(previous, version))
+                self._mark_refreshed()
+                dirty = set()
+                force = False
+                if not self._dirty:
+                    break
+        except Exception as e:
+            logger.warning("Workshop index refresh failed: %s", e)
+            if self._failing_since is None:
+                self._failing_since = time.monotonic()
+            with self._dirty_lock:
+                self._dirty |= dirty  # retried on the next refresh
+        finally:
+            self._refresh_lock.release()
+
+        if self._dirty and self._failing_since is None:
+            self._spawn_refresh()  # queued while we were releasing the lock
+
+    def _mark_refreshed(self):
+        self._refreshed_at = time.monotonic()
+        self._failing_since = None
+
+    def status(self):
+        """For the readiness report: lag counts only while refreshes fail."""
+        return {
+            "ready": self.ready,
+            "version": self.version,
+            "lag_seconds": round(time.monotonic() - self._failing_since, 1) if self._failing_since else 0,
+        }
+
+    @staticmethod
+    def _moved_points(previous, current, ids):
+        """Old and new [lng, lat] of the changed workshops (None = unknown)."""
+        if previous is None or _ALL in ids:
+            return None
+        points = []
+        for snap in (previous, current):
+            for workshop_id in ids:
+                pos = snap.positions.get(workshop_id)
+                if pos is not None:
+                    points.append([snap.lngs[pos], snap.lats[pos]])
+        return points
+
+    def _changed_points(self, previous, version):
+        if previous is None or version <= previous.version:
+            return None
+        changes = list(db.workshopchanges.find(
+            {"version": {"$gt": previous.version, "$lte": version}},
+            {"coordinates": 1}
+        ))
+        if len(changes) != version - previous.version:
+            return None  # some changes rolled out of the capped log
+        return [change["coordinates"] for change in changes]
+
+    # --- Queries ---
+
+    def search(self, params):
+        """
+        Answers a parsed /workshops/nearby request (see parse_nearby_args).
+        Returns up to limit + 1 documents in page order, or None when the
+        index is not loaded yet.
+        """
+        self.maybe_refresh()
+        snap = self._snapshot
+        if snap is None:
+            return None
+
+        service_bit = 0
+        if params['service']:
+            bit = snap.service_bits.get(params['service'])
+            if bit is None:
+                return []
+            service_bit = 1 << bit
+
+        if params['lat'] is None:
+            return self._by_id(snap, service_bit, params['cursor'], params['limit'] + 1)
+        if ring_span(params['lat'], params['radius']) > MAX_SCAN_RINGS:
+            return None
+
+        hits = self.nearest(snap, params['lat'], params['lng'], params['limit'] + 1,
+                            params['radius'], service_bit, params['cursor'])
+        return [{**snap.docs[pos], "distance_m": dist} for dist, pos in hits]
+
+    def _by_id(self, snap, service_bit, cursor, count):
+        start = 0
+        if cursor:
+            # ids are sorted, so resume with a binary search
+            lo, hi = 0, len(snap.ids)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if snap.ids[mid] <= cursor[1]:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            start = lo
+
+        results = []
+        for pos in range(start, len(snap.ids)):
+            if service_bit and not snap.services[pos] & service_bit:
+                continue
+            results.append(snap.docs[pos])
+            if len(results) == count:
+                break
+        return results
+
+    def nearest(self, snap, lat, lng, k, radius, service_bit=0, after=None):
+        """
+        k nearest within radius, ordered by (distance, _id), strictly after
+        the `after` (distance, _id) key. Scans grid rings outwards (columns
+        wrap at the antimeridian) and stops once no unvisited cell can hold
+        a closer point; search() leaves scans over MAX_SCAN_RINGS to Mongo.
+        Returns [(distance_m, position)].
+        """
+        ci, cj = grid_cell(lat, lng)
+        best = []  # max-heap on (distance, id) via negation, size <= k
+
+        for ring in range(ring_span(lat, radius) + 1):
+            for cell in self._ring_cells(ci, cj, ring):
+                for pos in snap.cells.get(cell, ()):
+                    if service_bit and not snap.services[pos] & service_bit:
+                        continue
+                    dist = haversine_m(lat, lng, snap.lats[pos], snap.lngs[pos])
+                    if dist > radius:
+                        continue
+                    key = (dist, snap.ids[pos])
+                    if after and key <= (after[0], after[1]):
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, _Hit(key, pos))
+                    elif key < best[0].key:
+                        heapq.heapreplace(best, _Hit(key, pos))
+
+            # Anything outside this ring is at least ring * cell size away
+            if len(best) == k and best[0].key[0] <= ring * self._min_cell_m(lat, ring):
+                break
+
+        return [(hit.key[0], hit.pos) for hit in sorted(best, key=lambda h: h.key)]
+
+    def _min_cell_m(self, lat, ring):
+        edge_lat = min(90.0, abs(lat) + (ring + 1) * CELL_DEGREES)
+        return CELL_DEGREES * METERS_PER_DEGREE * max(math.cos(math.radians(edge_lat)), 0.0)
+
+    @staticmethod
+    def _ring_cells(ci, cj, ring):
+        if ring == 0:
+            yield (ci, cj)
+            return
+        for dj in range(-ring, ring + 1):
+            yield (ci - ring, wrap_column(cj + dj))
+            yield (ci + ring, wrap_column(cj + dj))
+        for di in range(-ring + 1, ring):
+            yield (ci + di, wrap_column(cj - ring))
+            yield (ci + di, wrap_column(cj + ring))
+
+
+class _Hit:
+    """Heap entry ordered so the worst (farthest) hit sits on top."""
+    __slots__ = ("key", "pos")
+
+    def __init__(self, key, pos):
+        self.key = key
+        self.pos = pos
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+workshop_index = WorkshopIndex()
+register_worker("workshop_index", workshop_index.status)
+invalidation_bus.subscribe("workshops", workshop_index.on_changes, ignore_fields=RATING_FIELDS)
+invalidation_bus.subscribe("workshops", workshop_index.on_rating_changes, only_fields=RATING_FIELDS)
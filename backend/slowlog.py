@@ -0,0 +1,224 @@
+"""
+backend/slowlog.py
+Slow MongoDB operation capture
+
+A CommandListener notices every command slower than SLOW_QUERY_MS and
+records its collection, duration, the route that issued it and the shape
+of its filter (literal values replaced by their type, so no user data is
+stored). A sample of them is re-run with explain("executionStats") to show
+the winning plan and how many keys/documents were examined.
+
+All recording and explaining happens on a background thread; the request
+that ran the slow command never waits for it. Records go to the capped
+`slowqueries` collection (see GET /api/admin/slow-queries).
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pymongo import monitoring
+from backend.metrics import current_endpoint
+from backend.log import get_logger
+
+logger = get_logger("slowlog")
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+# Fraction of slow operations that get an explain plan
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get("SLOW_QUERY_EXPLAIN_RATE", "0.2"))
+# The same query shape is explained at most once per interval
+EXPLAIN_INTERVAL_SECONDS = 600
+MAX_PENDING = 100
+
+COLLECTION = "slowqueries"
+
+# Where the filter lives in each command
+_FILTER_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort", "update"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+_EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# Session / cluster fields explain must not carry over
+_STRIP_FIELDS = {"lsid", "$clusterTime", "$db", "txnNumber", "$readPreference",
+                 "readConcern", "writeConcern", "cursor", "autocommit", "startTransaction"}
+_IGNORED_COMMANDS = {"explain", "getMore", "killCursors", "endSessions", "hello", "isMaster", "ping"}
+
+
+def redact(value):
+    """Keeps keys and operators, replaces literal values with their type name."""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Arrays of same-shaped items collapse to one ($in lists, pipelines keep order)
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    if value is None or isinstance(value, bool):
+        return value
+    return type(value).__name__
+
+
+def command_shape(command_name, command):
+    shape = {}
+    for field in _FILTER_FIELDS.get(command_name, ()):
+        if field in command:
+            value = command[field]
+            if command_name in ("update", "delete"):
+                # Only the match part of each statement
+                value = [{"q": stmt.get("q")} for stmt in value]
+            shape[field] = value if field == "key" else redact(value)
+    return shape
+
+
+def _stages(plan):
+    """Flattens a winning plan into its stage names, outermost first."""
+    names = []
+    while isinstance(plan, dict):
+        if "stage" in plan:
+            names.append(plan["stage"])
+        if "queryPlan" in plan:
+            plan = plan["queryPlan"]
+        elif "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            plan = plan["inputStages"][0]
+        else:
+            break
+    return names
+
+
+def summarize_explain(result):
+    # find/count/etc. answer at the top level; aggregate nests under stages[0].$cursor
+    if "stages" in result and result["stages"]:
+        result = result["stages"][0].get("$cursor", result)
+    planner = result.get("queryPlanner", {})
+    stats = result.get("executionStats", {})
+    stages = _stages(planner.get("winningPlan", {}))
+    return {
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages,
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, explain_rate=SLOW_QUERY_EXPLAIN_RATE):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self._inflight = {}
+        self._explained_at = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slowlog")
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def started(self, event):
+        if not self.enabled or event.command_name in _IGNORED_COMMANDS:
+            return
+        if event.command.get(event.command_name) == COLLECTION:
+            return  # our own writes
+        self._inflight[(event.connection_id, event.request_id)] = (
+            event.command, event.database_name, current_endpoint()
+        )
+
+    def succeeded(self, event):
+        self._finish(event, None)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "failed")))
+
+    def _finish(self, event, error):
+        started = self._inflight.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        with self._lock:
+            if self._pending >= MAX_PENDING:
+                return  # never let a slow database pile up work here
+            self._pending += 1
+        command, database, endpoint = started
+        self._executor.submit(self._record, event.command_name, command, database,
+                              endpoint, duration_ms, error)
+
+    def _record(self, command_name, command, database, endpoint, duration_ms, error):
+        try:
+            from backend.models import client
+
+            shape = command_shape(command_name, command)
+            shape_key = hashlib.sha1(
+                f"{command_name}:{json.dumps(shape, sort_keys=True, default=str)}".encode()
+            ).hexdigest()[:16]
+            record = {
+                "ts": datetime.utcnow(),
+                "collection": command.get(command_name) if isinstance(command.get(command_name), str) else None,
+                "command": command_name,
+                "duration_ms": round(duration_ms, 1),
+                "route": endpoint,
+                "shape": shape,
+                "shape_key": shape_key,
+                "error": error,
+                "explain": None,
+            }
+
+            if self._should_explain(command_name, command, shape_key):
+                try:
+                    explain_cmd = {k: v for k, v in command.items() if k not in _STRIP_FIELDS}
+                    result = client[database].command(
+                        {"explain": explain_cmd, "verbosity": "executionStats"}
+                    )
+                    record["explain"] = summarize_explain(result)
+                except Exception as e:
+                    record["explain"] = {"error": str(e)}
+
+            logger.warning("Slow %s on %s: %.1f ms", command_name, record["collection"], duration_ms,
+                           extra={"route": endpoint, "shape_key": shape_key})
+            client[database][COLLECTION].insert_one(record)
+        except Exception as e:
+            logger.warning("Slow query log failed: %s", e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _should_explain(self, command_name, command, shape_key):
+        if command_name not in _EXPLAINABLE or random.random() >= self.explain_rate:
+            return False
+        if command_name == "aggregate" and any(
+            "$out" in stage or "$merge" in stage for stage in command.get("pipeline", ())
+        ):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained_at.get(shape_key, -EXPLAIN_INTERVAL_SECONDS) < EXPLAIN_INTERVAL_SECONDS:
+                return False
+            self._explained_at[shape_key] = now
+            if len(self._explained_at) > 10000:
+                self._explained_at.clear()
+        return True
+
+
+slow_query_listener = SlowQueryListener()
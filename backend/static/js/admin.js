@@ -36,69 +36,141 @@ function setupAddMakerForm() {
 function setupAddWorkshopForm() {
 }
 
-// ---: Fetch and Render Users ---
-async function fetchAndRenderUsers() {
+// ---: Fetch and Render Users (paged) ---
+function renderUserRow(u) {
+    const tr = document.createElement('tr');
+    tr.style.borderBottom = "1px solid #f0f0f0";
+    
+    const vehStr = u.vehicles.length > 0 
+        ? u.vehicles.map(v => `${v.manufacturer} ${v.model}`).join(", ") 
+        : '<span style="color:#aaa;">No vehicles</span>';
+
+    // Telegram status
+    const tgStatus = u.telegram_chat_id 
+        ? `<span style="color:#0088cc; font-weight:bold;"> Linked</span>` 
+        : `<span style="color:#ccc;">No</span>`;
+    
+    // Active status
+    const isActive = u.is_active !== false; // Default true if field missing
+    const statusLabel = isActive 
+        ? "<span style='color:green; font-weight:bold;'>Active</span>" 
+        : "<span style='color:red; font-weight:bold;'>Suspended</span>";
+    
+    // Button Styles
+    const btnColor = isActive ? "#ff4757" : "#28a745"; // Red for Ban, Green for Unban
+    const btnText = isActive ? "Ban" : "Unban";
+
+    tr.innerHTML = `
+        <td style="padding: 12px;"><strong>${u.full_name}</strong></td>
+        <td style="padding: 12px; color:#555;">${u.email}</td>
+        <td style="padding: 12px; font-size:13px;">${vehStr}</td>
+        <td style="padding: 12px; font-size:13px;">${tgStatus}</td>
+        <td style="padding: 12px; font-size:13px;" id="status-${u._id}">${statusLabel}</td>
+        <td style="padding: 12px;">
+            <button onclick="toggleBan('${u._id}')" 
+                style="background:${btnColor}; color:white; border:none; padding:6px 14px; border-radius:6px; cursor:pointer; font-size:12px; font-weight:bold;"
+                id="btn-${u._id}">
+                ${btnText}
+            </button>
+        </td>
+    `;
+    return tr;
+}
+
+let usersNextCursor = null;
+
+async function fetchAndRenderUsers(append = false) {
     const tbody = document.getElementById('users-table-body');
+    const moreBtn = document.getElementById('users-load-more');
     if(!tbody) return;
 
+    const params = new URLSearchParams({ limit: 50 });
+    if (append && usersNextCursor) params.set('cursor', usersNextCursor);
+
     try {
-        const res = await fetch('/api/admin/users');
+        if (moreBtn) moreBtn.disabled = true;
+        const res = await fetch(`/api/admin/users?${params}`);
         if(!res.ok) throw new Error("Failed to fetch");
-        const users = await res.json();
-        
-        tbody.innerHTML = "";
+        const page = await res.json();
+        const users = page.users;
+        usersNextCursor = page.next_cursor;
+
+        if (!append) tbody.innerHTML = "";
         
-        if (users.length === 0) {
+        if (!append && users.length === 0) {
             tbody.innerHTML = `<tr><td colspan="6" style="padding:20px; text-align:center;">No users found.</td></tr>`;
-            return;
         }
 
-        users.forEach(u => {
-            const tr = document.createElement('tr');
-            tr.style.borderBottom = "1px solid #f0f0f0";
-            
-            const vehStr = u.vehicles.length > 0 
-                ? u.vehicles.map(v => `${v.manufacturer} ${v.model}`).join(", ") 
-                : '<span style="color:#aaa;">No vehicles</span>';
-
-            // Telegram status
-            const tgStatus = u.telegram_chat_id 
-                ? `<span style="color:#0088cc; font-weight:bold;"> Linked</span>` 
-                : `<span style="color:#ccc;">No</span>`;
-            
-            // Active status
-            const isActive = u.is_active !== false; // Default true if field missing
-            const statusLabel = isActive 
-                ? "<span style='color:green; font-weight:bold;'>Active</span>" 
-                : "<span style='color:red; font-weight:bold;'>Suspended</span>";
-            
-            // Button Styles
-            const btnColor = isActive ? "#ff4757" : "#28a745"; // Red for Ban, Green for Unban
-            const btnText = isActive ? "Ban" : "Unban";
-
-            tr.innerHTML = `
-                <td style="padding: 12px;"><strong>${u.full_name}</strong></td>
-                <td style="padding: 12px; color:#555;">${u.email}</td>
-                <td style="padding: 12px; font-size:13px;">${vehStr}</td>
-                <td style="padding: 12px; font-size:13px;">${tgStatus}</td>
-                <td style="padding: 12px; font-size:13px;" id="status-${u._id}">${statusLabel}</td>
-                <td style="padding: 12px;">
-                    <button onclick="toggleBan('${u._id}')" 
-                        style="background:${btnColor}; color:white; border:none; padding:6px 14px; border-radius:6px; cursor:pointer; font-size:12px; font-weight:bold;"
-                        id="btn-${u._id}">
-                        ${btnText}
-                    </button>
-                </td>
-            `;
-            tbody.appendChild(tr);
-        });
+        users.forEach(u => tbody.appendChild(renderUserRow(u)));
+
+        if (moreBtn) moreBtn.style.display = usersNextCursor ? "block" : "none";
+
+    } catch(e) {
+        console.error(e);
+        if (!append) {
+            tbody.innerHTML = `<tr><td colspan="6" style="padding:20px; text-align:center; color:red;">Error loading users.</td></tr>`;
+        } else {
+            alert("Error loading more users.");
+        }
+    } finally {
+        if (moreBtn) moreBtn.disabled = false;
+    }
+}
+
+// ---: Typeahead Search (users, plates, VINs) ---
+const SEARCH_MIN_LENGTH = 2;
+const SEARCH_DEBOUNCE_MS = 200;
+let searchTimer = null;
+let searchController = null;
 
+async function searchUsers(query) {
+    const tbody = document.getElementById('users-table-body');
+    const moreBtn = document.getElementById('users-load-more');
+    if(!tbody) return;
+
+    // Only the latest keystroke's request may render
+    if (searchController) searchController.abort();
+    searchController = new AbortController();
+
+    const params = new URLSearchParams({ q: query, limit: 10 });
+    try {
+        const res = await fetch(`/api/admin/search?${params}`, { signal: searchController.signal });
+        if(!res.ok) throw new Error("Failed to search");
+        const page = await res.json();
+
+        if (moreBtn) moreBtn.style.display = "none";
+        tbody.innerHTML = "";
+        if (page.users.length === 0) {
+            tbody.innerHTML = `<tr><td colspan="6" style="padding:20px; text-align:center;">No matches.</td></tr>`;
+        }
+        page.users.forEach(u => tbody.appendChild(renderUserRow(u)));
     } catch(e) {
+        if (e.name === "AbortError") return;
         console.error(e);
-        tbody.innerHTML = `<tr><td colspan="6" style="padding:20px; text-align:center; color:red;">Error loading users.</td></tr>`;
+        tbody.innerHTML = `<tr><td colspan="6" style="padding:20px; text-align:center; color:red;">Error searching users.</td></tr>`;
     }
 }
 
+function setupUserSearch() {
+    const input = document.getElementById('admin-search');
+    if(!input) return;
+
+    input.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        const query = input.value.trim();
+        searchTimer = setTimeout(() => {
+            if (query.length >= SEARCH_MIN_LENGTH) {
+                searchUsers(query);
+            } else {
+                // Cleared: back to the paged list
+                if (searchController) searchController.abort();
+                usersNextCursor = null;
+                fetchAndRenderUsers();
+            }
+        }, SEARCH_DEBOUNCE_MS);
+    });
+}
+
 // --- 4. NEW: Ban/Unban Logic ---
 window.toggleBan = async (userId) => {
     if(!confirm("Are you sure you want to change this user's status?")) return;
@@ -142,5 +214,9 @@ window.toggleBan = async (userId) => {
 document.addEventListener("DOMContentLoaded", () => {
     setupAddMakerForm();
     setupAddWorkshopForm();
-    fetchAndRenderUsers(); // <-- Load the list
+    fetchAndRenderUsers(); // <-- Load the first page
+    setupUserSearch();
+
+    const moreBtn = document.getElementById('users-load-more');
+    if (moreBtn) moreBtn.addEventListener('click', () => fetchAndRenderUsers(true));
 });
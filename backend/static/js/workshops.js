@@ -60,19 +60,27 @@ function initMap() {
     }
 }
 
-// --- 2. Fetch Workshops ---
-async function fetchWorkshops() {
+// --- 2. Fetch Workshops (paged, nearest first) ---
+let loadedWorkshops = [];
+let nextCursor = null;
+
+async function fetchWorkshops(append = false) {
     const service = document.getElementById('service-filter').value;
-    const radius = 5000000; // Large radius to fetch all
 
     try {
-        const url = `${API_BASE_URL}/api/workshops/nearby?lat=${userLat}&lng=${userLng}&radius=${radius}&service=${service}`;
+        const params = new URLSearchParams({ lat: userLat, lng: userLng, service: service });
+        if (append && nextCursor) params.set('cursor', nextCursor);
+
+        const url = `${API_BASE_URL}/api/workshops/nearby?${params}`;
         
         const res = await fetch(url);
         const data = await res.json();
 
-        updateMapMarkers(data.workshops);
-        updateSidebarList(data.workshops);
+        loadedWorkshops = append ? loadedWorkshops.concat(data.workshops) : data.workshops;
+        nextCursor = data.next_cursor;
+
+        updateMapMarkers(loadedWorkshops);
+        updateSidebarList(loadedWorkshops);
 
     } catch (err) {
         console.error("Error fetching workshops:", err);
@@ -123,7 +131,7 @@ function updateMapMarkers(workshops) {
                 <div style="min-width: 180px; text-align: center;">
                     <h3 style="margin: 0 0 5px; font-size: 16px; font-weight: 700;">${w.name}</h3>
                     <p style="margin: 0 0 8px; color: #555; font-size: 13px;">${w.address}</p>
-                    <div style="margin-bottom: 10px; color: #f59e0b; font-weight: bold;">⭐ ${w.rating}</div>
+                    <div style="margin-bottom: 10px; color: #f59e0b; font-weight: bold;">${formatRating(w)}</div>
                     
                     <a href="${googleMapsUrl}" target="_blank" 
                        style="display: inline-block; background: #007aff; color: white; text-decoration: none; padding: 8px 16px; border-radius: 20px; font-size: 13px; font-weight: 600; box-shadow: 0 2px 5px rgba(0,0,0,0.2);">
@@ -152,6 +160,11 @@ async function deleteWorkshop(id) {
     } catch(e) { console.error(e); }
 }
 
+function formatRating(w) {
+    if (!w.rating_count) return "No reviews yet";
+    return `⭐ ${w.rating} (${w.rating_count})`;
+}
+
 // --- 4. Update Sidebar ---
 function updateSidebarList(workshops) {
     const list = document.getElementById('workshop-list');
@@ -168,7 +181,7 @@ function updateSidebarList(workshops) {
         item.innerHTML = `
             <div style="font-weight:bold;">${w.name}</div>
             <div style="font-size:0.9em; color:#666;">${w.address}</div>
-            <div style="font-size:0.8em; margin-top:4px;">⭐ ${w.rating}</div>
+            <div style="font-size:0.8em; margin-top:4px;">${formatRating(w)}${w.distance_m !== null ? ` · ${(w.distance_m / 1000).toFixed(1)} km` : ''}</div>
         `;
         
         item.addEventListener('click', () => {
@@ -181,6 +194,15 @@ function updateSidebarList(workshops) {
 
         list.appendChild(item);
     });
+
+    if (nextCursor) {
+        const more = document.createElement('button');
+        more.className = 'chip';
+        more.style.width = '100%';
+        more.innerText = 'Load more';
+        more.addEventListener('click', () => fetchWorkshops(true));
+        list.appendChild(more);
+    }
 }
 
 // --- 5. Admin Form Logic ---
@@ -243,7 +265,7 @@ document.addEventListener("DOMContentLoaded", () => {
     initMap();
     setupAdminLogic();
 
-    document.getElementById('service-filter').addEventListener('change', fetchWorkshops);
+    document.getElementById('service-filter').addEventListener('change', () => fetchWorkshops());
     document.getElementById('btn-refresh-loc').addEventListener('click', () => {
         if (navigator.geolocation) {
             navigator.geolocation.getCurrentPosition((pos) => {
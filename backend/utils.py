@@ -1,22 +1,53 @@
 import os
+import base64
 import requests
+from bson import json_util
+from backend.log import get_logger
+
+logger = get_logger("telegram")
 
 def send_telegram_message(chat_id, text):
     """
     Sends a message to a specific Telegram Chat ID.
     Returns True if successful, False otherwise.
     """
+    status = telegram_send_status(chat_id, text)
+    return status is not None and 200 <= status < 300
+
+def telegram_send_status(chat_id, text):
+    """
+    Like send_telegram_message, but tells failures apart: returns the Bot
+    API HTTP status, 0 when nothing was sent (missing token or chat id)
+    and None when the request itself failed (network error, timeout).
+    """
     # Get token inside the function 
     token = os.environ.get("TELEGRAM_BOT_TOKEN")
     
     if not token or not chat_id:
-        print("Error: Missing Token or Chat ID")
-        return False
+        logger.warning("Telegram message not sent: missing token or chat id")
+        return 0
     
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     try:
         response = requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=5)
-        return response.ok
+        return response.status_code
+    except Exception as e:
+        logger.error("Telegram request failed: %s", e)
+        return None
+
+def encode_cursor(values):
+    """
+    Packs the sort key of the last item on a page into an opaque,
+    URL-safe token for keyset pagination.
+    """
+    raw = json_util.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token):
+    """
+    Reverses encode_cursor. Raises ValueError on a malformed token.
+    """
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')))
     except Exception as e:
-        print(f"❌ Telegram Error: {e}")
-        return False
+        raise ValueError("Invalid cursor") from e
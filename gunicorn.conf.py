@@ -0,0 +1,26 @@
+"""
+Gunicorn settings (picked up automatically from the working directory).
+
+Each worker is a separate process, so Prometheus metrics are written to a
+shared directory and summed when /metrics is scraped.
+"""
+
+import os
+import shutil
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("GUNICORN_WORKERS", "4"))
+
+# Must be set before the workers import prometheus_client
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/motarilog-metrics")
+
+
+def on_starting(server):
+    # Samples from a previous run would be added to the new totals
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,422 @@
+"""
+loadtest.py
+Reproducible HTTP load test for the MotariLog API
+
+Boots a throwaway mongod (or uses --mongo-uri), seeds users, vehicles and
+workshops from a fixed random seed, starts the app with the given server
+command and drives these scenarios from concurrent virtual users:
+
+    login            POST /api/login (fresh session every time)
+    dashboard        GET /dashboard, /api/profile, /api/vehicles
+    vehicle_details  GET /api/vehicles/<id>, .../services, .../predictions
+    mileage_update   PUT /api/vehicles/<id>/mileage
+    nearby           GET /api/workshops/nearby around the seeded city
+
+Throughput, p50/p95/p99 latency and error rate per scenario are written
+to a JSON report, so runs can be compared between server configurations
+and releases:
+
+    python loadtest.py --duration 60 --concurrency 32 --out results/gunicorn.json
+    python loadtest.py --server "hypercorn --workers 4 --bind 127.0.0.1:{port} asgi:app" \\
+        --out results/hypercorn.json
+
+Rate limiting is switched off for the server under test (every virtual
+user logs in from 127.0.0.1).
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import requests
+from pymongo import MongoClient
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SERVER = "gunicorn --config=gunicorn.conf.py --bind=127.0.0.1:{port} run:app"
+PASSWORD = "loadtest-password"
+
+# Riyadh, same default centre as the workshop map
+CITY_LAT, CITY_LNG = 24.7136, 46.6753
+CITY_SPREAD_DEG = 0.3
+
+SCENARIO_WEIGHTS = {
+    "login": 1,
+    "dashboard": 4,
+    "vehicle_details": 4,
+    "mileage_update": 1,
+    "nearby": 6,
+}
+
+MANUFACTURERS = ["Toyota", "Honda", "Ford", "Hyundai", "Nissan", "Kia", "BMW"]
+SERVICE_TYPES = ["oil_change", "tire_rotation", "brake_service", "air_filter", "battery"]
+WORKSHOP_SERVICES = ["general_repair", "oil_change", "tires", "brake_service", "battery"]
+
+
+# --- Infrastructure ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until(check, timeout, what):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def start_mongod(binary):
+    dbpath = tempfile.mkdtemp(prefix="motarilog-loadtest-")
+    port = free_port()
+    proc = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT
+    )
+    uri = f"mongodb://127.0.0.1:{port}/motarilog_loadtest"
+    client = MongoClient(uri, serverSelectionTimeoutMS=500)
+    wait_until(lambda: client.admin.command("ping"), 30, "mongod")
+    client.close()
+    return proc, dbpath, uri
+
+
+def start_server(command, port, mongo_uri, log_path):
+    env = dict(os.environ, MONGO_URI=mongo_uri, RATE_LIMIT_ENABLED="0", FLASK_DEBUG="0")
+    log = open(log_path, "wb")
+    proc = subprocess.Popen(command.format(port=port), shell=True, cwd=ROOT, env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until(lambda: requests.get(f"{base_url}/api/manufacturers", timeout=2).ok, 60, "the app server")
+    return proc, base_url
+
+
+def stop(proc):
+    if proc and proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# --- Seed data ---
+
+def seed(mongo_uri, rng, users, vehicles_per_user, workshops, records_per_vehicle):
+    """Deterministic data set; returns [(email, [vehicle ids])]."""
+    db = MongoClient(mongo_uri).get_database()
+    for name in ("users", "vehicles", "servicerecords", "maintenancepredictions", "workshops"):
+        db[name].drop()
+
+    # bcrypt is deliberately slow; every seeded user shares one hash
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    now = datetime.utcnow()
+
+    accounts, vehicle_docs, record_docs = [], [], []
+    for i in range(users):
+        email = f"loadtest{i}@example.com"
+        user_id = db.users.insert_one({
+            "full_name": f"Load Test {i}", "email": email, "password_hash": password_hash,
+            "phone_number": None, "role": "user", "created_at": now - timedelta(days=i % 365),
+            "telegram_chat_id": None, "is_active": True
+        }).inserted_id
+
+        ids = []
+        for j in range(vehicles_per_user):
+            mileage = rng.randint(5000, 150000)
+            doc = {
+                "user_id": user_id, "manufacturer": rng.choice(MANUFACTURERS), "model": "Model",
+                "year": rng.randint(2005, 2024), "license_plate": f"LT-{i}-{j}",
+                "initial_mileage": mileage - 3000, "current_mileage": mileage,
+                "last_mileage_update": now, "created_at": now, "is_active": True
+            }
+            vehicle_docs.append(doc)
+            for k in range(records_per_vehicle):
+                record_docs.append({
+                    "vehicle_id": None, "service_type": rng.choice(SERVICE_TYPES),
+                    "service_date": now - timedelta(days=30 * (k + 1)),
+                    "mileage_at_service": mileage - 1000 * (k + 1), "cost": rng.randint(50, 900),
+                    "notes": "", "created_at": now, "created_by": user_id, "_vehicle": doc
+                })
+            ids.append(doc)
+        accounts.append((email, ids))
+
+    if vehicle_docs:
+        db.vehicles.insert_many(vehicle_docs)
+    for record in record_docs:
+        record["vehicle_id"] = record.pop("_vehicle")["_id"]
+    if record_docs:
+        db.servicerecords.insert_many(record_docs)
+
+    workshop_docs = [{
+        "name": f"Workshop {n}", "address": {"street": f"Street {n}"}, "phone_number": "",
+        "services_offered": rng.sample(WORKSHOP_SERVICES, rng.randint(1, 3)),
+        "rating_sum": 0, "rating_count": 0, "average_rating": None, "is_active": True,
+        "location": {"type": "Point", "coordinates": [
+            CITY_LNG + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+            CITY_LAT + rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG)
+        ]}
+    } for n in range(workshops)]
+    if workshop_docs:
+        db.workshops.insert_many(workshop_docs)
+    db.client.close()
+
+    return [(email, [str(v["_id"]) for v in docs]) for email, docs in accounts]
+
+
+# --- Scenarios ---
+
+class VirtualUser:
+    def __init__(self, base_url, email, vehicle_ids, rng):
+        self.base_url = base_url
+        self.email = email
+        self.vehicle_ids = vehicle_ids
+        self.rng = rng
+        self.http = requests.Session()
+
+    def login(self, http=None):
+        r = (http or self.http).post(f"{self.base_url}/api/login",
+                                     json={"email": self.email, "password": PASSWORD}, timeout=30)
+        return [r]
+
+    def dashboard(self):
+        return [self.http.get(f"{self.base_url}{path}", timeout=30)
+                for path in ("/dashboard", "/api/profile", "/api/vehicles")]
+
+    def vehicle_details(self):
+        vid = self.rng.choice(self.vehicle_ids)
+        return [self.http.get(f"{self.base_url}/api/vehicles/{vid}{suffix}", timeout=30)
+                for suffix in ("", "/services", "/predictions")]
+
+    def mileage_update(self):
+        vid = self.rng.choice(self.vehicle_ids)
+        current = self.http.get(f"{self.base_url}/api/vehicles/{vid}", timeout=30)
+        mileage = current.json().get("current_mileage", 0) if current.ok else 0
+        r = self.http.put(f"{self.base_url}/api/vehicles/{vid}/mileage",
+                          json={"current_mileage": mileage + self.rng.randint(10, 300)}, timeout=30)
+        return [current, r]
+
+    def nearby(self):
+        params = {
+            "lat": CITY_LAT + self.rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+            "lng": CITY_LNG + self.rng.uniform(-CITY_SPREAD_DEG, CITY_SPREAD_DEG),
+            "radius": self.rng.choice([5000, 10000, 25000]),
+        }
+        return [self.http.get(f"{self.base_url}/api/workshops/nearby", params=params, timeout=30)]
+
+    def run(self, name):
+        if name == "login":
+            # A new visitor: fresh cookie jar, so the server creates a session
+            with requests.Session() as http:
+                return self.login(http)
+        return getattr(self, name)()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {name: [] for name in SCENARIO_WEIGHTS}
+        self.errors = {name: 0 for name in SCENARIO_WEIGHTS}
+        self.error_examples = {}
+
+    def add(self, name, seconds, error):
+        with self.lock:
+            self.samples[name].append(seconds)
+            if error:
+                self.errors[name] += 1
+                self.error_examples.setdefault(name, error)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def drive(base_url, accounts, args, rng):
+    recorder = Recorder()
+    names = list(SCENARIO_WEIGHTS)
+    weights = [SCENARIO_WEIGHTS[n] for n in names if n in args.scenarios]
+    names = [n for n in names if n in args.scenarios]
+
+    warmup_until = time.monotonic() + args.warmup
+    stop_at = warmup_until + args.duration
+    failures = []
+
+    def worker(index):
+        local_rng = random.Random(rng.random())
+        email, vehicle_ids = accounts[index % len(accounts)]
+        user = VirtualUser(base_url, email, vehicle_ids, local_rng)
+        try:
+            if not user.login()[0].ok:
+                failures.append(f"login failed for {email}")
+                return
+        except requests.RequestException as e:
+            failures.append(str(e))
+            return
+
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            name = local_rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            error = None
+            try:
+                responses = user.run(name)
+                bad = [r for r in responses if r.status_code >= 400]
+                if bad:
+                    error = f"HTTP {bad[0].status_code} {bad[0].request.method} {bad[0].url}"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if now >= warmup_until:
+                recorder.add(name, elapsed, error)
+            if args.think_ms:
+                time.sleep(local_rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if failures:
+        print(f"{len(failures)} virtual users could not start, e.g. {failures[0]}")
+    return recorder
+
+
+def summarize(recorder, duration):
+    scenarios, total = {}, 0
+    for name, samples in recorder.samples.items():
+        if not samples:
+            continue
+        samples.sort()
+        total += len(samples)
+        errors = recorder.errors[name]
+        scenarios[name] = {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / duration, 2),
+            "error_rate": round(errors / len(samples), 4),
+            "errors": errors,
+            "latency_ms": {
+                "p50": round(percentile(samples, 0.50) * 1000, 2),
+                "p95": round(percentile(samples, 0.95) * 1000, 2),
+                "p99": round(percentile(samples, 0.99) * 1000, 2),
+                "max": round(samples[-1] * 1000, 2),
+            },
+            "first_error": recorder.error_examples.get(name),
+        }
+    return {"total_rps": round(total / duration, 2), "scenarios": scenarios}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MotariLog HTTP load test")
+    parser.add_argument("--server", default=DEFAULT_SERVER,
+                        help="command that starts the app; {port} is substituted")
+    parser.add_argument("--base-url", help="test an already running server instead of starting one")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary for the throwaway database")
+    parser.add_argument("--mongo-uri", help="use this database instead of starting mongod (it is reseeded!)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--vehicles-per-user", type=int, default=2)
+    parser.add_argument("--records-per-vehicle", type=int, default=5)
+    parser.add_argument("--workshops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between scenarios")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIO_WEIGHTS),
+                        choices=list(SCENARIO_WEIGHTS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="loadtest-results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+    mongod = server = dbpath = None
+
+    try:
+        mongo_uri = args.mongo_uri
+        if not mongo_uri and not args.base_url:
+            print("Starting mongod...")
+            mongod, dbpath, mongo_uri = start_mongod(args.mongod)
+
+        if mongo_uri:
+            print(f"Seeding {args.users} users, {args.workshops} workshops...")
+        accounts = seed(mongo_uri, rng, args.users, args.vehicles_per_user,
+                        args.workshops, args.records_per_vehicle) if mongo_uri else None
+        if not accounts:
+            raise SystemExit("Nothing to test: seeding needs --mongo-uri (or a local mongod)")
+
+        base_url = args.base_url
+        if not base_url:
+            port = free_port()
+            log_path = os.path.splitext(args.out)[0] + ".server.log"
+            print(f"Starting server: {args.server.format(port=port)} (log: {log_path})")
+            server, base_url = start_server(args.server, port, mongo_uri, log_path)
+
+        print(f"Running {args.concurrency} virtual users for {args.warmup}s warmup + {args.duration}s...")
+        recorder = drive(base_url, accounts, args, rng)
+
+        report = {
+            "started_at": datetime.utcnow().isoformat() + "Z",
+            "revision": git_revision(),
+            "server": args.base_url or args.server,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "config": {key: getattr(args, key) for key in (
+                "users", "vehicles_per_user", "records_per_vehicle", "workshops", "concurrency",
+                "duration", "warmup", "think_ms", "scenarios", "seed")},
+            **summarize(recorder, args.duration),
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"\n{'scenario':<16}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+        for name, s in report["scenarios"].items():
+            lat = s["latency_ms"]
+            print(f"{name:<16}{s['throughput_rps']:>9}{lat['p50']:>10}{lat['p95']:>10}{lat['p99']:>10}"
+                  f"{s['error_rate']:>9.1%}")
+        print(f"\nTotal: {report['total_rps']} scenarios/s. Report written to {args.out}")
+
+    finally:
+        stop(server)
+        stop(mongod)
+        if dbpath:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+tests/test_digest_backoff.py
+Telegram digest outcomes and the retry backoff
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from bson.objectid import ObjectId
+
+from backend.services import notifications
+from backend.services.notifications import (
+    DigestNotifier, _outcome, retry_delay, SENT, RETRY, FAILED,
+    RETRY_SECONDS, MAX_SEND_ATTEMPTS
+)
+
+
+@pytest.mark.parametrize("status, outcome", [
+    (200, SENT), (204, SENT),
+    (None, RETRY), (429, RETRY), (500, RETRY), (502, RETRY),
+    (0, FAILED), (400, FAILED), (403, FAILED), (404, FAILED),
+])
+def test_outcome(status, outcome):
+    assert _outcome(status) == outcome
+
+
+def test_retry_delay_doubles():
+    assert [retry_delay(n) for n in range(1, 5)] == [
+        timedelta(seconds=RETRY_SECONDS * factor) for factor in (1, 2, 4, 8)
+    ]
+
+
+class FakeCollection:
+    def __init__(self, doc=None):
+        self.doc = doc
+        self.updates = []
+
+    def find_one(self, query, projection=None):
+        return self.doc
+
+    def update_one(self, query, update, upsert=False):
+        self.updates.append((query, update, upsert))
+
+
+class FakeDb:
+    def __init__(self, user):
+        self.users = FakeCollection(user)
+        self.notificationdigests = FakeCollection()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDb({"_id": ObjectId(), "full_name": "Sara", "telegram_chat_id": "42"})
+    monkeypatch.setattr(notifications, "db", fake)
+    return fake
+
+
+def _bucket(attempts=None):
+    bucket = {"_id": ObjectId(), "alerts": {"oil_change": {"service_type": "oil_change"}},
+              "window": "daily", "created_at": datetime.utcnow()}
+    if attempts is not None:
+        bucket["attempts"] = attempts
+    return bucket
+
+
+def _flush(monkeypatch, bucket, outcome):
+    monkeypatch.setattr(DigestNotifier, "_send", lambda self, user, alerts: outcome)
+    DigestNotifier()._flush_bucket(bucket)
+
+
+@pytest.mark.parametrize("attempts", [None, 1, MAX_SEND_ATTEMPTS - 2])
+def test_retry_puts_the_bucket_back_after_the_backoff(monkeypatch, fake_db, attempts):
+    bucket = _bucket(attempts)
+    before = datetime.utcnow()
+    _flush(monkeypatch, bucket, RETRY)
+
+    (query, pipeline, upsert), = fake_db.notificationdigests.updates
+    assert query == {"_id": bucket["_id"]} and upsert
+    stage = pipeline[0]["$set"]
+    expected = (attempts or 0) + 1
+    assert stage["attempts"] == expected
+    retry_at = stage["due_at"]["$max"][1]
+    assert before + retry_delay(expected) <= retry_at <= datetime.utcnow() + retry_delay(expected)
+
+
+@pytest.mark.parametrize("outcome, attempts", [
+    (SENT, None),
+    (FAILED, None),
+    (RETRY, MAX_SEND_ATTEMPTS - 1),  # this was the last allowed attempt
+])
+def test_sent_failed_and_exhausted_buckets_are_not_requeued(monkeypatch, fake_db, outcome, attempts):
+    _flush(monkeypatch, _bucket(attempts), outcome)
+    assert fake_db.notificationdigests.updates == []
+
+
+def test_send_exception_counts_as_retry(monkeypatch, fake_db):
+    def boom(self, user, alerts):
+        raise RuntimeError("network down")
+    monkeypatch.setattr(DigestNotifier, "_send", boom)
+    DigestNotifier()._flush_bucket(_bucket())
+    assert fake_db.notificationdigests.updates[0][1][0]["$set"]["attempts"] == 1
@@ -0,0 +1,114 @@
+"""
+tests/test_nearby_cursor.py
+/workshops/nearby argument parsing and cursor tokens
+"""
+
+import base64
+import math
+import pytest
+from bson.objectid import ObjectId
+from werkzeug.datastructures import MultiDict
+
+from backend.utils import encode_cursor, decode_cursor
+from backend.routes.workshops import (
+    parse_nearby_args, nearby_page, CURSOR_NEAR, CURSOR_BY_ID,
+    NEARBY_MIN_RADIUS, NEARBY_MAX_RADIUS, NEARBY_MAX_LIMIT
+)
+
+RIYADH = {"lat": "24.7136", "lng": "46.6753"}
+
+
+def _args(**values):
+    return MultiDict({key: str(value) for key, value in values.items()})
+
+
+def test_cursor_round_trip():
+    last_id = ObjectId()
+    token = encode_cursor([CURSOR_NEAR, 1234.5, last_id])
+    assert "+" not in token and "/" not in token
+    assert decode_cursor(token) == [CURSOR_NEAR, 1234.5, last_id]
+
+
+@pytest.mark.parametrize("token", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"{not json").decode("ascii"),
+    "",
+])
+def test_decode_rejects_garbage(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(token)
+
+
+def test_defaults_and_clamping():
+    params = parse_nearby_args(_args(**RIYADH, radius=10, limit=500, service="all"))
+    assert params["radius"] == NEARBY_MIN_RADIUS
+    assert params["limit"] == NEARBY_MAX_LIMIT
+    assert params["service"] is None and params["cursor"] is None
+
+    params = parse_nearby_args(_args(radius=10 ** 9, limit=0))
+    assert params["lat"] is None and params["lng"] is None
+    assert params["radius"] == NEARBY_MAX_RADIUS and params["limit"] == 1
+
+
+@pytest.mark.parametrize("args, message", [
+    (_args(lat=24.7), "together"),
+    (_args(lat=91, lng=0), "out of range"),
+    (_args(**RIYADH, radius="nan"), "finite"),
+    (_args(**RIYADH, radius="inf"), "finite"),
+    (_args(**RIYADH, radius="-inf"), "finite"),
+])
+def test_rejects_bad_location_and_radius(args, message):
+    with pytest.raises(ValueError, match=message):
+        parse_nearby_args(args)
+
+
+def test_near_cursor_resumes_by_distance():
+    last_id = ObjectId()
+    params = parse_nearby_args(_args(**RIYADH, cursor=encode_cursor([CURSOR_NEAR, 812.25, last_id])))
+    assert params["cursor"] == [812.25, last_id]
+
+
+def test_id_cursor_resumes_without_location():
+    last_id = ObjectId()
+    params = parse_nearby_args(_args(cursor=encode_cursor([CURSOR_BY_ID, None, last_id])))
+    assert params["cursor"] == [None, last_id]
+
+
+@pytest.mark.parametrize("location, mode", [
+    (RIYADH, CURSOR_BY_ID),  # list without location replayed with lat/lng
+    ({}, CURSOR_NEAR),       # and the other way round
+])
+def test_cursor_mode_must_match_the_query(location, mode):
+    token = encode_cursor([mode, 10.0, ObjectId()])
+    with pytest.raises(ValueError, match="does not match"):
+        parse_nearby_args(_args(**location, cursor=token))
+
+
+@pytest.mark.parametrize("values", [
+    [CURSOR_NEAR, ObjectId()],               # old two-element format
+    {"mode": CURSOR_NEAR},
+    [CURSOR_NEAR, None, ObjectId()],
+    [CURSOR_NEAR, "12", ObjectId()],
+    [CURSOR_NEAR, math.inf, ObjectId()],
+])
+def test_malformed_near_cursor(values):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        parse_nearby_args(_args(**RIYADH, cursor=encode_cursor(values)))
+
+
+@pytest.mark.parametrize("location, mode", [(RIYADH, CURSOR_NEAR), ({}, CURSOR_BY_ID)])
+def test_next_cursor_feeds_the_next_request(location, mode):
+    params = parse_nearby_args(_args(**location, limit=2))
+    docs = [{"_id": ObjectId(), "name": "W%d" % i, "distance_m": 100.0 * i} for i in range(3)]
+    if mode == CURSOR_BY_ID:
+        for doc in docs:
+            del doc["distance_m"]
+
+    page = nearby_page(docs, params)
+    assert page["count"] == 2
+    assert decode_cursor(page["next_cursor"])[0] == mode
+
+    resumed = parse_nearby_args(_args(**location, limit=2, cursor=page["next_cursor"]))
+    assert resumed["cursor"][1] == docs[1]["_id"]
+
+    assert nearby_page(docs[:2], params)["next_cursor"] is None
@@ -0,0 +1,99 @@
+"""
+tests/test_prediction_core.py
+Vectorised prediction maths against the per-type loop it replaced
+
+`legacy_prediction` is the arithmetic of the old
+PredictionEngine._predict_single_type, one vehicle and one type at a time.
+"""
+
+import math
+import numpy as np
+import pytest
+
+from backend.services import prediction_core
+
+
+def legacy_prediction(last_km, interval_km, current_km, km_per_day):
+    if last_km is not None:
+        due_km = last_km + interval_km
+        confidence = 0.9
+    else:
+        if current_km > 0:
+            due_km = math.ceil(current_km / interval_km) * interval_km
+            if due_km <= current_km:
+                due_km += interval_km
+        else:
+            due_km = interval_km
+        confidence = 0.5
+    km_remaining = due_km - current_km
+    days = km_remaining / km_per_day if km_per_day > 0 else 365
+    return due_km, km_remaining, max(days, 0), confidence
+
+
+def legacy_km_per_day(current_km, initial_km, days_owned):
+    usage_km = current_km - initial_km
+    if days_owned > 7 and usage_km > 0:
+        return usage_km / days_owned
+    return 41.0
+
+
+INTERVALS = [5000, 10000, 15000, 40000]
+LAST_KM = [None, 0, 4000, 52000, 99000]
+CURRENT_KM = [0, 1, 4999, 5000, 12345, 100000, 120000]
+KM_PER_DAY = [0.0, 12.5, 41.0, 300.0]
+
+
+@pytest.mark.parametrize("km_per_day", KM_PER_DAY)
+@pytest.mark.parametrize("last_km", LAST_KM)
+def test_predict_matches_legacy(last_km, km_per_day):
+    # Every current mileage is one scenario, every interval one type
+    last = [np.nan if last_km is None else last_km] * len(INTERVALS)
+    prediction = prediction_core.predict(
+        last, INTERVALS, CURRENT_KM, [km_per_day] * len(CURRENT_KM)
+    )
+    confidence = prediction_core.confidence(last)
+
+    for s, current_km in enumerate(CURRENT_KM):
+        for t, interval_km in enumerate(INTERVALS):
+            due_km, km_remaining, days, expected_confidence = legacy_prediction(
+                last_km, interval_km, current_km, km_per_day
+            )
+            assert prediction["due_km"][s, t] == due_km
+            assert prediction["km_remaining"][s, t] == km_remaining
+            assert prediction["days"][s, t] == pytest.approx(days)
+            assert confidence[t] == expected_confidence
+
+
+@pytest.mark.parametrize("current_km, initial_km, days_owned", [
+    (20000, 10000, 100),
+    (20000, 10000, 7),     # too new to trust
+    (20000, 20000, 100),   # not driven
+    (15000, 20000, 100),   # odometer below the initial reading
+    (20000, 10000, 8),
+])
+def test_average_km_per_day_matches_legacy(current_km, initial_km, days_owned):
+    assert prediction_core.average_km_per_day(current_km, initial_km, days_owned) == \
+        legacy_km_per_day(current_km, initial_km, days_owned)
+
+
+def test_occurrences_follow_the_first_due_date():
+    intervals = [5000, 10000]
+    prediction = prediction_core.predict([4000, np.nan], intervals, [6000, 6000], [100.0, 0.0])
+    days, mask = prediction_core.occurrences(prediction, intervals, [100.0, 0.0], [365, 365], 4)
+
+    # Driving 100 km/day: due in 30 days, then every 50 / 100 days
+    assert days[0, 0].tolist() == [30, 80, 130, 180]
+    assert mask[0, 0].all()
+    assert days[0, 1].tolist() == [40, 140, 240, 340]
+    # Not driving: only the first one, after the idle default
+    assert days[1, 0, 0] == 365
+    assert mask[1, 0].tolist() == [True, False, False, False]
+
+
+def test_overdue_service_is_due_now():
+    prediction = prediction_core.predict([1000], [5000], [9000], [50.0])
+    assert prediction["km_remaining"][0, 0] == -3000
+    assert prediction["days"][0, 0] == 0
+    days, mask = prediction_core.occurrences(prediction, [5000], [50.0], [365], 3)
+    assert days[0, 0].tolist() == [0, 100, 200]
+    assert mask[0, 0].all()
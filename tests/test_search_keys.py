@@ -0,0 +1,50 @@
+"""
+tests/test_search_keys.py
+Normalised search keys for the admin user / vehicle search
+"""
+
+import pytest
+
+from backend.services.search import (
+    normalize_text, compact, user_search_keys, vehicle_search_keys, _rank,
+    EXACT, FIELD_PREFIX, WORD_PREFIX
+)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("José  Ñúñez", "jose nunez"),
+    ("  MÜLLER\tStraße ", "muller straße"),
+    ("Ａｈｍｅｄ", "ahmed"),  # full-width letters fold to ASCII
+    ("", ""),
+    (None, ""),
+    (1234, "1234"),
+])
+def test_normalize_text(value, expected):
+    assert normalize_text(value) == expected
+
+
+def test_compact_keeps_letters_and_digits():
+    assert compact("ab-12 c") == "ab12c"
+    assert compact("Ä 123 · ÇD") == "a123cd"
+    assert compact(None) == ""
+
+
+def test_user_keys():
+    keys = user_search_keys({"email": " Sara.Ali@Example.COM ", "full_name": "Sára  Al Ali"})
+    assert keys == sorted({"sara.ali@example.com", "sara al ali", "sara", "al", "ali"})
+    assert user_search_keys({"email": "x@y.z"}) == ["x@y.z"]
+
+
+def test_vehicle_keys():
+    assert vehicle_search_keys({"license_plate": "ABC-1234", "vin": "1hg cm8 2633a004352"}) == \
+        ["1hgcm82633a004352", "abc1234"]
+    assert vehicle_search_keys({"license_plate": "K 9", "vin": None}) == ["k9"]
+
+
+def test_rank_prefers_exact_then_field_then_word():
+    primary = {"sara.ali@example.com", "sara al ali"}
+    keys = primary | {"sara", "al", "ali"}
+    assert _rank("sara al ali", primary, keys) == (EXACT, len("sara al ali"))
+    assert _rank("sara", primary, keys)[0] == FIELD_PREFIX
+    assert _rank("ali", primary, keys)[0] == WORD_PREFIX
+    assert _rank("bob", primary, keys) is None
@@ -0,0 +1,53 @@
+"""
+tests/test_tile_cache.py
+Geohash tiles for /workshops/nearby
+"""
+
+import math
+import pytest
+
+from backend.services.tile_cache import TileCache, geohash_encode, geohash_center
+
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def test_geohash_known_value():
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    lat, lng = geohash_center("u4pruydqqvj")
+    assert lat == pytest.approx(57.64911, abs=1e-5)
+    assert lng == pytest.approx(10.40744, abs=1e-5)
+
+
+@pytest.mark.parametrize("radius, precision", [
+    (500, 6), (10000, 6),
+    (10001, 5), (50000, 5),
+    (50001, 4), (200000, 4),
+])
+def test_precision_follows_radius(radius, precision):
+    params = {"lat": 24.7136, "lng": 46.6753, "radius": radius, "limit": 20}
+    snapped = TileCache().snap(params)
+    assert len(snapped["tile"]) == precision
+    assert snapped["tile"] == geohash_encode(24.7136, 46.6753, precision)
+    assert (snapped["lat"], snapped["lng"]) == geohash_center(snapped["tile"])
+    assert snapped["radius"] == radius and snapped["limit"] == 20
+
+
+@pytest.mark.parametrize("radius", [2000, 10000, 50000, 200000])
+def test_snap_moves_the_centre_by_a_small_part_of_the_radius(radius):
+    for lat, lng in [(24.7136, 46.6753), (-33.86, 151.2), (64.1, -21.9), (0.0, 179.99)]:
+        snapped = TileCache().snap({"lat": lat, "lng": lng, "radius": radius})
+        # A precision-6 tile is ~1.2 x 0.6 km, precision 5 ~4.9 x 4.9 km
+        assert _distance_m(lat, lng, snapped["lat"], snapped["lng"]) < max(radius * 0.2, 3500)
+
+
+def test_nearby_points_share_a_tile():
+    cache = TileCache()
+    a = cache.snap({"lat": 24.71360, "lng": 46.67530, "radius": 5000})
+    b = cache.snap({"lat": 24.71365, "lng": 46.67535, "radius": 5000})
+    assert a["tile"] == b["tile"]
+    assert (a["lat"], a["lng"]) == (b["lat"], b["lng"])
@@ -0,0 +1,151 @@
+"""
+tests/test_timeline_cursor.py
+Timeline keyset paging across sources
+
+The sources run against small in-memory collections that understand the
+few operators the feed queries use, so paging can be walked end to end
+without a mongod.
+"""
+
+from datetime import datetime, timedelta
+from itertools import product
+import pytest
+from bson.objectid import ObjectId
+
+from backend.services import timeline
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$lt" and not (value is not None and value < operand):
+                return False
+            if op == "$lte" and not (value is not None and value <= operand):
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$type" and not isinstance(value, datetime):
+                return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query):
+        return FakeCursor([doc for doc in self.docs if _matches(doc, query)])
+
+
+class FakeDb:
+    def __init__(self, records, accidents, predictions):
+        self.servicerecords = FakeCollection(records)
+        self.accidenthistory = FakeCollection(accidents)
+        self.maintenancepredictions = FakeCollection(predictions)
+
+
+VEHICLE = ObjectId()
+BASE = datetime(2025, 3, 1)
+
+
+def _history():
+    """Several items per day and per source, so every tie-break is exercised."""
+    records, accidents, predictions = [], [], []
+    for day, n in product(range(3), range(2)):
+        date = BASE + timedelta(days=day)
+        records.append({"_id": ObjectId(), "vehicle_id": VEHICLE, "service_date": date,
+                        "service_type": "oil_change", "mileage_at_service": 1000})
+        records.append({"_id": ObjectId(), "vehicle_id": VEHICLE, "service_date": date,
+                        "service_type": timeline.ODOMETER_TYPE, "mileage_at_service": 1000})
+        accidents.append({"_id": ObjectId(), "vehicle_id": VEHICLE, "accident_date": date})
+        predictions.append({"_id": ObjectId(), "vehicle_id": VEHICLE, "resolved_at": date,
+                            "maintenance_type": "oil_change"})
+    # Open predictions are not part of the feed
+    predictions.append({"_id": ObjectId(), "vehicle_id": VEHICLE, "resolved_at": None,
+                        "maintenance_type": "brakes"})
+    return records, accidents, predictions
+
+
+@pytest.fixture
+def history(monkeypatch):
+    records, accidents, predictions = _history()
+    monkeypatch.setattr(timeline, "db", FakeDb(records, accidents, predictions))
+    return records, accidents, predictions
+
+
+def _expected(history, kinds):
+    records, accidents, predictions = history
+    rows = []
+    for doc in records:
+        kind = "odometer" if doc["service_type"] == timeline.ODOMETER_TYPE else "service"
+        if kind in kinds:
+            rows.append((doc["service_date"], 0, doc["_id"]))
+    if "accident" in kinds:
+        rows += [(doc["accident_date"], 1, doc["_id"]) for doc in accidents]
+    if "prediction" in kinds:
+        rows += [(doc["resolved_at"], 2, doc["_id"]) for doc in predictions if doc["resolved_at"]]
+    # date desc, then source rank asc, then _id desc
+    rows.sort(key=lambda row: (row[0], -row[1], row[2]), reverse=True)
+    return [str(row[2]) for row in rows]
+
+
+def _walk(kinds, limit):
+    seen, cursor = [], None
+    while True:
+        items, cursor = timeline.timeline_page(VEHICLE, kinds, limit, cursor)
+        seen += [item["id"] for item in items]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 50])
+@pytest.mark.parametrize("kinds", [
+    timeline.TIMELINE_KINDS,
+    ("service",),
+    ("odometer", "prediction"),
+    ("accident", "prediction"),
+])
+def test_pages_cover_the_feed_once_in_order(history, kinds, limit):
+    assert _walk(kinds, limit) == _expected(history, set(kinds))
+
+
+def test_after_keeps_strictly_later_items_per_source():
+    date, last_id = BASE, ObjectId()
+    accident = timeline._Source(1, None, "accident_date", None, {}, None)
+
+    assert accident.after(None) == {}
+    # Lower rank comes first on the same date: only older items remain
+    assert accident.after([date, 2, last_id]) == {"accident_date": {"$lt": date}}
+    # Higher rank comes after the cursor's source on the same date
+    assert accident.after([date, 0, last_id]) == {"accident_date": {"$lte": date}}
+    # Same source: resume below the last _id on the same date
+    assert accident.after([date, 1, last_id]) == {"$or": [
+        {"accident_date": {"$lt": date}},
+        {"accident_date": date, "_id": {"$lt": last_id}}
+    ]}
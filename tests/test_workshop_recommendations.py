@@ -0,0 +1,70 @@
+"""
+tests/test_workshop_recommendations.py
+Workshop recommendations against a real mongod ($geoNear)
+
+Uses MONGO_TEST_URI when set, otherwise a throwaway `mongod` from PATH;
+skipped when neither is available.
+"""
+
+import os
+import shutil
+import pytest
+from pymongo import MongoClient, GEOSPHERE
+
+from backend.routes.workshops import recommended_workshops
+
+
+@pytest.fixture(scope="module")
+def source():
+    uri = os.environ.get("MONGO_TEST_URI")
+    mongod = dbpath = None
+    if not uri:
+        if not shutil.which("mongod"):
+            pytest.skip("needs MONGO_TEST_URI or mongod on PATH")
+        from loadtest import start_mongod
+        mongod, dbpath, uri = start_mongod("mongod")
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    database = client.get_database("motarilog_test_recommendations")
+    client.drop_database(database.name)
+    database.workshops.create_index([("location", GEOSPHERE)])
+    yield database
+
+    client.drop_database(database.name)
+    client.close()
+    if mongod:
+        mongod.terminate()
+        mongod.wait()
+        shutil.rmtree(dbpath, ignore_errors=True)
+
+
+def workshop(name, lng, lat, services):
+    return {
+        "name": name,
+        "location": {"type": "Point", "coordinates": [lng, lat]},
+        "services_offered": services,
+        "is_active": True,
+    }
+
+
+def test_specific_service_is_found_behind_a_dense_cluster(source):
+    lng, lat = 46.6753, 24.7136
+    # 600 general repair shops within ~1 km, one tire shop ~15 km away
+    source.workshops.insert_many([
+        workshop(f"Garage {i}", lng + (i % 30) * 0.0003, lat + (i // 30) * 0.0003, ["general_repair"])
+        for i in range(600)
+    ])
+    source.workshops.insert_one(workshop("Tire Center", lng + 0.15, lat, ["tires"]))
+
+    params = {"lat": lat, "lng": lng, "radius": 25000, "limit": 3}
+    due_items = [
+        {"key": "rotation", "services": ["tires"]},
+        {"key": "oil", "services": ["oil_change", "general_repair"]},
+        {"key": "belt", "services": ["general_repair"]},
+    ]
+    results = recommended_workshops(source, params, due_items)
+
+    assert [doc["name"] for doc in results["rotation"]] == ["Tire Center"]
+    assert len(results["oil"]) == 3
+    assert results["oil"][0]["distance_m"] <= results["oil"][-1]["distance_m"]
+    assert all("general_repair" in doc["services_offered"] for doc in results["belt"])